@@ -12,5 +12,18 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'A.settings')
+# Sync DRF views would run one at a time on the thread shared by sync_to_async;
+# serve the device endpoints through the async views instead (home/async_views.py).
+# Must be set before the URLconf is imported.
+os.environ.setdefault('DEVICE_API_ASYNC', '1')
 
 application = get_asgi_application()
+
+# Same fast path as A/wsgi.py for the device endpoints (home/fastpath.py);
+# anything it does not handle reaches the async views through Django.
+from django.conf import settings  # noqa: E402
+
+if settings.DEVICE_API_FASTPATH:
+    from home.fastpath import AsyncDeviceAPIMiddleware  # noqa: E402
+
+    application = AsyncDeviceAPIMiddleware(application)
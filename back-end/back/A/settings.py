@@ -79,7 +79,8 @@ WSGI_APPLICATION = 'A.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLITE_PATH lets the benchmarks in back-end/bench run against a throwaway database
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
@@ -133,6 +134,44 @@ AUTH_USER_MODEL = 'accounts.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'home.authentication.CachedTokenAuthentication',
     ],
 }
+
+# The device endpoints are served by a bare WSGI handler in front of Django
+# (home/fastpath.py, wired in A/wsgi.py) with the same URLs and status codes.
+DEVICE_API_FASTPATH = os.environ.get('DEVICE_API_FASTPATH', '1') == '1'
+
+# Under ASGI (A/asgi.py turns this on) the device endpoints are served by native
+# async views (home/async_views.py) instead of the sync DRF views.
+DEVICE_API_ASYNC = os.environ.get('DEVICE_API_ASYNC', '0') == '1'
+
+# /home/st/ answers carry "Cache-Control: private, max-age=N" (and an ETag when the
+# device is active) so pollers and the nginx micro-cache can reuse them.
+DEVICE_STATUS_MAX_AGE = int(os.environ.get('DEVICE_STATUS_MAX_AGE', '1'))
+
+# Token -> (user, device) LRU cache per process (home/authentication.py). Entries
+# are dropped through signals and the change feed; the TTL is only a safety net.
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', '10000'))
+AUTH_TOKEN_CACHE_TTL = float(os.environ.get('AUTH_TOKEN_CACHE_TTL', '300'))
+
+# In-memory token buckets (home/ratelimit.py), shared by the DRF views and the
+# TCP server. Limits are per process; a rate of 0 turns a limit off. The
+# per-device limit is opt-in (e.g. 5/s with a burst of 20).
+RATE_LIMIT_DEVICE_PER_SECOND = float(os.environ.get('RATE_LIMIT_DEVICE_PER_SECOND', '0'))
+RATE_LIMIT_DEVICE_BURST = float(os.environ.get('RATE_LIMIT_DEVICE_BURST', '20'))
+RATE_LIMIT_PHONE_PER_SECOND = float(os.environ.get('RATE_LIMIT_PHONE_PER_SECOND', '0.2'))
+RATE_LIMIT_PHONE_BURST = float(os.environ.get('RATE_LIMIT_PHONE_BURST', '5'))
+RATE_LIMIT_IDLE_SECONDS = 600
+
+# In-memory device activity / protected phone indexes (home/indexes.py). HTTP
+# workers poll the change feed at most once per INDEX_POLL_SECONDS and reload
+# everything every INDEX_RELOAD_SECONDS as a safety net.
+INDEX_POLL_SECONDS = float(os.environ.get('INDEX_POLL_SECONDS', '1'))
+INDEX_RELOAD_SECONDS = float(os.environ.get('INDEX_RELOAD_SECONDS', '3600'))
+
+# Device reports are queued in memory and written with bulk_create
+# (home/reports.py). A full queue answers 503.
+REPORT_BUFFER_MAX = int(os.environ.get('REPORT_BUFFER_MAX', '10000'))
+REPORT_BATCH_SIZE = int(os.environ.get('REPORT_BATCH_SIZE', '500'))
+REPORT_FLUSH_SECONDS = float(os.environ.get('REPORT_FLUSH_SECONDS', '1'))
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'A.settings')
 
 application = get_wsgi_application()
+
+# Device API endpoints (/home/...) skip the middleware stack and DRF rendering;
+# see home/fastpath.py. DEVICE_API_FASTPATH=0 serves them through Django again.
+from django.conf import settings  # noqa: E402
+
+if settings.DEVICE_API_FASTPATH:
+    from home.fastpath import DeviceAPIMiddleware  # noqa: E402
+
+    application = DeviceAPIMiddleware(application)
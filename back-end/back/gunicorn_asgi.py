@@ -0,0 +1,10 @@
+import multiprocessing
+
+# ASGI profile: gunicorn -c gunicorn_asgi.py A.asgi:application
+# Each worker runs one asyncio event loop (uvicorn) serving the device endpoints
+# asynchronously (home/fastpath.py, home/async_views.py). An open connection
+# costs a socket and a few KB instead of a whole sync worker, so one process
+# per CPU is enough.
+bind = "0.0.0.0:8081"
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = multiprocessing.cpu_count()
@@ -3,7 +3,8 @@ from django.contrib import admin
 from django.http import HttpResponse
 import pandas as pd
 from home.models import Product, Device, RowData, TemproryData, Report, ProtectedPhoneNumber
-from home.forms import DeviceForm
+from home.forms import DeviceForm, PhoneNumberField
+from home.phone import normalize_phone
 import jdatetime
 from pytz import timezone
 import datetime
@@ -74,6 +75,29 @@ def export_to_excel(modeladmin, request, queryset):
 
 export_to_excel.short_description = "خروجی اکسل از موارد انتخاب شده"
 
+class PhoneNumberAdminMixin:
+    """
+    فیلد phone_number در فرم و جستجو با همان کلید یکتای home/phone.py:
+    «+989121234567» و «09121234567» هر دو همان ردیف 9121234567 را پیدا/ذخیره می‌کنند.
+    """
+
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        if db_field.name == 'phone_number':
+            return PhoneNumberField(
+                label=db_field.verbose_name,
+                required=not db_field.blank,
+                help_text='مثلاً 09121234567 یا +989121234567',
+            )
+        return super().formfield_for_dbfield(db_field, request, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        try:
+            phone_number = normalize_phone(search_term)
+        except ValueError:
+            return super().get_search_results(request, queryset, search_term)
+        # جستجوی دقیق عددی به جای icontains روی متن عدد
+        return queryset.filter(phone_number=phone_number), False
+
 # کلاس‌های Admin با قابلیت export و فیلتر و تاریخ شمسی
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('product_id', 'product_name')
@@ -88,8 +112,8 @@ class DeviceAdmin(admin.ModelAdmin):
     search_fields = ('device_id', 'device_name', 'device_phone_number')
     actions = [export_to_excel]
 
-class RowDataAdmin(admin.ModelAdmin):
-    list_display = ('full_phone_number', 'device_display_name', 'product_id', 'jalali_datetime_created')
+class RowDataAdmin(PhoneNumberAdminMixin, admin.ModelAdmin):
+    list_display = ('full_phone_number', 'device_display_name', 'product_id', 'jalali_datetime_created', 'jalali_sold_at')
     list_filter = ('device_id', 'product_id', 'datetime_created')
     search_fields = ('phone_number', 'device_id__device_name', 'product_id__product_name')
     date_hierarchy = 'datetime_created'
@@ -109,7 +133,12 @@ class RowDataAdmin(admin.ModelAdmin):
         return convert_to_jalali(obj.datetime_created)
     jalali_datetime_created.short_description = 'تاریخ و زمان ایجاد (شمسی)'
 
-class TemproryDataAdmin(admin.ModelAdmin):
+    def jalali_sold_at(self, obj):
+        # فقط فروش‌های آفلاین (sync/) زمان دستگاه را دارند
+        return convert_to_jalali(obj.sold_at)
+    jalali_sold_at.short_description = 'زمان فروش روی دستگاه (شمسی)'
+
+class TemproryDataAdmin(PhoneNumberAdminMixin, admin.ModelAdmin):
     list_display = ('full_phone_number', 'gift_number')
     list_filter = ('gift_number',)
     search_fields = ('phone_number', 'gift_number')
@@ -142,7 +171,7 @@ class ReportAdmin(admin.ModelAdmin):
 
 
 @admin.register(ProtectedPhoneNumber)
-class ProtectedPhoneNumberAdmin(admin.ModelAdmin):
+class ProtectedPhoneNumberAdmin(PhoneNumberAdminMixin, admin.ModelAdmin):
     list_display = ('full_phone_number', 'jalali_datetime_created')
     list_filter = ('datetime_created',)
     search_fields = ('phone_number',)
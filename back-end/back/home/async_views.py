@@ -0,0 +1,142 @@
+import json
+
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from home import services
+from home.authentication import CachedTokenAuthentication
+from home.ratelimit import DeviceRateThrottle, PhoneRateThrottle, throttle_wait
+
+# نسخه‌ی async همان view های home/views.py برای اجرا زیر ASGI (A/asgi.py، gunicorn_asgi.py)؛
+# home/urls.py با DEVICE_API_ASYNC یکی از این دو را سوار می‌کند. همان نام کلاس‌ها، همان URL ها و
+# همان کدهای وضعیت (home/services.py، نسخه‌های a...).
+# DRF نسخه‌ی async برای APIView ندارد (view همگام DRF زیر ASGI با sync_to_async روی یک thread
+# اجرا می‌شود)، پس اینجا View خود جنگو است و احراز هویت و throttle و پاسخ خطا با همان کلاس‌ها و
+# پیام‌های DRF دستی انجام می‌شوند.
+
+
+# JSONRenderer در DRF هم بدون فاصله می‌نویسد
+_COMPACT = {'separators': (',', ':'), 'ensure_ascii': False}
+
+
+def _empty(code):
+    # مثل Response بی‌بدنه‌ی DRF: بدون بدنه و بدون Content-Type
+    response = HttpResponse(status=code)
+    del response['Content-Type']
+    return response
+
+
+def _error(exc):
+    # مثل rest_framework.views.exception_handler: {"detail": ...} و هدرهای WWW-Authenticate / Retry-After
+    response = JsonResponse({'detail': exc.detail}, status=exc.status_code, json_dumps_params=_COMPACT)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response['WWW-Authenticate'] = CachedTokenAuthentication.keyword
+    if getattr(exc, 'wait', None):
+        response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
+class DeviceAPIView(View):
+    """
+    پایه‌ی view های async دستگاه: توکن (CachedTokenAuthentication.aauthenticate)، بعد
+    throttle_classes، بعد متد view. معادل IsAuthenticated: بدون توکن 401.
+    """
+    throttle_classes = [DeviceRateThrottle]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # مثل APIView: احراز هویت با توکن است نه session، پس CSRF لازم نیست
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            resolved = await CachedTokenAuthentication().aauthenticate(request)
+            if resolved is None:
+                raise exceptions.NotAuthenticated()
+            request.user, request.auth = resolved
+            wait = throttle_wait(self.throttle_classes, request.GET, request.device, request.auth, self)
+            if wait is not None:
+                raise exceptions.Throttled(wait or None)
+        except exceptions.APIException as exc:
+            return _error(exc)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class DeviceStatusView(DeviceAPIView):
+    async def get(self, request):
+        code = await services.adevice_status(request.GET.get('d'), request.headers.get('If-None-Match'))
+        response = _empty(code)
+        for name, value in services.device_status_headers(code):
+            response[name] = value
+        return response
+
+
+class ReportMetadataView(DeviceAPIView):
+    async def get(self, request):
+        params = request.GET
+        return _empty(await services.aqueue_report(params.get('d'), params.get('re')))
+
+
+def _request_data(request):
+    """
+    مثل request.data با parser های پیش‌فرض DRF: JSON خراب ParseError، انواع دیگر غیر از فرم
+    UnsupportedMediaType؛ فرم و بدنه‌ی خالی {} (فیلدهای لیستی نیستند، پس 400). None اگر JSON شیء نبود.
+    """
+    data = {}
+    if request.body:
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body)
+            except ValueError as exc:
+                raise exceptions.ParseError('JSON parse error - %s' % exc)
+        elif request.content_type not in ('', 'application/x-www-form-urlencoded', 'multipart/form-data'):
+            raise exceptions.UnsupportedMediaType(request.content_type)
+    if not isinstance(data, dict):
+        return None
+    return data
+
+
+def _device_id(request, data):
+    device_id = data.get('d', request.GET.get('d'))
+    if device_id is None and request.device is not None:
+        device_id = request.device.device_id
+    return device_id
+
+
+class BulkReportView(DeviceAPIView):
+    async def post(self, request):
+        try:
+            data = _request_data(request)
+        except exceptions.APIException as exc:
+            return _error(exc)
+        if data is None:
+            return _empty(status.HTTP_400_BAD_REQUEST)
+        return _empty(await services.aqueue_reports(_device_id(request, data), data.get('re')))
+
+
+class SyncSalesView(DeviceAPIView):
+    async def post(self, request):
+        try:
+            data = _request_data(request)
+        except exceptions.APIException as exc:
+            return _error(exc)
+        if data is None:
+            return _empty(status.HTTP_400_BAD_REQUEST)
+        code, results = await services.aapply_offline_sales(_device_id(request, data), data.get('sales'))
+        if results is None:
+            return _empty(code)
+        return JsonResponse({'r': results}, status=code, json_dumps_params=_COMPACT)
+
+
+class GetMetadataView(DeviceAPIView):
+    async def get(self, request):
+        return _empty(await services.aquota_status(request.GET.get('ph')))
+
+
+class PostMetadataView(DeviceAPIView):
+    throttle_classes = [DeviceRateThrottle, PhoneRateThrottle]
+
+    async def get(self, request):
+        params = request.GET
+        return _empty(await services.aclaim(params.get('ph'), params.get('d'), params.get('p')))
@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from home.indexes import INDEXES, acurrent_indexes, current_indexes
+from home.models import ChangeFeed, Device
+
+
+class TokenCache:
+    """
+    کش LRU درون‌پروسه: کلید توکن -> (user, device, token, زمان انقضا).
+    - هر پروسه (worker gunicorn) کش خودش را دارد؛ حداکثر max_size کلید، قدیمی‌ترین دسترسی اول بیرون
+    - باطل شدن: در همین پروسه فوراً با سیگنال‌ها (home/signals.py)، در بقیه‌ی پروسه‌ها با feed
+      تغییرات (ردیف‌های USER و DEVICE) که INDEXES هر poll_interval ثانیه می‌خواند
+    - ttl فقط تور ایمنی است (مثلاً queryset.update() روی User که سیگنال نمی‌فرستد)
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[3] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, user, device, token):
+        with self._lock:
+            self._entries[key] = (user, device, token, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        # فقط روی تغییرات ادمین اجرا می‌شود؛ پیمایش کل کش اشکالی ندارد
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if predicate(entry)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def apply_changes(self, changes):
+        """listener برای INDEXES؛ None یعنی بارگذاری کامل (ممکن است تغییری دیده نشده باشد)."""
+        if changes is None:
+            self.clear()
+            return
+        users = {obj_id for _, model, obj_id, _ in changes if model == ChangeFeed.USER}
+        devices = {obj_id for _, model, obj_id, _ in changes if model == ChangeFeed.DEVICE}
+        if users or devices:
+            # توکنی که تازه به دستگاهی وصل شده هنوز device=None دارد؛ آن‌ها هم دوباره خوانده می‌شوند
+            self.invalidate_where(
+                lambda entry: entry[0].pk in users
+                or (devices and (entry[1] is None or entry[1].device_id in devices))
+            )
+
+
+TOKEN_CACHE = TokenCache(
+    getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10_000),
+    getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300),
+)
+INDEXES.listeners.append(TOKEN_CACHE.apply_changes)
+
+
+def resolve_token(key):
+    """
+    کلید توکن ⇒ (user, device, token) از TOKEN_CACHE، و در صورت miss با یک کوئری
+    Token + User + Device (select_related)؛ None اگر چنین توکنی نیست. is_active بررسی نمی‌شود.
+    """
+    # اول feed: توکن حذف‌شده در پروسه‌ی دیگر حداکثر تا poll_interval ثانیه معتبر می‌ماند
+    current_indexes()
+    entry = TOKEN_CACHE.get(key)
+    if entry is not None:
+        return entry[:3]
+    try:
+        token = Token.objects.select_related('user', 'device').get(key=key)
+    except Token.DoesNotExist:
+        return None
+    return _remember(key, token)
+
+
+async def aresolve_token(key):
+    """نسخه‌ی async resolve_token (home/async_views.py)؛ در صورت miss کوئری با ORM async."""
+    await acurrent_indexes()
+    entry = TOKEN_CACHE.get(key)
+    if entry is not None:
+        return entry[:3]
+    try:
+        token = await Token.objects.select_related('user', 'device').aget(key=key)
+    except Token.DoesNotExist:
+        return None
+    return _remember(key, token)
+
+
+def _remember(key, token):
+    # device از select_related آمده؛ نبودنش هم کش شده و کوئری دیگری نمی‌زند
+    try:
+        device = token.device
+    except Device.DoesNotExist:
+        device = None
+    TOKEN_CACHE.put(key, token.user, device, token)
+    return token.user, device, token
+
+
+class _TokenHeader(TokenAuthentication):
+    # فقط تجزیه‌ی هدر Authorization با همان خطاهای DRF؛ authenticate ⇒ کلید خام (یا None)
+    def authenticate_credentials(self, key):
+        return key
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    همان TokenAuthentication (هدر "Authorization: Token <key>")، با resolve_token به جای کوئری
+    Token + User در هر درخواست.
+    request.device دستگاه صاحب توکن است (یا None)؛ فقط برای شناسه، وضعیت فعال بودن از INDEXES.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            request.device = self._device
+        return result
+
+    async def aauthenticate(self, request):
+        """برای view های async (HttpRequest خود جنگو): (user, token) یا None؛ request.device هم تنظیم می‌شود."""
+        key = _TokenHeader().authenticate(request)
+        if key is None:
+            return None
+        user, device, token = self._check(await aresolve_token(key))
+        request.device = device
+        return (user, token)
+
+    def authenticate_credentials(self, key):
+        user, self._device, token = self._check(resolve_token(key))
+        return (user, token)
+
+    def _check(self, resolved):
+        if resolved is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user, device, token = resolved
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return resolved
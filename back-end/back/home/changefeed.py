@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from home.models import ChangeFeed
+
+
+FEED_RETENTION = timedelta(days=7)  # ردیف‌های قدیمی‌تر هنگام ثبت تغییر بعدی پاک می‌شوند
+
+
+def record_change(model, object_id, deleted=False):
+    ChangeFeed.objects.create(model=model, object_id=object_id, deleted=deleted)
+    ChangeFeed.objects.filter(datetime_created__lt=timezone.now() - FEED_RETENTION).delete()
+
+
+def record_changes(model, object_ids):
+    """چند تغییر از یک مدل با یک INSERT (مثلاً همه‌ی شماره‌های یک دسته‌ی sync/)."""
+    ChangeFeed.objects.bulk_create([ChangeFeed(model=model, object_id=object_id) for object_id in object_ids])
+    ChangeFeed.objects.filter(datetime_created__lt=timezone.now() - FEED_RETENTION).delete()
+
+
+def latest_change_id():
+    """آخرین id ثبت‌شده؛ شروع خواندن feed از اینجا (قبل از بارگذاری کامل کش)."""
+    return ChangeFeed.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def changes_since(last_id, limit=1000):
+    """
+    تغییرات بعد از last_id به ترتیب: [(id, model, object_id, deleted), ...]
+    فقط روی کلید اصلی فیلتر می‌شود؛ هزینه‌ی poll کردن تقریباً صفر است.
+    """
+    return list(
+        ChangeFeed.objects.filter(id__gt=last_id)
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'deleted')[:limit]
+    )
@@ -0,0 +1,300 @@
+import json
+import logging
+from http import HTTPStatus
+from urllib.parse import parse_qsl
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signals
+from django.db import close_old_connections
+from django.urls import reverse
+from rest_framework import HTTP_HEADER_ENCODING, exceptions
+from home import services, views
+from home.authentication import aresolve_token, resolve_token
+from home.ratelimit import throttle_wait
+
+logger = logging.getLogger('django.request')
+
+_STATUS_LINES = {s.value: f'{s.value} {s.phrase}' for s in HTTPStatus}
+_DISCONNECTED = object()  # ASGI: کلاینت قبل از رسیدن کامل بدنه رفت؛ پاسخی فرستاده نمی‌شود
+
+
+# ---- endpoint ها: (query params، بدنه‌ی JSON، دستگاه صاحب توکن، If-None-Match) ⇒ کد وضعیت یا (کد، هدرها) ----
+def _status(params, data, device, if_none_match):
+    code = services.device_status(params.get('d'), if_none_match=if_none_match)
+    return code, services.device_status_headers(code)
+
+
+def _report(params, data, device, if_none_match):
+    return services.queue_report(params.get('d'), params.get('re'))
+
+
+def _bulk_report(params, data, device, if_none_match):
+    device_id = data.get('d', params.get('d'))
+    if device_id is None and device is not None:
+        device_id = device.device_id
+    return services.queue_reports(device_id, data.get('re'))
+
+
+def _get(params, data, device, if_none_match):
+    return services.quota_status(params.get('ph'))
+
+
+def _post(params, data, device, if_none_match):
+    return services.claim(params.get('ph'), params.get('d'), params.get('p'))
+
+
+async def _astatus(params, data, device, if_none_match):
+    code = await services.adevice_status(params.get('d'), if_none_match)
+    return code, services.device_status_headers(code)
+
+
+async def _areport(params, data, device, if_none_match):
+    return await services.aqueue_report(params.get('d'), params.get('re'))
+
+
+async def _abulk_report(params, data, device, if_none_match):
+    device_id = data.get('d', params.get('d'))
+    if device_id is None and device is not None:
+        device_id = device.device_id
+    return await services.aqueue_reports(device_id, data.get('re'))
+
+
+async def _aget(params, data, device, if_none_match):
+    return await services.aquota_status(params.get('ph'))
+
+
+async def _apost(params, data, device, if_none_match):
+    return await services.aclaim(params.get('ph'), params.get('d'), params.get('p'))
+
+
+# نام url (home/urls.py) ⇒ (متد، view اصلی برای throttle_classes، تابع، بدنه‌ی JSON دارد)
+_ENDPOINTS = {
+    'home:device_status': ('GET', views.DeviceStatusView, _status, False),
+    'home:report': ('GET', views.ReportMetadataView, _report, False),
+    'home:report_bulk': ('POST', views.BulkReportView, _bulk_report, True),
+    'home:get': ('GET', views.GetMetadataView, _get, False),
+    'home:post': ('GET', views.PostMetadataView, _post, False),
+}
+
+# نسخه‌ی ASGI: نام url ⇒ تابع async
+_ASYNC_HANDLERS = {
+    'home:device_status': _astatus,
+    'home:report': _areport,
+    'home:report_bulk': _abulk_report,
+    'home:get': _aget,
+    'home:post': _apost,
+}
+
+
+def _parse_params(query_string):
+    # QueryDict.get هم آخرین مقدار یک پارامتر تکراری را برمی‌گرداند؛ None یعنی 400
+    try:
+        return dict(parse_qsl(
+            query_string, keep_blank_values=True,
+            max_num_fields=settings.DATA_UPLOAD_MAX_NUMBER_FIELDS,
+        ))
+    except ValueError:
+        return None
+
+
+def _throttled(view, params, device, token):
+    wait = throttle_wait(view.throttle_classes, params, device, token, view)
+    if wait is None:
+        return None
+    # تنها پاسخ بدنه‌دار: همان {"detail": ...} و Retry-After که DRF (و _error در async_views.py) می‌دهد
+    exc = exceptions.Throttled(wait or None)
+    headers = [('Content-Type', 'application/json')]
+    if exc.wait:
+        headers.append(('Retry-After', '%d' % exc.wait))
+    body = json.dumps({'detail': exc.detail}, separators=(',', ':'), ensure_ascii=False)
+    return 429, headers, body.encode()
+
+
+def _result(result):
+    return result if isinstance(result, tuple) else (result, [])
+
+
+def _parse_body(raw):
+    # فقط شیء JSON؛ None یعنی 400
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return data
+
+
+class DeviceAPIMiddleware:
+    """
+    مسیر سریع WSGI برای endpoint های دستگاه (/home/...)، جلوی برنامه‌ی Django (A/wsgi.py).
+    همان URL ها، همان احراز هویت توکن (resolve_token)، همان throttle ها و همان کدهای وضعیت
+    (home/services.py)، ولی بدون middleware ها (session، CSRF، messages، clickjacking)، بدون
+    resolve کردن URL و بدون content negotiation و رندر DRF؛ بدنه‌ی پاسخ خالی است، جز 429 که همان
+    JSON خود DRF را دارد. هر چیز غیرعادی (متد دیگر، هدر Authorization نامعتبر، توکن ناموجود یا کاربر غیرفعال، بدنه‌ی
+    غیر JSON) بدون تغییر به Django داده می‌شود تا پاسخ خطا دقیقاً همان قبلی باشد.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = {reverse(name): endpoint for name, endpoint in _ENDPOINTS.items()}
+
+    def __call__(self, environ, start_response):
+        endpoint = self.routes.get(environ.get('PATH_INFO'))
+        if endpoint is None or endpoint[0] != environ['REQUEST_METHOD']:
+            return self.app(environ, start_response)
+        auth = environ.get('HTTP_AUTHORIZATION', '').encode(HTTP_HEADER_ENCODING).split()
+        if len(auth) != 2 or auth[0].lower() != b'token':
+            return self.app(environ, start_response)
+        if endpoint[3] and not environ.get('CONTENT_TYPE', '').startswith('application/json'):
+            return self.app(environ, start_response)
+
+        # مثل WSGIHandler خود Django: کانکشن‌های DB کهنه قبل و بعد از درخواست بسته می‌شوند
+        signals.request_started.send(sender=self.__class__, environ=environ)
+        try:
+            response = self._handle(endpoint, environ, auth[1])
+        except Exception:
+            logger.exception('Internal Server Error: %s', environ.get('PATH_INFO'))
+            response = (500, [])
+        finally:
+            signals.request_finished.send(sender=self.__class__)
+        if response is None:
+            return self.app(environ, start_response)
+
+        code, headers, *body = response
+        body = b''.join(body)
+        start_response(_STATUS_LINES[code], [('Content-Length', str(len(body))), *headers])
+        return [body] if body else []
+
+    def _handle(self, endpoint, environ, key):
+        """(کد وضعیت، هدرهای اضافه[، بدنه])؛ None یعنی این درخواست را Django جواب بدهد."""
+        _, view, handler, has_body = endpoint
+        try:
+            resolved = resolve_token(key.decode())
+        except UnicodeError:
+            return None
+        if resolved is None:
+            return None
+        user, device, token = resolved
+        if not user.is_active:
+            return None
+
+        params = _parse_params(environ.get('QUERY_STRING', '').encode('iso-8859-1').decode(errors='replace'))
+        if params is None:
+            return 400, []
+        throttled = _throttled(view, params, device, token)
+        if throttled is not None:
+            return throttled
+
+        data = {}
+        if has_body:
+            try:
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = 0
+            if length > settings.DATA_UPLOAD_MAX_MEMORY_SIZE:
+                return 400, []
+            data = _parse_body(environ['wsgi.input'].read(length))
+            if data is None:
+                return 400, []
+        return _result(handler(params, data, device, environ.get('HTTP_IF_NONE_MATCH')))
+
+
+class AsyncDeviceAPIMiddleware:
+    """
+    همان مسیر سریع برای ASGI (A/asgi.py) با توابع async (home/services.py، نسخه‌های a...).
+    ASGIHandler جنگو برای هر درخواست یک thread همگام تازه می‌سازد (ThreadSensitiveContext)، پس
+    کوئری‌های ORM async هر بار اتصال DB تازه باز می‌کنند، و هر middleware همگام یک پرش thread
+    دیگر است؛ اینجا هیچ‌کدام نیست و کوئری‌ها روی thread همگام مشترک پروسه (asgiref) اجرا می‌شوند.
+    سیگنال‌های request_started / request_finished فرستاده نمی‌شوند (هر کدام یک پرش thread است):
+    اتصال DB آن thread مثل thread های DB سرور TCP ماندگار است و فقط بعد از خطا بررسی می‌شود.
+    موارد غیرعادی مثل DeviceAPIMiddleware به Django می‌روند (view های home/async_views.py)؛ این
+    تصمیم همیشه قبل از خواندن بدنه گرفته می‌شود.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = {
+            reverse(name): (method, view, _ASYNC_HANDLERS[name], has_body)
+            for name, (method, view, _, has_body) in _ENDPOINTS.items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        endpoint = self.routes.get(scope['path']) if scope['type'] == 'http' else None
+        if endpoint is None or endpoint[0] != scope['method']:
+            return await self.app(scope, receive, send)
+        headers = dict(scope['headers'])
+        auth = headers.get(b'authorization', b'').split()
+        if len(auth) != 2 or auth[0].lower() != b'token':
+            return await self.app(scope, receive, send)
+        if endpoint[3] and not headers.get(b'content-type', b'').startswith(b'application/json'):
+            return await self.app(scope, receive, send)
+
+        try:
+            response = await self._handle(endpoint, scope, receive, headers, auth[1])
+        except Exception:
+            logger.exception('Internal Server Error: %s', scope['path'])
+            # مثل request_finished: اتصال خراب یا تراکنش نیمه‌کاره روی thread مشترک نماند
+            await sync_to_async(close_old_connections)()
+            response = (500, [])
+        if response is None:
+            return await self.app(scope, receive, send)
+        if response is _DISCONNECTED:
+            return
+
+        code, extra, *body = response
+        body = b''.join(body)
+        await send({
+            'type': 'http.response.start',
+            'status': code,
+            'headers': [(b'content-length', str(len(body)).encode()),
+                        *((k.encode(), v.encode()) for k, v in extra)],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _handle(self, endpoint, scope, receive, headers, key):
+        """(کد وضعیت، هدرهای اضافه[، بدنه])؛ None یعنی Django جواب بدهد، _DISCONNECTED یعنی کلاینت رفت."""
+        _, view, handler, has_body = endpoint
+        try:
+            resolved = await aresolve_token(key.decode())
+        except UnicodeError:
+            return None
+        if resolved is None:
+            return None
+        user, device, token = resolved
+        if not user.is_active:
+            return None
+
+        params = _parse_params(scope['query_string'].decode(errors='replace'))
+        if params is None:
+            return 400, []
+        throttled = _throttled(view, params, device, token)
+        if throttled is not None:
+            return throttled
+
+        data = {}
+        if has_body:
+            try:
+                length = int(headers.get(b'content-length') or 0)
+            except ValueError:
+                length = 0
+            if length > settings.DATA_UPLOAD_MAX_MEMORY_SIZE:
+                return 400, []
+            chunks, size, more = [], 0, True
+            while more:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return _DISCONNECTED
+                chunks.append(message.get('body', b''))
+                size += len(chunks[-1])
+                if size > settings.DATA_UPLOAD_MAX_MEMORY_SIZE:
+                    return 400, []
+                more = message.get('more_body', False)
+            data = _parse_body(b''.join(chunks))
+            if data is None:
+                return 400, []
+        if_none_match = headers.get(b'if-none-match')
+        if if_none_match is not None:
+            if_none_match = if_none_match.decode('latin-1')
+        return _result(await handler(params, data, device, if_none_match))
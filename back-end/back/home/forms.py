@@ -2,6 +2,26 @@ from django import forms
 # from django.contrib import admin
 from rest_framework.authtoken.models import Token
 from .models import Device
+from .phone import format_phone, normalize_phone
+
+
+class PhoneNumberField(forms.CharField):
+    """ورودی ادمین به هر قالبی (+98، 0098، 0، ارقام فارسی) ⇒ کلید int (home/phone.py)."""
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value in self.empty_values:
+            return None
+        try:
+            return normalize_phone(value)
+        except ValueError:
+            raise forms.ValidationError('شماره تلفن همراه نامعتبر است', code='invalid')
+
+    def prepare_value(self, value):
+        if isinstance(value, int):
+            return format_phone(value)
+        return value
+
 
 class DeviceForm(forms.ModelForm):
     # این فیلد فقط برای انتخاب توکن است
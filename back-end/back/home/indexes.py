@@ -0,0 +1,133 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from home.changefeed import changes_since, latest_change_id
+from home.models import ChangeFeed, Device, Product, ProtectedPhoneNumber
+
+
+class RequestIndexes:
+    """
+    وضعیت فعال بودن دستگاه‌ها، شناسه‌ی محصولات و شماره‌های محافظت‌شده، درون حافظه؛ هر بررسی یک
+    lookup در dict/set.
+    - device_activity: device_id -> device_activity (دستگاه ناموجود در dict نیست)
+    - products: set از product_id ها
+    - protected: set از شماره‌ها به صورت int (09121234567 و 9121234567 یکی‌اند)
+    تغییرات ادمین از feed (home/changefeed.py) خوانده می‌شود و فقط کلیدهای تغییرکرده دوباره
+    از DB خوانده می‌شوند. سرور TCP خودش apply_changes را از poller صدا می‌زند؛ view ها با
+    refresh_if_stale حداکثر هر poll_interval ثانیه یک بار feed را می‌خوانند.
+    listeners: کش‌های دیگری که از همین feed باطل می‌شوند (مثل home/authentication.py)؛ هر کدام
+    با همان changes صدا زده می‌شود، و با None بعد از بارگذاری کامل.
+    """
+
+    def __init__(self, poll_interval: float = 1.0, reload_interval: float = 3600):
+        self.poll_interval = poll_interval
+        self.reload_interval = reload_interval
+        self.device_activity = {}
+        self.products = frozenset()
+        self.protected = frozenset()
+        self.loaded = False
+        self.listeners = []
+        self._last_change_id = 0
+        self._last_poll = 0.0
+        self._last_reload = 0.0
+        self._lock = threading.Lock()
+
+    # ------------------ بررسی‌ها (مسیر داغ، بدون DB) ------------------
+    def device_state(self, device_id: int):
+        """True فعال، False غیرفعال، None ناموجود."""
+        return self.device_activity.get(device_id)
+
+    def is_inactive(self, device_id: int) -> bool:
+        return self.device_activity.get(device_id) is False
+
+    def has_product(self, product_id: int) -> bool:
+        return product_id in self.products
+
+    def is_protected(self, phone_number: int) -> bool:
+        return phone_number in self.protected
+
+    # ------------------ به‌روزرسانی ------------------
+    def load(self):
+        """بارگذاری کامل. id آخرین تغییر قبل از خواندن جدول‌ها گرفته می‌شود تا تغییری گم نشود."""
+        last_id = latest_change_id()
+        activity = dict(Device.objects.values_list('device_id', 'device_activity'))
+        products = frozenset(Product.objects.values_list('product_id', flat=True))
+        protected = frozenset(ProtectedPhoneNumber.objects.values_list('phone_number', flat=True))
+        # جایگزینی یکجا؛ خواننده‌ها هیچ‌وقت نیمه‌ی یک بارگذاری را نمی‌بینند
+        self.device_activity = activity
+        self.products = products
+        self.protected = protected
+        self._last_change_id = max(self._last_change_id, last_id)
+        self._last_reload = self._last_poll = time.monotonic()
+        self.loaded = True
+        for listener in self.listeners:
+            listener(None)
+
+    def apply_changes(self, changes):
+        """changes: خروجی changes_since؛ ردیف‌های مدل‌های دیگر نادیده گرفته می‌شوند."""
+        devices = {obj_id for _, model, obj_id, _ in changes if model == ChangeFeed.DEVICE}
+        products = {obj_id for _, model, obj_id, _ in changes if model == ChangeFeed.PRODUCT}
+        phones = {obj_id for _, model, obj_id, _ in changes if model == ChangeFeed.PROTECTED}
+        if devices:
+            fresh = dict(
+                Device.objects.filter(device_id__in=devices).values_list('device_id', 'device_activity')
+            )
+            for device_id in devices:
+                if device_id in fresh:
+                    self.device_activity[device_id] = fresh[device_id]
+                else:
+                    self.device_activity.pop(device_id, None)
+        if products:
+            present = set(Product.objects.filter(product_id__in=products).values_list('product_id', flat=True))
+            self.products = (self.products - products) | present
+        if phones:
+            present = set(
+                ProtectedPhoneNumber.objects.filter(phone_number__in=phones).values_list('phone_number', flat=True)
+            )
+            # copy-on-write: set قبلی تا پایان جایگزینی دست نمی‌خورد
+            self.protected = (self.protected - phones) | present
+        for listener in self.listeners:
+            listener(changes)
+        if changes:
+            self._last_change_id = max(self._last_change_id, changes[-1][0])
+
+    def is_stale(self) -> bool:
+        return not self.loaded or time.monotonic() - self._last_poll >= self.poll_interval
+
+    def refresh_if_stale(self):
+        now = time.monotonic()
+        if self.loaded and now - self._last_poll < self.poll_interval:
+            return
+        with self._lock:
+            if not self.loaded or now - self._last_reload >= self.reload_interval:
+                self.load()
+            elif now - self._last_poll >= self.poll_interval:
+                changes = changes_since(self._last_change_id)
+                while changes:
+                    self.apply_changes(changes)
+                    changes = changes_since(self._last_change_id)
+                self._last_poll = now
+
+
+INDEXES = RequestIndexes(
+    getattr(settings, 'INDEX_POLL_SECONDS', 1.0),
+    getattr(settings, 'INDEX_RELOAD_SECONDS', 3600),
+)
+
+
+def current_indexes() -> RequestIndexes:
+    """برای view ها: اگر از آخرین poll بیشتر از poll_interval گذشته، اول feed خوانده می‌شود."""
+    INDEXES.refresh_if_stale()
+    return INDEXES
+
+
+async def acurrent_indexes() -> RequestIndexes:
+    """
+    نسخه‌ی async (home/async_views.py): فقط وقتی feed باید خوانده شود سراغ thread همگام DB می‌رود.
+    بعد از آن تا poll_interval ثانیه current_indexes هم کوئری نمی‌زند.
+    """
+    if INDEXES.is_stale():
+        await sync_to_async(INDEXES.refresh_if_stale)()
+    return INDEXES
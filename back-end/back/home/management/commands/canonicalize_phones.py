@@ -0,0 +1,79 @@
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from home.models import ProtectedPhoneNumber, RowData, TemproryData
+from home.phone import normalize_phone_series
+from home.quota import MAX_GIFT
+
+
+def _non_canonical(model):
+    """DataFrame (pk، phone_number، key) برای ردیف‌هایی که کلیدشان با مقدار ذخیره‌شده فرق دارد."""
+    df = pd.DataFrame(list(model.objects.values_list('pk', 'phone_number')), columns=['pk', 'phone_number'])
+    if df.empty:
+        return df.assign(key=pd.Series(dtype='Int64')), 0
+    df['key'] = normalize_phone_series(df['phone_number'])
+    invalid = int(df['key'].isna().sum())
+    return df[df['key'].notna() & (df['key'] != df['phone_number'])], invalid
+
+
+class Command(BaseCommand):
+    help = (
+        'تبدیل شماره‌های ذخیره‌شده با قالب‌های دیگر (مثلاً 989121234567) به کلید یکتای home/phone.py '
+        'و ادغام ردیف‌های تکراری TemproryData. سرور TCP هنگام اجرا باید خاموش باشد '
+        '(دفتر سهمیه‌ی درون‌حافظه‌اش کلیدهای قدیمی را نگه می‌دارد).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='فقط گزارش، بدون تغییر')
+
+    def handle(self, *args, dry_run=False, **options):
+        with transaction.atomic():
+            self._rowdata()
+            self._protected()
+            self._temprory()
+            if dry_run:
+                transaction.set_rollback(True)
+                self.stdout.write('dry run: rolled back')
+
+    def _report(self, model, changed, invalid):
+        self.stdout.write(f'{model.__name__}: {changed} canonicalized, {invalid} invalid left untouched')
+
+    def _rowdata(self):
+        df, invalid = _non_canonical(RowData)
+        rows = [RowData(pk=pk, phone_number=int(key)) for pk, key in zip(df['pk'], df['key'])]
+        RowData.objects.bulk_update(rows, ['phone_number'], batch_size=1000)
+        self._report(RowData, len(rows), invalid)
+
+    def _protected(self):
+        # save / delete تک‌تک تا سیگنال‌ها feed را برای INDEXES پر کنند (تعداد این ردیف‌ها کم است)
+        df, invalid = _non_canonical(ProtectedPhoneNumber)
+        existing = set(ProtectedPhoneNumber.objects.values_list('phone_number', flat=True))
+        for pk, key in zip(df['pk'], df['key']):
+            obj = ProtectedPhoneNumber.objects.get(pk=pk)
+            if int(key) in existing:
+                obj.delete()
+            else:
+                obj.phone_number = int(key)
+                obj.save()
+                existing.add(int(key))
+        self._report(ProtectedPhoneNumber, len(df), invalid)
+
+    def _temprory(self):
+        df, invalid = _non_canonical(TemproryData)
+        merged = 0
+        for key in df['key'].unique():
+            key = int(key)
+            rows = list(
+                TemproryData.objects.filter(pk__in=df.loc[df['key'] == key, 'pk'].tolist())
+                | TemproryData.objects.filter(phone_number=key)
+            )
+            # هر ردیف سهمیه‌ی کامل خودش را داشته؛ مصرف‌ها جمع می‌شوند
+            used = sum(MAX_GIFT - min(row.gift_number, MAX_GIFT) for row in rows)
+            keep = next((row for row in rows if row.phone_number == key), rows[0])
+            TemproryData.objects.filter(pk__in=[row.pk for row in rows if row.pk != keep.pk]).delete()
+            keep.phone_number = key
+            keep.gift_number = max(MAX_GIFT - used, 0)
+            keep.save()
+            merged += len(rows) - 1
+        self._report(TemproryData, len(df), invalid)
+        self.stdout.write(f'TemproryData: {merged} duplicate rows merged')
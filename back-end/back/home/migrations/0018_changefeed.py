@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0017_rename_deviceـactivity_device_device_activity_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('device', 'دستگاه'), ('product', 'محصول')], max_length=20, verbose_name='مدل')),
+                ('object_id', models.PositiveIntegerField(verbose_name='شناسه')),
+                ('deleted', models.BooleanField(default=False, verbose_name='حذف شده')),
+                ('datetime_created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'تغییرات',
+                'verbose_name_plural': 'تغییرات',
+            },
+        ),
+    ]
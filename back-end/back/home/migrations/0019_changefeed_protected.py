@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0018_changefeed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changefeed',
+            name='model',
+            field=models.CharField(choices=[('device', 'دستگاه'), ('product', 'محصول'), ('protected', 'شماره محافظت\u200cشده')], max_length=20, verbose_name='مدل'),
+        ),
+        migrations.AlterField(
+            model_name='changefeed',
+            name='object_id',
+            field=models.PositiveBigIntegerField(verbose_name='شناسه'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0020_changefeed_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rowdata',
+            name='sold_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='زمان فروش (دستگاه)'),
+        ),
+    ]
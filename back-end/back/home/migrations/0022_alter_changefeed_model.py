@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0021_rowdata_sold_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changefeed',
+            name='model',
+            field=models.CharField(choices=[('device', 'دستگاه'), ('product', 'محصول'), ('protected', 'شماره محافظت\u200cشده'), ('user', 'کاربر'), ('quota', 'سهمیه')], max_length=20, verbose_name='مدل'),
+        ),
+    ]
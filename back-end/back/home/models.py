@@ -57,9 +57,10 @@ class Device(models.Model):
     
 
 class RowData(models.Model):
-    phone_number = models.PositiveBigIntegerField(verbose_name='شماره تلفن') # example 09904574830 ----> 904574830
+    phone_number = models.PositiveBigIntegerField(verbose_name='شماره تلفن') # example 09904574830 ----> 9904574830 (home/phone.py)
     device_id = models.ForeignKey(Device, on_delete=models.SET_NULL, null=True, to_field='device_id', db_column='device_id', verbose_name='نام دستگاه')
     product_id = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, to_field='product_id', db_column='product_id', verbose_name='نام محصول')
+    sold_at = models.DateTimeField(null=True, blank=True, verbose_name='زمان فروش (دستگاه)') # فقط فروش‌های آفلاین (sync/)؛ datetime_created زمان رسیدن به سرور است
     datetime_updated = models.DateTimeField(auto_now=True)
     datetime_created = models.DateTimeField(auto_now_add=True)
 
@@ -117,3 +118,31 @@ class ProtectedPhoneNumber(models.Model):
     def __str__(self):
         return '0' + str(self.phone_number)
 
+
+
+class ChangeFeed(models.Model):
+    # هر ذخیره/حذف Device، Product و ProtectedPhoneNumber یک ردیف اینجا می‌سازد (home/signals.py)؛
+    # تغییر User یا Token هم یک ردیف USER با pk کاربر (برای کش توکن، home/authentication.py)؛
+    # مصرف سهمیه از مسیر HTTP یک ردیف QUOTA با شماره (برای دفتر سهمیه‌ی سرور TCP، quota_ledger.py)؛
+    # پروسه‌های دیگر (سرور TCP، workerهای gunicorn) با خواندن id های جدیدتر کش خودشان را فوراً به‌روز می‌کنند
+    DEVICE = 'device'
+    PRODUCT = 'product'
+    PROTECTED = 'protected'
+    USER = 'user'
+    QUOTA = 'quota'
+    MODEL_CHOICES = [
+        (DEVICE, 'دستگاه'), (PRODUCT, 'محصول'), (PROTECTED, 'شماره محافظت‌شده'), (USER, 'کاربر'),
+        (QUOTA, 'سهمیه'),
+    ]
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES, verbose_name='مدل')
+    object_id = models.PositiveBigIntegerField(verbose_name='شناسه')  # device_id، product_id، phone_number یا pk کاربر
+    deleted = models.BooleanField(default=False, verbose_name='حذف شده')
+    datetime_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "تغییرات"
+        verbose_name_plural = "تغییرات"
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
@@ -0,0 +1,80 @@
+# کلید یکتای شماره تلفن همراه: عدد 10 رقمی بدون صفر اول (09121234567 ⇒ 9121234567).
+# همه‌ی مسیرها (view ها، سرور TCP، ادمین، ورود دسته‌ای) از همین‌جا رد می‌شوند تا یک نفر با
+# قالب‌های مختلف (+98، 0098، 98، 0) دو ردیف TemproryData جدا نگیرد.
+import re
+
+# ارقام فارسی/عربی ⇒ ASCII؛ جداکننده‌های رایج حذف می‌شوند
+_CLEAN = str.maketrans(
+    {**{c: str(i) for i, c in enumerate('۰۱۲۳۴۵۶۷۸۹')},
+     **{c: str(i) for i, c in enumerate('٠١٢٣٤٥٦٧٨٩')},
+     ' ': None, '-': None, '(': None, ')': None}
+)
+_MIN = 9_000_000_000
+_MAX = 9_999_999_999
+_PREFIX_98 = 98 * 10 ** 10
+
+
+def normalize_phone(value) -> int:
+    """
+    str / bytes / int ⇒ کلید int؛ قالب یا نوع نامعتبر ⇒ ValueError (قبل از هر دسترسی به DB).
+    قبول می‌شود: 9121234567، 09121234567، 989121234567، +989121234567، 00989121234567
+    """
+    # مسیر داغ: 09xxxxxxxxx یا 9xxxxxxxxx فقط با ارقام ASCII (isdigit روی bytes فقط ASCII است)
+    cls = value.__class__
+    if cls is bytes:
+        if value.isdigit():
+            n = len(value)
+            if (n == 11 and value[0] == 48 and value[1] == 57) or (n == 10 and value[0] == 57):
+                return int(value)
+    elif cls is str and value.isdigit() and value.isascii():
+        n = len(value)
+        if (n == 11 and value[0] == '0' and value[1] == '9') or (n == 10 and value[0] == '9'):
+            return int(value)
+    if isinstance(value, int):
+        if _MIN <= value <= _MAX:
+            return value
+        if _PREFIX_98 + _MIN <= value <= _PREFIX_98 + _MAX:
+            return value - _PREFIX_98
+        raise ValueError(f'invalid phone number: {value!r}')
+    if not isinstance(value, (str, bytes, bytearray)):
+        # float (9121234567.0)، لیست، dict و ... از بدنه‌ی JSON: قالب نامعتبر، نه AttributeError
+        raise ValueError(f'invalid phone number: {value!r}')
+    s = value.decode('ascii') if isinstance(value, (bytes, bytearray)) else value
+    s = s.strip()
+    if not s.isdigit() or not s.isascii():
+        s = s.translate(_CLEAN)
+    if s.startswith('+98'):
+        s = s[3:]
+    elif s.startswith('0098'):
+        s = s[4:]
+    elif len(s) == 12 and s.startswith('98'):
+        s = s[2:]
+    elif len(s) == 11 and s.startswith('0'):
+        s = s[1:]
+    if len(s) != 10 or s[0] != '9' or not s.isdigit() or not s.isascii():
+        raise ValueError(f'invalid phone number: {value!r}')
+    return int(s)
+
+
+def format_phone(key: int) -> str:
+    """کلید ⇒ شکل نمایشی با صفر اول."""
+    return '0' + str(key)
+
+
+_PREFIX_RE = re.compile(r'^(?:\+98|0098|98(?=\d{10}$)|0(?=\d{10}$))')
+
+
+def normalize_phone_series(series):
+    """
+    نسخه‌ی برداری normalize_phone برای ورود دسته‌ای (اکسل/CSV): pandas.Series ⇒ Series با
+    dtype Int64؛ مقدارهای نامعتبر <NA> می‌شوند (به جای ValueError).
+    """
+    import pandas as pd  # فقط ادمین و دستورهای مدیریتی؛ سرور TCP لازمش ندارد
+
+    if pd.api.types.is_float_dtype(series):
+        # ستون عددی اکسل: 9121234567.0
+        series = series.where(series == series.round()).astype('Int64')
+    s = series.astype('string').str.strip().str.translate(_CLEAN)
+    s = s.str.replace(_PREFIX_RE, '', regex=True)
+    valid = s.str.fullmatch(r'9[0-9]{9}').fillna(False).astype(bool)
+    return pd.to_numeric(s.where(valid), errors='coerce').astype('Int64')
@@ -0,0 +1,59 @@
+from django.db import connection
+from django.utils import timezone
+from home.models import TemproryData
+
+
+MAX_GIFT = 2  # حداکثر تعداد هدیه برای هر شماره
+
+
+def claim_gift(phone_number, max_gift=MAX_GIFT):
+    """
+    مصرف اتمی یک هدیه با یک دستور SQL (بدون get و save جدا):
+    - شماره‌ی جدید ⇒ ردیف با gift_number = max_gift - 1 ساخته می‌شود
+    - سهمیه > 0 ⇒ یک واحد کم می‌شود (رسیدن به 0 مجاز است)
+    - سهمیه == 0 ⇒ چیزی تغییر نمی‌کند
+    برمی‌گرداند: تعداد باقی‌مانده بعد از مصرف، یا None اگر سهمیه‌ای نبود.
+    (INSERT ... ON CONFLICT ... RETURNING: SQLite >= 3.35 و PostgreSQL)
+    """
+    qn = connection.ops.quote_name
+    table = qn(TemproryData._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} "
+        f"({qn('phone_number')}, {qn('gift_number')}, {qn('datetime_created')}, {qn('datetime_updated')}) "
+        f"VALUES (%s, %s, %s, %s) "
+        f"ON CONFLICT ({qn('phone_number')}) DO UPDATE SET "
+        f"{qn('gift_number')} = {table}.{qn('gift_number')} - 1, "
+        f"{qn('datetime_updated')} = EXCLUDED.{qn('datetime_updated')} "
+        f"WHERE {table}.{qn('gift_number')} > 0 "
+        f"RETURNING {qn('gift_number')}"
+    )
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [int(phone_number), max_gift - 1, now, now])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def consume_gifts(counts, max_gift=MAX_GIFT):
+    """
+    counts: phone -> تعداد مصرف؛ همان INSERT ... ON CONFLICT بالا برای چند شماره و n مصرف هر کدام
+    (flush دفتر سهمیه‌ی سرور TCP، quota_ledger.py). شماره‌ی جدید با max_gift - n ساخته می‌شود،
+    ردیف موجود n واحد کم می‌شود و زیر صفر نمی‌رود؛ ردیفی که هم‌زمان از مسیر دیگری ساخته شده
+    هم کم می‌شود، نه اینکه نادیده گرفته شود. باید داخل تراکنش فراخوان اجرا شود.
+    """
+    qn = connection.ops.quote_name
+    table = qn(TemproryData._meta.db_table)
+    gift = f"{table}.{qn('gift_number')}"
+    sql = (
+        f"INSERT INTO {table} "
+        f"({qn('phone_number')}, {qn('gift_number')}, {qn('datetime_created')}, {qn('datetime_updated')}) "
+        f"VALUES (%s, %s, %s, %s) "
+        f"ON CONFLICT ({qn('phone_number')}) DO UPDATE SET "
+        f"{qn('gift_number')} = CASE WHEN {gift} > %s THEN {gift} - %s ELSE 0 END, "
+        f"{qn('datetime_updated')} = EXCLUDED.{qn('datetime_updated')}"
+    )
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (int(phone), max(max_gift - n, 0), now, now, n, n) for phone, n in counts.items()
+        ])
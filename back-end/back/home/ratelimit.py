@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+from home.phone import normalize_phone
+
+
+class TokenBucketLimiter:
+    """
+    سطل توکن درون‌حافظه برای هر کلید (شناسه دستگاه یا شماره تلفن)؛ هر بررسی O(1).
+    - هر کلید حداکثر burst توکن دارد و هر ثانیه rate توکن پر می‌شود
+    - سطل‌های بیکار از سر OrderedDict (قدیمی‌ترین دسترسی) کم‌کم بیرون می‌روند؛ سطلی که
+      idle_seconds دست نخورده حتماً پر است، پس حذفش رفتار را عوض نمی‌کند
+    - محدودیت فقط داخل همین پروسه است (هر worker شمارش خودش را دارد)
+    - rate = 0 یعنی خاموش: همه‌چیز مجاز است و سطلی ساخته نمی‌شود
+    """
+
+    EVICT_PER_CALL = 2
+
+    def __init__(self, rate: float, burst: float, idle_seconds: float = 600, max_keys: int = 200_000):
+        self.rate = rate
+        self.burst = burst
+        self.idle_seconds = max(idle_seconds, burst / rate if rate > 0 else idle_seconds)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last]
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, key, cost: float = 1.0) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            self._evict(now)
+            if bucket[0] < cost:
+                self.rejected += 1
+                return False
+            bucket[0] -= cost
+            self.allowed += 1
+            return True
+
+    def retry_after(self, key, cost: float = 1.0) -> float:
+        """چند ثانیه تا داشتن cost توکن (برای هدر Retry-After)."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+        if bucket is None or self.rate <= 0:
+            return 0.0
+        return max(0.0, (cost - bucket[0]) / self.rate)
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        for _ in range(self.EVICT_PER_CALL):
+            if not buckets:
+                return
+            key, (_, last) = next(iter(buckets.items()))
+            if now - last < self.idle_seconds and len(buckets) <= self.max_keys:
+                return
+            del buckets[key]
+
+
+def _limiter(name: str, rate: float, burst: float) -> TokenBucketLimiter:
+    return TokenBucketLimiter(
+        getattr(settings, f'RATE_LIMIT_{name}_PER_SECOND', rate),
+        getattr(settings, f'RATE_LIMIT_{name}_BURST', burst),
+        getattr(settings, 'RATE_LIMIT_IDLE_SECONDS', 600),
+    )
+
+
+# یک دستگاه خراب نباید در ثانیه صدها درخواست بفرستد؛ پیش‌فرض خاموش (RATE_LIMIT_DEVICE_PER_SECOND)
+DEVICE_LIMITER = _limiter('DEVICE', 0, 20)
+# یک شماره تلفن روی دستگاه‌های مختلف؛ فقط درخواست‌های مصرف سهمیه
+PHONE_LIMITER = _limiter('PHONE', 0.2, 5)
+
+
+# ------------------ DRF ------------------
+class _TokenBucketThrottle(BaseThrottle):
+    limiter = None
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.key = self.get_key(request, view)
+        if self.key is None:
+            return True
+        return self.limiter.allow(self.key)
+
+    def wait(self):
+        return self.limiter.retry_after(self.key)
+
+
+class DeviceRateThrottle(_TokenBucketThrottle):
+    """کلید: پارامتر d، و اگر نبود دستگاه صاحب توکن (request.device) یا خود توکن."""
+    limiter = DEVICE_LIMITER
+
+    def get_key(self, request, view):
+        device_id = request.query_params.get('d')
+        if device_id is not None:
+            try:
+                return int(device_id)
+            except ValueError:
+                return None  # خود view جواب 400 می‌دهد
+        device = getattr(request, 'device', None)
+        if device is not None:
+            return device.device_id
+        return getattr(request.auth, 'key', None)
+
+
+class PhoneRateThrottle(_TokenBucketThrottle):
+    """کلید: پارامتر ph، فقط برای مصرف سهمیه (وقتی d یا p داده شده)."""
+    limiter = PHONE_LIMITER
+
+    def get_key(self, request, view):
+        params = request.query_params
+        phone_number = params.get('ph')
+        if not phone_number or (params.get('d') is None and params.get('p') is None):
+            return None
+        try:
+            # همان کلید int سرور TCP (09121234567 و +989121234567 یک سطل‌اند)
+            return normalize_phone(phone_number)
+        except ValueError:
+            return None  # خود view جواب 400 می‌دهد
+
+
+# ------------------ بدون DRF (home/fastpath.py، home/async_views.py) ------------------
+class ThrottleRequest:
+    """حداقل چیزی که throttle های بالا از request می‌خوانند."""
+    __slots__ = ('query_params', 'device', 'auth')
+
+    def __init__(self, query_params, device, auth):
+        self.query_params = query_params
+        self.device = device
+        self.auth = auth
+
+
+def throttle_wait(throttle_classes, query_params, device=None, auth=None, view=None):
+    """
+    مثل APIView.check_throttles: همه‌ی throttle ها بررسی می‌شوند (هر کدام سطل خودش را مصرف می‌کند).
+    None یعنی مجاز؛ وگرنه بیشترین زمان انتظار به ثانیه (0 اگر نامعلوم).
+    """
+    request = ThrottleRequest(query_params, device, auth)
+    waits = []
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, view):
+            waits.append(throttle.wait())
+    if not waits:
+        return None
+    return max((w for w in waits if w is not None), default=0)
@@ -0,0 +1,136 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from home.models import Device, Report
+
+logger = logging.getLogger(__name__)
+
+
+class ReportBuffer:
+    """
+    صف محدود گزارش‌های دستگاه‌ها در حافظه؛ نوشتن با bulk_create در دسته‌های max_batch تایی.
+    - add / add_many فقط append زیر قفل است؛ اگر صف پر باشد False (فراخوان 503 می‌دهد)
+    - flush در یک تراکنش: نگاشت device_id ⇒ pk با یک کوئری برای کل دسته (FK گزارش به pk است)
+    - view ها با start یک thread پس‌زمینه دارند؛ سرور TCP خودش flush را روی DB.write صدا می‌زند
+    گزارش‌های صف در صورت کرش پروسه از دست می‌روند (گزارش خطا، نه داده‌ی سهمیه).
+    """
+
+    def __init__(self, max_pending: int = 10_000, max_batch: int = 500, flush_interval: float = 1.0):
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = deque()  # (device_id, text)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.accepted = 0
+        self.rejected = 0  # صف پر
+        self.written = 0
+        self.orphaned = 0  # دستگاه تا زمان flush حذف شده بود
+        self.batches = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def add(self, device_id: int, text: str) -> bool:
+        return self.add_many(device_id, (text,))
+
+    def add_many(self, device_id: int, texts) -> bool:
+        """همه یا هیچ: اگر جا برای همه نباشد هیچ‌کدام اضافه نمی‌شوند."""
+        with self._lock:
+            if len(self._queue) + len(texts) > self.max_pending:
+                self.rejected += len(texts)
+                return False
+            self._queue.extend((device_id, text) for text in texts)
+            self.accepted += len(texts)
+            full = len(self._queue) >= self.max_batch
+        if full:
+            self._wakeup.set()
+        return True
+
+    def _take(self) -> list:
+        with self._lock:
+            n = min(len(self._queue), self.max_batch)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def flush(self) -> int:
+        """یک دسته را می‌نویسد (روی thread دارای اتصال DB). برمی‌گرداند: تعداد ردیف‌های نوشته‌شده."""
+        batch = self._take()
+        if not batch:
+            return 0
+        try:
+            pks = dict(
+                Device.objects.filter(device_id__in={d for d, _ in batch}).values_list('device_id', 'pk')
+            )
+            rows = [Report(device_id_id=pks[d], report=text) for d, text in batch if d in pks]
+            with transaction.atomic():
+                Report.objects.bulk_create(rows)
+        except Exception:
+            # دسته به سر صف برمی‌گردد تا flush بعدی دوباره امتحان کند
+            with self._lock:
+                self._queue.extendleft(reversed(batch))
+            raise
+        self.orphaned += len(batch) - len(rows)
+        self.written += len(rows)
+        self.batches += 1
+        return len(rows)
+
+    def flush_all(self) -> int:
+        written = 0
+        while self._queue:
+            written += self.flush()
+        return written
+
+    # ------------------ thread پس‌زمینه (پروسه‌های HTTP) ------------------
+    def start(self):
+        # بعد از fork (worker های gunicorn) thread والد وجود ندارد
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            first = self._thread is None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='report-buffer', daemon=True)
+            self._thread.start()
+        if first:
+            atexit.register(self._flush_at_exit)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush_all()
+        except Exception:
+            logger.exception('report flush at exit failed')
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush_all()
+            except Exception:
+                logger.exception('report flush failed')
+                time.sleep(self.flush_interval)
+            finally:
+                close_old_connections()
+
+
+REPORTS = ReportBuffer(
+    getattr(settings, 'REPORT_BUFFER_MAX', 10_000),
+    getattr(settings, 'REPORT_BATCH_SIZE', 500),
+    getattr(settings, 'REPORT_FLUSH_SECONDS', 1.0),
+)
+
+
+def report_buffer() -> ReportBuffer:
+    """برای view ها: thread نویسنده در همین پروسه راه می‌افتد."""
+    REPORTS.start()
+    return REPORTS
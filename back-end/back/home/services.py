@@ -0,0 +1,362 @@
+import time
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from home.models import ChangeFeed, Product, RowData, TemproryData
+from home.changefeed import record_change, record_changes
+from home.indexes import acurrent_indexes, current_indexes
+from home.phone import normalize_phone
+from home.quota import claim_gift
+from home.reports import report_buffer
+from home.serializers import RowDataSerializer
+
+
+# منطق endpoint های دستگاه (home/urls.py)؛ هر تابع فقط کد وضعیت HTTP برمی‌گرداند (بدنه همیشه خالی است).
+# هم view های DRF (home/views.py) و هم مسیر سریع WSGI (home/fastpath.py) از همین‌ها استفاده می‌کنند.
+# ورودی‌ها همان رشته‌های خام query string هستند (None یعنی پارامتر نیامده).
+# نسخه‌های a... (پایین فایل) همین منطق برای view های async هستند (home/async_views.py)؛ ایندکس‌ها
+# (indexes) را یک بار با acurrent_indexes گرفته و پاس می‌دهند تا هیچ کوئری همگامی در event loop نباشد.
+
+MAX_BULK_REPORTS = 500
+MAX_SYNC_SALES = 500
+SALE_CLOCK_SKEW = 300  # ثانیه؛ زمان فروشی که بیشتر از این جلوتر از ساعت سرور باشد رد می‌شود
+
+# st/: پاسخ دستگاه فعال همیشه همان 202 بی‌بدنه است، پس یک ETag ثابت کافی است
+DEVICE_ACTIVE_ETAG = '"active"'
+_STATUS_CACHE_CONTROL = f"private, max-age={settings.DEVICE_STATUS_MAX_AGE}"
+
+
+def device_status(device_id, indexes=None, if_none_match=None) -> int:
+    """
+    st/: وضعیت دستگاه از ایندکس درون‌حافظه (home/indexes.py)، بدون کوئری.
+    دستگاه فعال با If-None-Match برابر DEVICE_ACTIVE_ETAG ⇒ 304؛ 403 و 404 شرطی نمی‌شوند
+    (RFC 9110: فقط پاسخ 2xx).
+    """
+    if device_id is None:
+        return status.HTTP_400_BAD_REQUEST
+    try:
+        device_id = int(device_id)
+    except ValueError:
+        return status.HTTP_400_BAD_REQUEST
+
+    activity = (indexes or current_indexes()).device_state(device_id)
+    if activity is None:
+        return status.HTTP_404_NOT_FOUND
+    if activity:
+        if if_none_match and _etag_matches(if_none_match):
+            return status.HTTP_304_NOT_MODIFIED
+        return status.HTTP_202_ACCEPTED
+    return status.HTTP_403_FORBIDDEN
+
+
+def _etag_matches(if_none_match) -> bool:
+    # مقایسه‌ی ضعیف (W/ نادیده گرفته می‌شود)؛ "*" یعنی هر نسخه‌ای
+    etags = parse_etags(if_none_match)
+    return '*' in etags or any(etag.removeprefix('W/') == DEVICE_ACTIVE_ETAG for etag in etags)
+
+
+def device_status_headers(code) -> list:
+    """
+    هدرهای پاسخ st/: وضعیت دستگاه (202 / 304 / 403 / 404) تا DEVICE_STATUS_MAX_AGE ثانیه قابل
+    نگه داشتن است (private: فقط خود دستگاه، یا micro-cache nginx که کلیدش توکن است)؛ 202 و 304 با ETag.
+    """
+    if code in (status.HTTP_202_ACCEPTED, status.HTTP_304_NOT_MODIFIED):
+        return [('ETag', DEVICE_ACTIVE_ETAG), ('Cache-Control', _STATUS_CACHE_CONTROL)]
+    if code in (status.HTTP_403_FORBIDDEN, status.HTTP_404_NOT_FOUND):
+        return [('Cache-Control', _STATUS_CACHE_CONTROL)]
+    return []
+
+
+def _check_device(indexes, device_id) -> int | None:
+    # دستگاه ناموجود 400، غیرفعال 403؛ None یعنی مشکلی نیست
+    activity = indexes.device_state(device_id)
+    if activity is None:
+        return status.HTTP_400_BAD_REQUEST
+    if not activity:
+        return status.HTTP_403_FORBIDDEN
+    return None
+
+
+def queue_report(device_id, report_text, indexes=None) -> int:
+    """
+    re/: ثبت گزارش در صف حافظه و bulk_create دسته‌ای (home/reports.py)؛ مثل re/bulk/ و دستور 3
+    سرور TCP، 202 یعنی پذیرفته شد و هنوز نوشته نشده (نه 201).
+    """
+    if device_id is None or report_text is None:
+        return status.HTTP_400_BAD_REQUEST
+    try:
+        device_id = int(device_id)
+    except ValueError:
+        return status.HTTP_400_BAD_REQUEST
+    refused = _check_device(indexes or current_indexes(), device_id)
+    if refused is not None:
+        return refused
+
+    if not report_buffer().add(device_id, report_text):
+        return status.HTTP_503_SERVICE_UNAVAILABLE
+    return status.HTTP_202_ACCEPTED
+
+
+def queue_reports(device_id, reports, indexes=None) -> int:
+    """re/bulk/: همه یا هیچ؛ 202 اگر همه در صف رفتند، 503 اگر صف جا نداشت."""
+    if device_id is None or not isinstance(reports, list) or not reports:
+        return status.HTTP_400_BAD_REQUEST
+    if len(reports) > MAX_BULK_REPORTS or not all(isinstance(r, str) and r for r in reports):
+        return status.HTTP_400_BAD_REQUEST
+    device_id = _parse_device_id(device_id)
+    if device_id is None:
+        return status.HTTP_400_BAD_REQUEST
+    refused = _check_device(indexes or current_indexes(), device_id)
+    if refused is not None:
+        return refused
+
+    if not report_buffer().add_many(device_id, reports):
+        return status.HTTP_503_SERVICE_UNAVAILABLE
+    return status.HTTP_202_ACCEPTED
+
+
+def _claim_gift(phone_number):
+    # مصرف اتمی (home/quota.py) و یک ردیف QUOTA در feed: دفتر سهمیه‌ی سرور TCP همین شماره را در
+    # poll بعدی feed از DB می‌خواند، نه در sync دوره‌ای، تا یک شماره از دو مسیر بیشتر از سقف نگیرد
+    remaining = claim_gift(phone_number)
+    if remaining is not None:
+        record_change(ChangeFeed.QUOTA, phone_number)
+    return remaining
+
+
+def _parse_device_id(device_id):
+    # query string (str) یا عدد صحیح JSON؛ true و 1.9 دستگاه 1 نیستند. None یعنی 400
+    if isinstance(device_id, str) or type(device_id) is int:
+        try:
+            return int(device_id)
+        except ValueError:
+            return None
+    return None
+
+
+def _parse_phone(indexes, phone_number):
+    """(کلید int، None)، یا (None، کد خطا): ناموجود یا نامعتبر 400، محافظت‌شده 423."""
+    if not phone_number:
+        return None, status.HTTP_400_BAD_REQUEST
+    # کلید یکتای int (home/phone.py)؛ قالب نامعتبر قبل از هر کوئری رد می‌شود
+    try:
+        phone_number = normalize_phone(phone_number)
+    except ValueError:
+        return None, status.HTTP_400_BAD_REQUEST
+
+    # شماره‌ی محافظت‌شده در هیچ مسیری سهمیه نمی‌گیرد؛ جواب جدا: 423
+    if indexes.is_protected(phone_number):
+        return None, status.HTTP_423_LOCKED
+    return phone_number, None
+
+
+def _claim_args(indexes, phone_number, device_id, product_id):
+    """
+    بررسی‌های post/ که کوئری ندارند ⇒ ((phone, device_id, product_id)، None)، یا (None، کد خطا).
+    وجود محصول جدا بررسی می‌شود (کوئری).
+    """
+    phone_number, refused = _parse_phone(indexes, phone_number)
+    if refused is not None:
+        return None, refused
+
+    if device_id is not None:
+        try:
+            device_id = int(device_id)
+        except ValueError:
+            return None, status.HTTP_400_BAD_REQUEST
+        refused = _check_device(indexes, device_id)
+        if refused is not None:
+            return None, refused
+
+    if product_id is not None:
+        try:
+            product_id = int(product_id)
+        except ValueError:
+            return None, status.HTTP_400_BAD_REQUEST
+    return (phone_number, device_id, product_id), None
+
+
+def _quota_status(phone_number: int) -> int:
+    try:
+        record = TemproryData.objects.get(phone_number=phone_number)
+    except TemproryData.DoesNotExist:
+        return status.HTTP_200_OK
+    if record.gift_number == 0:
+        return status.HTTP_204_NO_CONTENT
+    return status.HTTP_200_OK
+
+
+def quota_status(phone_number) -> int:
+    """get/: 200 اگر سهمیه باقی است، 204 اگر تمام شده، 423 برای شماره‌ی محافظت‌شده."""
+    phone_number, refused = _parse_phone(current_indexes(), phone_number)
+    if refused is not None:
+        return refused
+    return _quota_status(phone_number)
+
+
+def claim(phone_number, device_id=None, product_id=None) -> int:
+    """
+    post/: بدون d و p همان get/ است؛ وگرنه ثبت RowData و مصرف یک هدیه
+    (200 مصرف شد، 204 سهمیه‌ای نبود؛ ردیف RowData در هر دو حالت ثبت می‌شود).
+    """
+    args, refused = _claim_args(current_indexes(), phone_number, device_id, product_id)
+    if refused is not None:
+        return refused
+    phone_number, device_id, product_id = args
+
+    if device_id is None and product_id is None:
+        return _quota_status(phone_number)
+    if product_id is not None and not Product.objects.filter(product_id=product_id).exists():
+        return status.HTTP_400_BAD_REQUEST
+
+    serializer_row = RowDataSerializer(data={
+        'phone_number': phone_number,
+        'device_id': device_id,
+        'product_id': product_id,
+    })
+    if not serializer_row.is_valid():
+        return status.HTTP_400_BAD_REQUEST
+    serializer_row.save()
+
+    # مصرف سهمیه: یک دستور اتمی (ساخت ردیف جدید یا کم‌کردن اگر > 0)
+    remaining = _claim_gift(serializer_row.validated_data['phone_number'])
+    if remaining is None:
+        return status.HTTP_204_NO_CONTENT
+    return status.HTTP_200_OK
+
+
+def _parse_sale(indexes, sale, latest):
+    """یک رکورد sync/ ⇒ (phone, product_id, sold_at)، یا کد خطای همان رکورد (400 / 423)."""
+    if not isinstance(sale, dict):
+        return status.HTTP_400_BAD_REQUEST
+    phone_number, refused = _parse_phone(indexes, sale.get('ph'))
+    if refused is not None:
+        return refused
+    product_id, sold_at = sale.get('p'), sale.get('t')
+    # فقط عدد صحیح JSON: true (یعنی 1)، 1.5 یا "1" رکورد خراب است، نه مقداری که گرد شود
+    if type(product_id) is not int or type(sold_at) is not int:
+        return status.HTTP_400_BAD_REQUEST
+    if not indexes.has_product(product_id) or not 0 < sold_at <= latest:
+        return status.HTTP_400_BAD_REQUEST
+    return phone_number, product_id, datetime.fromtimestamp(sold_at, timezone.utc)
+
+
+def apply_offline_sales(device_id, sales, indexes=None):
+    """
+    sync/: فروش‌هایی که دستگاه در زمان قطعی ذخیره کرده، یکجا؛ هر رکورد {"ph", "p", "t"} (t ثانیه‌ی
+    unix زمان فروش روی دستگاه). برمی‌گرداند: (کد وضعیت، لیست کد هر رکورد به همان ترتیب یا None).
+    - دستگاه ناموجود 400، غیرفعال 403 برای کل درخواست؛ دستگاه و محصول و شماره‌ی محافظت‌شده از
+      ایندکس‌های درون‌حافظه بررسی می‌شوند، بدون کوئری
+    - کد هر رکورد مثل post/: 200 هدیه مصرف شد، 204 سهمیه‌ای نبود، 400 نامعتبر، 423 محافظت‌شده؛
+      208 یعنی همین فروش (دستگاه، شماره، محصول، t) قبلاً ثبت شده (تکرار ارسال بعد از قطع پاسخ)
+    - در یک تراکنش: claim_gift برای هر رکورد به ترتیب و bulk_create همه‌ی ردیف‌های RowData
+    """
+    if device_id is None or not isinstance(sales, list) or not sales or len(sales) > MAX_SYNC_SALES:
+        return status.HTTP_400_BAD_REQUEST, None
+    device_id = _parse_device_id(device_id)
+    if device_id is None:
+        return status.HTTP_400_BAD_REQUEST, None
+    indexes = indexes or current_indexes()
+    refused = _check_device(indexes, device_id)
+    if refused is not None:
+        return refused, None
+
+    latest = time.time() + SALE_CLOCK_SKEW
+    results = [_parse_sale(indexes, sale, latest) for sale in sales]
+    valid = [(i, sale) for i, sale in enumerate(results) if isinstance(sale, tuple)]
+    if valid:
+        with transaction.atomic():
+            seen = set(
+                RowData.objects.filter(device_id=device_id, sold_at__in={sale[2] for _, sale in valid})
+                .values_list('phone_number', 'product_id', 'sold_at')
+            )
+            rows, claimed = [], set()
+            for i, sale in valid:
+                if sale in seen:
+                    results[i] = status.HTTP_208_ALREADY_REPORTED
+                    continue
+                seen.add(sale)
+                phone_number, product_id, sold_at = sale
+                remaining = claim_gift(phone_number)
+                if remaining is None:
+                    results[i] = status.HTTP_204_NO_CONTENT
+                else:
+                    results[i] = status.HTTP_200_OK
+                    claimed.add(phone_number)
+                rows.append(RowData(
+                    phone_number=phone_number, device_id_id=device_id, product_id_id=product_id, sold_at=sold_at,
+                ))
+            RowData.objects.bulk_create(rows)
+            if claimed:
+                record_changes(ChangeFeed.QUOTA, claimed)  # مثل _claim_gift، یک INSERT برای کل دسته
+    return status.HTTP_200_OK, results
+
+
+# ------------------ async (ORM async جنگو؛ همان کدهای وضعیت) ------------------
+async def adevice_status(device_id, if_none_match=None) -> int:
+    return device_status(device_id, await acurrent_indexes(), if_none_match)
+
+
+async def aqueue_report(device_id, report_text) -> int:
+    # فقط append در صف حافظه؛ نوشتن با thread پس‌زمینه‌ی ReportBuffer
+    return queue_report(device_id, report_text, await acurrent_indexes())
+
+
+async def aqueue_reports(device_id, reports) -> int:
+    return queue_reports(device_id, reports, await acurrent_indexes())
+
+
+async def _aquota_status(phone_number: int) -> int:
+    try:
+        record = await TemproryData.objects.aget(phone_number=phone_number)
+    except TemproryData.DoesNotExist:
+        return status.HTTP_200_OK
+    if record.gift_number == 0:
+        return status.HTTP_204_NO_CONTENT
+    return status.HTTP_200_OK
+
+
+async def aquota_status(phone_number) -> int:
+    phone_number, refused = _parse_phone(await acurrent_indexes(), phone_number)
+    if refused is not None:
+        return refused
+    return await _aquota_status(phone_number)
+
+
+async def aclaim(phone_number, device_id=None, product_id=None) -> int:
+    """
+    مثل claim؛ به جای RowDataSerializer مستقیم acreate: شماره از قبل نرمال شده و دستگاه و
+    محصول بررسی شده‌اند، دستگاهی که در همین فاصله حذف شود را قید FK رد می‌کند (400).
+    """
+    args, refused = _claim_args(await acurrent_indexes(), phone_number, device_id, product_id)
+    if refused is not None:
+        return refused
+    phone_number, device_id, product_id = args
+
+    if device_id is None and product_id is None:
+        return await _aquota_status(phone_number)
+    if product_id is not None and not await Product.objects.filter(product_id=product_id).aexists():
+        return status.HTTP_400_BAD_REQUEST
+
+    try:
+        await RowData.objects.acreate(
+            phone_number=phone_number, device_id_id=device_id, product_id_id=product_id,
+        )
+    except IntegrityError:
+        return status.HTTP_400_BAD_REQUEST
+
+    # claim_gift یک دستور SQL خام است (بدون معادل async)؛ روی همان thread همگام ORM async
+    remaining = await sync_to_async(_claim_gift)(phone_number)
+    if remaining is None:
+        return status.HTTP_204_NO_CONTENT
+    return status.HTTP_200_OK
+
+
+async def aapply_offline_sales(device_id, sales):
+    # ORM async جنگو تراکنش ندارد؛ کل دسته در یک فراخوانی روی thread همگام ORM
+    indexes = await acurrent_indexes()
+    return await sync_to_async(apply_offline_sales)(device_id, sales, indexes)
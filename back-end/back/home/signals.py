@@ -1,11 +1,17 @@
 # devices/signals.py
-from django.db.models.signals import post_delete
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
-from .models import Device
+from .models import ChangeFeed, Device, Product, ProtectedPhoneNumber
+from .changefeed import record_change
+from .authentication import TOKEN_CACHE
 
 @receiver(post_delete, sender=Token)
 def clear_device_name_on_token_delete(sender, instance, **kwargs):
+    # توکن حذف یا عوض شد (کلید توکن همان pk است): کش همین پروسه فوراً، بقیه از feed
+    TOKEN_CACHE.invalidate(instance.key)
+    record_change(ChangeFeed.USER, instance.user_id)
     try:
         device = Device.objects.get(device_token=instance)
         device.device_name = ""
@@ -13,3 +19,72 @@ def clear_device_name_on_token_delete(sender, instance, **kwargs):
         device.save()
     except Device.DoesNotExist:
         pass
+
+
+@receiver(post_save, sender=Token)
+def record_token_save(sender, instance, **kwargs):
+    TOKEN_CACHE.invalidate(instance.key)
+    record_change(ChangeFeed.USER, instance.user_id)
+
+# فقط این فیلدها روی احراز هویت اثر دارند؛ بقیه (مثلاً last_login در هر ورود به ادمین) نباید
+# کش توکن همه‌ی worker ها را خالی کنند
+_USER_AUTH_FIELDS = ('is_active', 'password')
+
+@receiver(pre_save, sender=get_user_model())
+def remember_user_auth_change(sender, instance, update_fields=None, **kwargs):
+    instance._auth_changed = False
+    if instance.pk is None or (update_fields is not None and set(update_fields).isdisjoint(_USER_AUTH_FIELDS)):
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(*_USER_AUTH_FIELDS).first()
+    instance._auth_changed = old != tuple(getattr(instance, field) for field in _USER_AUTH_FIELDS)
+
+@receiver(post_save, sender=get_user_model())
+def record_user_save(sender, instance, **kwargs):
+    if getattr(instance, '_auth_changed', True):
+        _forget_user(instance)
+
+@receiver(post_delete, sender=get_user_model())
+def record_user_delete(sender, instance, **kwargs):
+    _forget_user(instance)
+
+def _forget_user(user):
+    # مثلاً is_active=False در ادمین: توکن‌های این کاربر دیگر از کش قبول نمی‌شوند
+    TOKEN_CACHE.invalidate_where(lambda entry: entry[0].pk == user.pk)
+    record_change(ChangeFeed.USER, user.pk)
+
+
+# ------------------ feed تغییرات Device / Product / ProtectedPhoneNumber (home/changefeed.py) ------------------
+# توجه: queryset.update() و bulk_create سیگنال نمی‌فرستند و در feed ثبت نمی‌شوند
+_FEED_KEYS = {
+    Device: (ChangeFeed.DEVICE, 'device_id'),
+    Product: (ChangeFeed.PRODUCT, 'product_id'),
+    ProtectedPhoneNumber: (ChangeFeed.PROTECTED, 'phone_number'),
+}
+
+@receiver(pre_save, sender=Device)
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProtectedPhoneNumber)
+def remember_old_feed_key(sender, instance, **kwargs):
+    # اگر device_id / product_id / phone_number در ادمین عوض شود، شناسه‌ی قدیمی هم باید از کش‌ها حذف شود
+    _, field = _FEED_KEYS[sender]
+    instance._feed_old_key = None
+    if instance.pk:
+        instance._feed_old_key = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+@receiver(post_save, sender=Device)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProtectedPhoneNumber)
+def record_feed_save(sender, instance, **kwargs):
+    model, field = _FEED_KEYS[sender]
+    key = getattr(instance, field)
+    old_key = getattr(instance, '_feed_old_key', None)
+    if old_key is not None and old_key != key:
+        record_change(model, old_key, deleted=True)
+    record_change(model, key)
+
+@receiver(post_delete, sender=Device)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProtectedPhoneNumber)
+def record_feed_delete(sender, instance, **kwargs):
+    model, field = _FEED_KEYS[sender]
+    record_change(model, getattr(instance, field), deleted=True)
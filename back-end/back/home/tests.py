@@ -1,3 +1,373 @@
-from django.test import TestCase
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from accounts.models import User
+from home import services
+from home.indexes import RequestIndexes
+from home.models import ChangeFeed, Device, Product, ProtectedPhoneNumber, RowData, TemproryData
+from home.phone import normalize_phone, normalize_phone_series
+from home.quota import MAX_GIFT, claim_gift, consume_gifts
+from home.ratelimit import TokenBucketLimiter
+
+
+def _indexes():
+    # ایندکس تازه از DB تست؛ INDEXES سراسری پروسه به poll خودش وابسته است
+    indexes = RequestIndexes()
+    indexes.load()
+    return indexes
+
+
+class DeviceFixture(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = Device.objects.create(device_id=1, device_name='d1', device_activity=True)
+        Device.objects.create(device_id=2, device_name='d2', device_activity=False)
+        Product.objects.create(product_id=1, product_name='p1')
+        Product.objects.create(product_id=2, product_name='p2')
+
+
+class SyncInputTypesTests(DeviceFixture):
+    """sync/: نوع‌های JSON غیرمنتظره رکورد یا درخواست را 400 می‌کنند، نه 500 و نه مقدار گردشده."""
+
+    def sync(self, device_id, sales):
+        return services.apply_offline_sales(device_id, sales, _indexes())
+
+    def test_phone_of_unexpected_json_type_is_rejected_per_record(self):
+        now = int(time.time())
+        for phone in (9120000031.0, ['x'], {'a': 1}, True, None):
+            with self.subTest(phone=phone):
+                code, results = self.sync(1, [{'ph': phone, 'p': 1, 't': now}, {'ph': '09120000032', 'p': 1, 't': now}])
+                self.assertEqual(code, 200)
+                self.assertEqual(results[0], 400)
+        self.assertEqual(RowData.objects.filter(phone_number=9120000032).count(), 1)
+
+    def test_normalize_phone_raises_value_error_for_other_types(self):
+        for value in (9120000031.0, ['x'], {'a': 1}, None, object()):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    normalize_phone(value)
+
+    def test_device_id_must_be_an_integer(self):
+        sales = [{'ph': '09120000033', 'p': 1, 't': int(time.time())}]
+        for device_id in (True, 1.0, 1.9, [1], {'d': 1}, 'x'):
+            with self.subTest(device_id=device_id):
+                self.assertEqual(self.sync(device_id, sales), (400, None))
+        self.assertEqual(self.sync('1', sales)[0], 200)  # query string
+        self.assertFalse(TemproryData.objects.exclude(phone_number=9120000033).exists())
+
+    def test_bulk_report_device_id_must_be_an_integer(self):
+        for device_id in (True, 1.9):
+            with self.subTest(device_id=device_id):
+                self.assertEqual(services.queue_reports(device_id, ['x'], _indexes()), 400)
+
+    def test_sync_endpoint_answers_400_per_record_instead_of_500(self):
+        user = User.objects.create(username='device')
+        self.device.device_token = Token.objects.create(user=user)
+        self.device.save()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.device.device_token.key)
+        now = int(time.time())
+        sales = [{'ph': 9120000031.0, 'p': 1, 't': now}, {'ph': ['x'], 'p': 1, 't': now},
+                 {'ph': {'a': 1}, 'p': 1, 't': now}, {'ph': '09120000034', 'p': 1, 't': now}]
+        response = client.post('/home/sync/', {'d': 1, 'sales': sales}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'r': [400, 400, 400, 200]})
+        response = client.post('/home/sync/', {'d': True, 'sales': sales}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ReportStatusTests(DeviceFixture):
+    """re/ و re/bulk/ فقط در صف حافظه می‌گذارند: 202 (پذیرفته شد)، نه 201، و 503 اگر صف جا نداشت."""
+
+    def test_queued_reports_are_accepted_not_created(self):
+        with mock.patch('home.services.report_buffer') as buffer:
+            buffer.return_value.add.return_value = True
+            buffer.return_value.add_many.return_value = True
+            self.assertEqual(services.queue_report('1', 'x', _indexes()), 202)
+            self.assertEqual(services.queue_reports(1, ['x', 'y'], _indexes()), 202)
+            buffer.return_value.add.return_value = False
+            self.assertEqual(services.queue_report('1', 'x', _indexes()), 503)
+        self.assertEqual(services.queue_report('2', 'x', _indexes()), 403)
+
+class QuotaFlushAndFeedTests(DeviceFixture):
+    """flush دفتر سهمیه‌ی TCP (consume_gifts) و ردیف‌های QUOTA که مسیر HTTP برای آن دفتر می‌نویسد."""
+
+    def gifts(self):
+        return dict(TemproryData.objects.values_list('phone_number', 'gift_number'))
+
+    def quota_feed(self):
+        return sorted(ChangeFeed.objects.filter(model=ChangeFeed.QUOTA).values_list('object_id', flat=True))
+
+    def test_consume_gifts_creates_decrements_and_clamps(self):
+        TemproryData.objects.create(phone_number=9120000041, gift_number=2)
+        TemproryData.objects.create(phone_number=9120000042, gift_number=1)
+        consume_gifts({9120000040: 1, 9120000041: 1, 9120000042: 2}, max_gift=2)
+        self.assertEqual(self.gifts(), {9120000040: 1, 9120000041: 1, 9120000042: 0})
+        consume_gifts({9120000040: 1, 9120000041: 5}, max_gift=2)
+        self.assertEqual(self.gifts(), {9120000040: 0, 9120000041: 0, 9120000042: 0})
+
+    def test_consume_gifts_decrements_a_row_created_by_another_path(self):
+        # قبلاً: bulk_create(ignore_conflicts=True) مصرف شماره‌ای را که هم‌زمان ساخته شده بود دور می‌ریخت
+        services.claim('09120000043', '1', '1')
+        consume_gifts({9120000043: 1}, max_gift=MAX_GIFT)
+        self.assertEqual(self.gifts()[9120000043], MAX_GIFT - 2)
+
+    def test_http_claims_record_quota_changes(self):
+        self.assertEqual(services.claim('09120000044', '1', '1'), 200)
+        self.assertEqual(services.claim('09120000044', '1', '1'), 200)
+        self.assertEqual(services.claim('09120000044', '1', '1'), 204)  # سهمیه‌ای نماند، چیزی عوض نشد
+        self.assertEqual(self.quota_feed(), [9120000044, 9120000044])
+
+    def test_sync_records_one_quota_change_per_claimed_phone(self):
+        now = int(time.time())
+        sales = [{'ph': '09120000045', 'p': 1, 't': now - 3}, {'ph': '09120000045', 'p': 1, 't': now - 2},
+                 {'ph': '09120000045', 'p': 1, 't': now - 1}, {'ph': '09120000046', 'p': 2, 't': now}]
+        code, results = services.apply_offline_sales(1, sales, _indexes())
+        self.assertEqual((code, results), (200, [200, 200, 204, 200]))
+        self.assertEqual(self.quota_feed(), [9120000045, 9120000046])
+
+
+class NormalizePhoneTests(TestCase):
+    """یک نفر با هر قالب ورودی یک کلید می‌گیرد؛ نسخه‌ی برداری (ورود دسته‌ای) با نسخه‌ی تکی یکی است."""
+
+    ACCEPTED = [
+        ('9121234567', 9121234567),
+        ('09121234567', 9121234567),
+        ('989121234567', 9121234567),
+        ('+989121234567', 9121234567),
+        ('00989121234567', 9121234567),
+        (' 0912-123 4567 ', 9121234567),
+        ('(+98) 912 123 4567', 9121234567),
+        ('۰۹۱۲۱۲۳۴۵۶۷', 9121234567),
+        ('٠٩١٢١٢٣٤٥٦٧', 9121234567),
+        ('+۹۸۹۱۲۱۲۳۴۵۶۷', 9121234567),
+        (b'09121234567', 9121234567),
+        (b'9121234567', 9121234567),
+        (b'+989121234567', 9121234567),
+        (bytearray(b'09121234567'), 9121234567),
+        (9121234567, 9121234567),
+        (989121234567, 9121234567),
+    ]
+    REJECTED = [
+        9121234567.0, True, False, None, [9121234567], {'ph': 9121234567},
+        '', '912123456', '0912123456', '091212345678', '9121234567890', '8121234567', '02112345678',
+        '+9809121234567', '0912x234567', '۰۹۱۲۱۲۳۴۵۶', 912123456, 8121234567, 0, -9121234567,
+        '۰۹۱۲۱۲۳۴۵۶۷'.encode(), b'0912\xff234567',
+    ]
+
+    def test_accepted(self):
+        for value, key in self.ACCEPTED:
+            with self.subTest(value=value):
+                self.assertEqual(normalize_phone(value), key)
+
+    def test_rejected(self):
+        for value in self.REJECTED:
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    normalize_phone(value)
+
+    def test_series_agrees_with_scalar(self):
+        import pandas as pd
+
+        # bytes و غیر str از اکسل/CSV نمی‌آیند؛ ستون رشته‌ای و ستون عددی کافی است
+        values = [value for value, _ in self.ACCEPTED if isinstance(value, str)]
+        values += [value for value in self.REJECTED if isinstance(value, str)]
+        numbers = [9121234567, 989121234567, 912123456, 8121234567, 0]
+        for series in (pd.Series(values, dtype=object), pd.Series(numbers)):
+            expected = []
+            for value in series:
+                try:
+                    expected.append(normalize_phone(value))
+                except ValueError:
+                    expected.append(None)
+            with self.subTest(dtype=str(series.dtype)):
+                result = normalize_phone_series(series)
+                self.assertEqual(str(result.dtype), 'Int64')
+                self.assertEqual([None if pd.isna(key) else key for key in result], expected)
+
+    def test_series_accepts_whole_float_cells_from_excel(self):
+        import pandas as pd
+
+        result = normalize_phone_series(pd.Series([9121234567.0, 9121234567.5, float('nan')]))
+        self.assertEqual(result.iloc[0], 9121234567)
+        self.assertTrue(result.iloc[1:].isna().all())
+
+
+class ClaimGiftTests(TestCase):
+    """claim_gift: یک دستور اتمی؛ هیچ ترتیبی از درخواست‌ها بیش از MAX_GIFT هدیه نمی‌دهد."""
+
+    def test_missing_row_is_created_with_one_gift_used(self):
+        self.assertEqual(claim_gift(9120000051), MAX_GIFT - 1)
+        self.assertEqual(TemproryData.objects.get(phone_number=9120000051).gift_number, MAX_GIFT - 1)
+
+    def test_repeated_claims_stop_at_max_gift(self):
+        results = [claim_gift(9120000052) for _ in range(MAX_GIFT + 3)]
+        self.assertEqual(results, [*range(MAX_GIFT - 1, -1, -1), None, None, None])
+        self.assertEqual(TemproryData.objects.get(phone_number=9120000052).gift_number, 0)
+
+    def test_existing_row_without_quota_is_left_unchanged(self):
+        row = TemproryData.objects.create(phone_number=9120000053, gift_number=0)
+        self.assertIsNone(claim_gift(9120000053))
+        self.assertEqual(TemproryData.objects.get(pk=row.pk).datetime_updated, row.datetime_updated)
+
+
+class ConcurrentClaimGiftTests(TransactionTestCase):
+    """چند thread با اتصال DB جدا روی یک شماره‌ی تازه، مثل چند worker گونیکورن یا سرور TCP و HTTP."""
+
+    def test_concurrent_claims_grant_at_most_max_gift(self):
+        workers = 8
+        barrier = threading.Barrier(workers)
+
+        def claim():
+            try:
+                barrier.wait()
+                return claim_gift(9120000054)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(lambda _: claim(), range(workers)))
+        granted = [r for r in results if r is not None]
+        self.assertEqual(sorted(granted), list(range(MAX_GIFT)))
+        self.assertEqual(TemproryData.objects.get(phone_number=9120000054).gift_number, 0)
+
+
+class TokenBucketLimiterTests(SimpleTestCase):
+    """سطل توکن با ساعت ساختگی: burst، پر شدن با rate در ثانیه، سقف burst و بیرون رفتن سطل‌های بیکار."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('home.ratelimit.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def allowed(self, limiter, key, n):
+        return sum(limiter.allow(key) for _ in range(n))
+
+    def test_burst_then_reject(self):
+        limiter = TokenBucketLimiter(rate=2, burst=5)
+        self.assertEqual(self.allowed(limiter, 1, 8), 5)
+        self.assertEqual((limiter.allowed, limiter.rejected), (5, 3))
+        self.assertEqual(self.allowed(limiter, 2, 8), 5)  # هر کلید سطل خودش را دارد
+
+    def test_refill_at_rate(self):
+        limiter = TokenBucketLimiter(rate=2, burst=5)
+        self.allowed(limiter, 1, 5)
+        self.assertAlmostEqual(limiter.retry_after(1), 0.5)
+        self.now += 0.25
+        self.assertFalse(limiter.allow(1))
+        self.now += 0.25
+        self.assertTrue(limiter.allow(1))
+        self.assertFalse(limiter.allow(1))
+        self.now += 1.5
+        self.assertEqual(self.allowed(limiter, 1, 5), 3)
+
+    def test_refill_is_capped_at_burst(self):
+        limiter = TokenBucketLimiter(rate=2, burst=5)
+        self.allowed(limiter, 1, 5)
+        self.now += 3600
+        self.assertEqual(self.allowed(limiter, 1, 10), 5)
+        self.assertEqual(limiter.retry_after(1, cost=0), 0)
+
+    def test_cost(self):
+        limiter = TokenBucketLimiter(rate=1, burst=5)
+        self.assertTrue(limiter.allow(1, cost=4))
+        self.assertFalse(limiter.allow(1, cost=2))
+        self.assertAlmostEqual(limiter.retry_after(1, cost=2), 1.0)
+        self.assertTrue(limiter.allow(1))
+
+    def test_idle_buckets_are_evicted_full(self):
+        limiter = TokenBucketLimiter(rate=1, burst=3, idle_seconds=10)
+        self.allowed(limiter, 1, 3)
+        self.allowed(limiter, 2, 3)
+        self.now += 10
+        limiter.allow(3)
+        self.assertEqual(len(limiter), 1)  # 1 و 2 بیکار بودند و دوباره پر شده بودند
+        self.assertEqual(self.allowed(limiter, 1, 5), 3)
+
+    def test_zero_rate_is_off(self):
+        limiter = TokenBucketLimiter(rate=0, burst=5)
+        self.assertEqual(self.allowed(limiter, 1, 100), 100)
+        self.assertEqual((len(limiter), limiter.retry_after(1)), (0, 0))
+
+    def test_max_keys(self):
+        limiter = TokenBucketLimiter(rate=1, burst=3, max_keys=2)
+        for key in range(10):
+            limiter.allow(key)
+        self.assertLessEqual(len(limiter), 3)
+
+
+class ApplyOfflineSalesTests(DeviceFixture):
+    """sync/: هر رکورد کد خودش را می‌گیرد؛ رکورد نامعتبر بقیه‌ی دسته را رد نمی‌کند و ارسال دوباره چیزی را دوبار ثبت نمی‌کند."""
+
+    def setUp(self):
+        self.now = int(time.time())
+
+    def sync(self, sales, device_id=1):
+        return services.apply_offline_sales(device_id, sales, _indexes())
+
+    def sale(self, phone, product=1, ago=60):
+        return {'ph': phone, 'p': product, 't': self.now - ago}
+
+    def test_partial_batch(self):
+        ProtectedPhoneNumber.objects.create(phone_number=9120000071)
+        sales = [
+            self.sale('09120000072'),
+            self.sale('09120000071'),                                 # محافظت‌شده
+            self.sale('0912'),                                        # شماره‌ی نامعتبر
+            self.sale('09120000072', product=99),                     # محصول ناموجود
+            {'ph': '09120000072', 'p': 1, 't': self.now + 3600},      # آینده، بیش از SALE_CLOCK_SKEW
+            {'ph': '09120000072', 'p': 1, 't': 0},
+            {'ph': '09120000072', 'p': 1},
+            'x',
+            self.sale('+989120000072', ago=30),
+            self.sale('09120000072', ago=20),                         # سهمیه تمام شده
+            self.sale('09120000073', product=2),
+        ]
+        self.assertEqual(self.sync(sales), (200, [200, 423, 400, 400, 400, 400, 400, 400, 200, 204, 200]))
+        self.assertEqual(RowData.objects.filter(phone_number=9120000072).count(), 3)
+        self.assertEqual(RowData.objects.count(), 4)
+        self.assertEqual(TemproryData.objects.get(phone_number=9120000072).gift_number, 0)
+        row = RowData.objects.get(phone_number=9120000073)
+        self.assertEqual((row.device_id_id, row.product_id_id, int(row.sold_at.timestamp())), (1, 2, self.now - 60))
+
+    def test_all_invalid_writes_nothing(self):
+        self.assertEqual(self.sync([self.sale('0912'), {}]), (200, [400, 400]))
+        self.assertFalse(RowData.objects.exists())
+        self.assertFalse(TemproryData.objects.exists())
+
+    def test_resend_is_reported_not_reapplied(self):
+        sales = [self.sale('09120000074', ago=60), self.sale('09120000074', ago=50)]
+        self.assertEqual(self.sync(sales), (200, [200, 200]))
+        # پاسخ به دستگاه نرسید؛ همان دسته به‌اضافه‌ی یک فروش تازه دوباره می‌آید
+        self.assertEqual(self.sync([*sales, self.sale('09120000075')]), (200, [208, 208, 200]))
+        self.assertEqual(RowData.objects.filter(phone_number=9120000074).count(), 2)
+        self.assertEqual(TemproryData.objects.get(phone_number=9120000074).gift_number, 0)
+
+    def test_duplicate_inside_one_batch(self):
+        sale = self.sale('09120000076')
+        self.assertEqual(self.sync([sale, dict(sale), self.sale('9120000076', ago=60)]), (200, [200, 208, 208]))
+        self.assertEqual(RowData.objects.count(), 1)
+        self.assertEqual(TemproryData.objects.get(phone_number=9120000076).gift_number, MAX_GIFT - 1)
+
+    def test_same_sale_on_another_device_is_not_a_duplicate(self):
+        Device.objects.create(device_id=3, device_name='d3', device_activity=True)
+        self.assertEqual(self.sync([self.sale('09120000077')]), (200, [200]))
+        self.assertEqual(self.sync([self.sale('09120000077')], device_id=3), (200, [200]))
+        self.assertEqual(RowData.objects.count(), 2)
+
+    def test_whole_request_refused(self):
+        sale = self.sale('09120000078')
+        for device_id, sales, code in [
+            (None, [sale], 400), (99, [sale], 400), (2, [sale], 403),
+            (1, [], 400), (1, {'ph': '09120000078'}, 400), (1, [sale] * (services.MAX_SYNC_SALES + 1), 400),
+        ]:
+            with self.subTest(device_id=device_id, sales=len(sales)):
+                self.assertEqual(self.sync(sales, device_id), (code, None))
+        self.assertFalse(RowData.objects.exists())
@@ -7,21 +7,27 @@ Original file is located at
     https://colab.research.google.com/drive/19M4yPG2hgC3RClmIRQOBVPseJU1EJPgm
 """
 
+from django.conf import settings
 from django.urls import path
-from home import views
+from home import async_views, views
 
 
 app_name='home'
 
+# زیر ASGI (A/asgi.py) نسخه‌ی async همین view ها (home/async_views.py)؛ همان نام‌ها و کدهای وضعیت
+device_views = async_views if settings.DEVICE_API_ASYNC else views
+
 urlpatterns = [
     # path('home/', include('home.urls'), name='home')
     # path('post/', views.PostMetadataView.as_view(), name='post'),
     # path('device/', views.DeviceActivity.as_view(), name='device'),
     # path('report/', views.report_api, name='report-api'),
 
-    path('get/', views.GetMetadataView.as_view(), name='get'),
-    path('post/', views.PostMetadataView.as_view(), name='post'),
-    path('re/', views.ReportMetadataView.as_view(), name='report'),
-    path('st/', views.DeviceStatusView.as_view(), name='device_status'),
+    path('get/', device_views.GetMetadataView.as_view(), name='get'),
+    path('post/', device_views.PostMetadataView.as_view(), name='post'),
+    path('re/', device_views.ReportMetadataView.as_view(), name='report'),
+    path('re/bulk/', device_views.BulkReportView.as_view(), name='report_bulk'),
+    path('sync/', device_views.SyncSalesView.as_view(), name='sync'),
+    path('st/', device_views.DeviceStatusView.as_view(), name='device_status'),
 ]
 
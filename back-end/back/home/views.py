@@ -1,188 +1,100 @@
-
 import logging
 # from django.shortcuts import render
 from rest_framework.views import APIView
-from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
-from django.db.models import F
-from home.serializers import RowDataSerializer, TemproryDataSerializer
-from home.models import RowData, TemproryData, Device, Product, Report
+from home import services
+from home.authentication import CachedTokenAuthentication
+from home.ratelimit import DeviceRateThrottle, PhoneRateThrottle
 
 logger = logging.getLogger(__name__)
 
+# منطق هر endpoint در home/services.py است (مشترک با مسیر سریع WSGI، home/fastpath.py)؛
+# اینجا فقط احراز هویت، سقف نرخ و Response بدون بدنه.
+
 
 class DeviceStatusView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [DeviceRateThrottle]
 
     def get(self, request):
-        device_id = request.query_params.get('d') 
+        code = services.device_status(
+            request.query_params.get('d'), if_none_match=request.headers.get('If-None-Match'),
+        )
+        return Response(status=code, headers=dict(services.device_status_headers(code)))
 
-        if device_id is None:
-            # return Response('Missing parameters', status=status.HTTP_400_BAD_REQUEST)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            device_id = int(device_id)
-            device = Device.objects.get(device_id=device_id)  # یا device_id=device_id   
-        except Device.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND) 
 
 
-        if device.device_activity:
-            return Response(status=status.HTTP_202_ACCEPTED)
-        else:
-            return Response(status=status.HTTP_403_FORBIDDEN)
+class ReportMetadataView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [DeviceRateThrottle]
 
+    def get(self, request):
+        params = request.query_params
+        return Response(status=services.queue_report(params.get('d'), params.get('re')))
 
 
 
-class ReportMetadataView(APIView):
-    authentication_classes = [TokenAuthentication]
+class BulkReportView(APIView):
+    """
+    چند گزارش در یک درخواست (برای رگبار خطاهای یک دستگاه):
+        POST /home/re/bulk/   {"d": 12, "re": ["...", "..."]}
+    d اختیاری است؛ پیش‌فرض دستگاه صاحب توکن (request.device). همه یا هیچ: 202 اگر همه در صف
+    رفتند، 503 اگر صف جا نداشت.
+    """
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [DeviceRateThrottle]
 
-    def get(self, request):
-        report_text = request.query_params.get('re')
-        device_id = request.query_params.get('d')
+    def post(self, request):
+        device_id = request.data.get('d', request.query_params.get('d'))
+        if device_id is None and request.device is not None:
+            device_id = request.device.device_id
+        return Response(status=services.queue_reports(device_id, request.data.get('re')))
 
-        if device_id is None or report_text is None:
-            # return Response('Missing parameters', status=status.HTTP_400_BAD_REQUEST)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        # بررسی Device
-        try:
-            device_id = int(device_id)
-            device = Device.objects.get(device_id=device_id)  # یا device_id=device_id
-        except ValueError:
-            # return Response('device_id must be an integer', status=status.HTTP_400_BAD_REQUEST)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        except Device.DoesNotExist:
-            # return Response('Invalid device_id', status=status.HTTP_400_BAD_REQUEST)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        # ثبت گزارش
-        report = Report.objects.create(report=report_text, device_id=device)
+class SyncSalesView(APIView):
+    """
+    فروش‌هایی که دستگاه در زمان قطعی ذخیره کرده، به جای تکرار post/ برای تک‌تک آن‌ها:
+        POST /home/sync/   {"d": 12, "sales": [{"ph": "09121234567", "p": 3, "t": 1760000000}, ...]}
+    d اختیاری است (پیش‌فرض دستگاه صاحب توکن)؛ حداکثر services.MAX_SYNC_SALES رکورد.
+    پاسخ 200: {"r": [200, 204, 208, ...]} هم‌ترتیب sales (معنای کدها: services.apply_offline_sales).
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [DeviceRateThrottle]
 
-        # return Response({
-        #     'message': 'Report created successfully',
-        #     'report_id': report.id
-        # }, status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_201_CREATED)
+    def post(self, request):
+        device_id = request.data.get('d', request.query_params.get('d'))
+        if device_id is None and request.device is not None:
+            device_id = request.device.device_id
+        code, results = services.apply_offline_sales(device_id, request.data.get('sales'))
+        if results is None:
+            return Response(status=code)
+        return Response({'r': results}, status=code)
 
 
 
 class GetMetadataView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [DeviceRateThrottle]
 
     def get(self, request):
-        phone_number = request.query_params.get('ph')
-        if not phone_number:
-            # return Response('phone_number is required', status=status.HTTP_400_BAD_REQUEST)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-
-        try:
-            record = TemproryData.objects.get(phone_number=phone_number)
-            if record.gift_number == 0:
-                # return Response(status=status.HTTP_204_NO_CONTENT)
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            else:
-                # return Response('OK', status=status.HTTP_200_OK)
-                return Response(status=status.HTTP_200_OK)
-        except TemproryData.DoesNotExist:
-            # return Response('OK', status=status.HTTP_200_OK)
-            return Response(status=status.HTTP_200_OK)
+        return Response(status=services.quota_status(request.query_params.get('ph')))
 
 
 
 
 class PostMetadataView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [DeviceRateThrottle, PhoneRateThrottle]
 
     def get(self, request):
-        gift_number = 2
-        phone_number = request.query_params.get('ph')
-        device_id = request.query_params.get('d')
-        product_id = request.query_params.get('p')
-
-        if not phone_number:
-            # return Response('phone_number is required', status=status.HTTP_400_BAD_REQUEST)
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-
-        # ��� phone_number ����� ? ���� ���
-        if device_id is None and product_id is None:
-            try:
-                record = TemproryData.objects.get(phone_number=phone_number)
-                if record.gift_number == 0:
-                    return Response(status=status.HTTP_204_NO_CONTENT)
-                else:
-                    # return Response('OK', status=status.HTTP_200_OK)
-                    return Response(status=status.HTTP_200_OK)
-            except TemproryData.DoesNotExist:
-                # return Response('OK', status=status.HTTP_200_OK)
-                return Response(status=status.HTTP_200_OK)
-
-        # phone_number + device_id + product_id ? ���� ���
-        else:
-            # ���������� device_id
-            if device_id is not None:
-                try:
-                    device_id = int(device_id)
-                    if not Device.objects.filter(device_id=device_id).exists():
-                        # return Response('Invalid device_id', status=status.HTTP_400_BAD_REQUEST)
-                        return Response(status=status.HTTP_400_BAD_REQUEST)
-                except ValueError:
-                    # return Response('device_id must be an integer', status=status.HTTP_400_BAD_REQUEST)
-                    return Response(status=status.HTTP_400_BAD_REQUEST)
-
-            # ���������� product_id
-            if product_id is not None:
-                try:
-                    product_id = int(product_id)
-                    if not Product.objects.filter(product_id=product_id).exists():
-                        # return Response('Invalid product_id', status=status.HTTP_400_BAD_REQUEST)
-                        return Response(status=status.HTTP_400_BAD_REQUEST)
-                except ValueError:
-                    # return Response('product_id must be an integer', status=status.HTTP_400_BAD_REQUEST)
-                    return Response(status=status.HTTP_400_BAD_REQUEST)
-
-            # ���� ���� RowData
-            row_data = {
-                'phone_number': phone_number,
-                'device_id': device_id,
-                'product_id': product_id,
-            }
-            serializer_row = RowDataSerializer(data=row_data)
-            if not serializer_row.is_valid():
-                # return Response(serializer_row.errors, status=status.HTTP_400_BAD_REQUEST)
-                return Response(status=status.HTTP_400_BAD_REQUEST)
-            serializer_row.save()
-
-            # ���� TemproryData
-            try:
-                temp_record = TemproryData.objects.get(phone_number=phone_number)
-                if temp_record.gift_number > 0:
-                    temp_record.gift_number = F('gift_number') - 1
-                    temp_record.save(update_fields=['gift_number'])
-                    # return Response('OK', status=status.HTTP_200_OK)
-                    return Response(status=status.HTTP_200_OK)
-                else:
-                    # return Response('NOT', status=status.HTTP_204_NO_CONTENT)
-                    return Response(status=status.HTTP_204_NO_CONTENT)
-            except TemproryData.DoesNotExist:
-                temp_data = {
-                    'phone_number': phone_number,
-                    'gift_number': gift_number - 1,
-                }
-                serializer_temp = TemproryDataSerializer(data=temp_data)
-                if serializer_temp.is_valid():
-                    serializer_temp.save()
-                    # return Response('OK', status=status.HTTP_200_OK)
-                    return Response(status=status.HTTP_200_OK)
-                else:
-                    # return Response(serializer_temp.errors, status=status.HTTP_400_BAD_REQUEST)
-                    return Response(status=status.HTTP_400_BAD_REQUEST)
-
+        params = request.query_params
+        return Response(status=services.claim(params.get('ph'), params.get('d'), params.get('p')))
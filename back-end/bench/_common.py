@@ -0,0 +1,97 @@
+# bench/_common.py
+# ابزار مشترک بنچمارک‌ها: DB یک‌بارمصرف SQLite، اجرای سرور TCP در پروسه‌ی جدا، درصدک‌ها
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(BACKEND_DIR, "main_asyncio_3.py")
+
+# سرور بنچمارک بدون گزارش دوره‌ای و بدون سقف نرخ (تا خود سرور اندازه گرفته شود)؛
+# با متغیر محیطی هم‌نام قابل تغییر است، مثلاً RATE_LIMIT_DEVICE_PER_SECOND=5 python bench/loadgen.py
+SERVER_DEFAULTS = {
+    "DB_STATS_INTERVAL": "0",
+    "RATE_LIMIT_DEVICE_PER_SECOND": "1e9",
+    "RATE_LIMIT_DEVICE_BURST": "1e9",
+    "RATE_LIMIT_PHONE_PER_SECOND": "1e9",
+    "RATE_LIMIT_PHONE_BURST": "1e9",
+}
+
+
+def make_bench_db(devices: int = 100, products: int = 20) -> str:
+    """
+    یک DB تازه در پوشه‌ی موقت می‌سازد (migrate + دستگاه و محصول مصنوعی) و مسیرش را برمی‌گرداند.
+    SQLITE_PATH همین پروسه هم به آن اشاره می‌کند، پس باید قبل از django.setup صدا زده شود.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="vend-bench-"), "db.sqlite3")
+    os.environ["SQLITE_PATH"] = path
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "A.settings")
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "back"))
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from home.models import Device, Product
+
+    call_command("migrate", verbosity=0)
+    Device.objects.bulk_create(
+        Device(device_id=i, device_name=f"bench-{i}", device_activity=True)
+        for i in range(1, devices + 1)
+    )
+    Product.objects.bulk_create(
+        Product(product_id=i, product_name=f"bench-{i}") for i in range(1, products + 1)
+    )
+    return path
+
+
+def copy_db(template: str) -> str:
+    """کپی تازه از DB الگو تا هر اجرا از وضعیت یکسان شروع شود."""
+    path = os.path.join(tempfile.mkdtemp(prefix="vend-bench-"), "db.sqlite3")
+    shutil.copyfile(template, path)
+    return path
+
+
+def start_server(port: int, *args: str, env: dict | None = None) -> subprocess.Popen:
+    """main_asyncio_3.py را روی پورت داده‌شده اجرا می‌کند و تا باز شدن پورت صبر می‌کند."""
+    proc_env = {**SERVER_DEFAULTS, **os.environ, **(env or {})}
+    proc = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--host", "127.0.0.1", "--port", str(port), *args],
+        env=proc_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not start listening")
+
+
+def stop_server(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def raise_nofile():
+    # ده‌ها هزار کانکشن به همین تعداد file descriptor نیاز دارند
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
@@ -0,0 +1,99 @@
+# bench/engines.py
+# مقایسه‌ی موتور stream (handle_client) و protocol (DeviceProtocol) روی یک بار کاری یکسان
+#
+#   python bench/engines.py --connections 200 --requests 50
+#   python bench/engines.py --compare-loops   # هر موتور یک‌بار با asyncio و یک‌بار با uvloop
+#
+# برای هر اجرا یک DB تازه ساخته می‌شود؛ هر کانکشن درخواست‌ها را پشت سر هم می‌فرستد
+# (ارسال، صبر برای پاسخ، بعدی) و زمان هر رفت‌وبرگشت ثبت می‌شود.
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import copy_db, make_bench_db, percentile, start_server, stop_server  # noqa
+
+
+def build_workload(requests: int, devices: int, products: int, mix: tuple[int, int, int], rng):
+    ping_w, get_w, post_w = mix
+    lines = []
+    for _ in range(requests):
+        phone = rng.randrange(9_100_000_000, 9_399_999_999)
+        kind = rng.choices(("ping", "get", "post"), weights=(ping_w, get_w, post_w))[0]
+        if kind == "ping":
+            lines.append(f"ping,{rng.randint(1, devices)}\n".encode())
+        elif kind == "get":
+            lines.append(f"1,{phone}\n".encode())
+        else:
+            lines.append(f"2,{phone},{rng.randint(1, devices)},{rng.randint(1, products)}\n".encode())
+    return lines
+
+
+async def _client(port: int, lines: list[bytes], latencies: list[float]):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for line in lines:
+            started = time.perf_counter()
+            writer.write(line)
+            await reader.readline()
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+async def run_workload(port: int, workloads: list[list[bytes]]) -> tuple[list[float], float]:
+    latencies: list[float] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(port, lines, latencies) for lines in workloads))
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stream vs protocol engine benchmark")
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=50, help="درخواست برای هر کانکشن")
+    parser.add_argument("--mix", default="50,30,20", help="وزن ping,GET,POST")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--port", type=int, default=19224)
+    parser.add_argument("--compare-loops", action="store_true", help="اجرای هر موتور با asyncio و uvloop")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mix = tuple(int(x) for x in args.mix.split(","))
+    rng = random.Random(args.seed)
+    # همه‌ی موتورها دقیقاً همان خط‌ها را می‌فرستند
+    workloads = [
+        build_workload(args.requests, args.devices, args.products, mix, rng) for _ in range(args.connections)
+    ]
+
+    runs = [("stream", "1"), ("protocol", "1")]
+    if args.compare_loops:
+        runs = [(engine, loop) for engine in ("stream", "protocol") for loop in ("0", "1")]
+
+    # یک DB الگو؛ هر اجرا روی یک کپی تازه از آن
+    template = make_bench_db(args.devices, args.products)
+
+    print(f"{'engine':<10} {'loop':<8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for engine, use_uvloop in runs:
+        db_path = copy_db(template)
+        proc = start_server(args.port, "--engine", engine, env={"USE_UVLOOP": use_uvloop, "SQLITE_PATH": db_path})
+        try:
+            latencies, elapsed = asyncio.run(run_workload(args.port, workloads))
+        finally:
+            stop_server(proc)
+        latencies.sort()
+        total = len(latencies)
+        loop_name = "uvloop" if use_uvloop == "1" else "asyncio"
+        print(
+            f"{engine:<10} {loop_name:<8} {total / elapsed:>9.0f} "
+            f"{percentile(latencies, 0.50) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} "
+            f"{latencies[-1] * 1000:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
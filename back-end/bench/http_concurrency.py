@@ -0,0 +1,238 @@
+# bench/http_concurrency.py
+# پروفایل همگام (gunicorn.py، A.wsgi با مسیر سریع) در برابر پروفایل ASGI (gunicorn_asgi.py، A.asgi با
+# view های async) زیر تعداد زیاد کانکشن هم‌زمان
+#
+#   python bench/http_concurrency.py
+#   python bench/http_concurrency.py --connections 50 --connections 1000 --duration 10 --endpoint st
+#   python bench/http_concurrency.py --write-stall 3 --workers 2
+#
+# هر پروفایل با gunicorn واقعی روی کپی تازه‌ی یک DB یک‌بارمصرف اجرا می‌شود (تعداد worker همان فایل
+# پیکربندی، یا --workers). هر کلاینت یک کانکشن keep-alive است که پشت سر هم درخواست می‌فرستد و
+# endpoint ها را به نوبت می‌چرخاند؛ worker همگام بعد از هر پاسخ کانکشن را می‌بندد و کلاینت دوباره
+# وصل می‌شود. RSS کل پروسه‌های gunicorn (master و worker ها، از /proc) قبل از بار و بیشینه‌اش
+# در طول بار خوانده می‌شود. --write-stall قفل نوشتن SQLite را از شروع هر اجرا چند ثانیه نگه
+# می‌دارد (مثل یک import سنگین در ادمین)؛ خواندن‌ها در این مدت بسته نیستند.
+# خروجی: req/s، p50/p99، خطا (قطع/timeout/5xx)، RSS و افزایش RSS به ازای هر کانکشن.
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import (BACKEND_DIR, SERVER_DEFAULTS, copy_db, make_bench_db, percentile,  # noqa
+                     raise_nofile)
+from http_overhead import ENDPOINTS  # noqa
+
+# پروفایل ⇒ (فایل پیکربندی gunicorn، برنامه)
+PROFILES = {
+    "sync": ("gunicorn.py", "A.wsgi:application"),
+    "asgi": ("gunicorn_asgi.py", "A.asgi:application"),
+}
+PORT = 18081
+
+
+def start_gunicorn(profile: str, db: str, workers: int | None) -> subprocess.Popen:
+    config, app = PROFILES[profile]
+    # cwd خود back/ نیست: آنجا "python -m gunicorn" فایل پیکربندی gunicorn.py را import می‌کند
+    args = [sys.executable, "-m", "gunicorn", "-c", os.path.join("back", config), "--chdir", "back",
+            "-b", f"127.0.0.1:{PORT}", app]
+    if workers:
+        args += ["-w", str(workers)]
+    env = {**SERVER_DEFAULTS, **os.environ, "SQLITE_PATH": db}
+    proc = subprocess.Popen(args, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", PORT), timeout=0.5).close()
+            time.sleep(1)  # بقیه‌ی worker ها هم بالا بیایند
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("gunicorn did not start listening")
+
+
+def stop_gunicorn(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def tree_rss(pid: int) -> tuple[int, int]:
+    """(RSS کل master و فرزندانش به بایت، تعداد پروسه‌ها)."""
+    pids = [pid]
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # فیلد چهارم ppid است؛ نام پروسه (فیلد دوم) ممکن است فاصله داشته باشد
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                    pids.append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    total = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total, len(pids)
+
+
+def hold_write_lock(db: str, seconds: float, ready: threading.Event):
+    conn = sqlite3.connect(db, isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    ready.set()
+    time.sleep(seconds)
+    conn.execute("ROLLBACK")
+    conn.close()
+
+
+async def read_response(reader) -> tuple[int, bool]:
+    """(کد وضعیت، سرور کانکشن را می‌بندد)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("closed")
+    version, code = status_line.split()[:2]
+    length = 0
+    close = version == b"HTTP/1.0"
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection":
+            close = value.strip().lower() == b"close"
+    if length:
+        await reader.readexactly(length)
+    return int(code), close
+
+
+async def client(paths, token: str, deadline: float, timeout: float, stats: dict):
+    requests = itertools.cycle(
+        f"GET {path}?{query} HTTP/1.1\r\nHost: bench\r\nAuthorization: Token {token}\r\n\r\n".encode()
+        for path, query in paths
+    )
+    writer = None
+    while time.monotonic() < deadline:
+        request = next(requests)
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection("127.0.0.1", PORT), timeout)
+            writer.write(request)
+            code, close = await asyncio.wait_for(read_response(reader), timeout)
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            stats["errors"] += 1
+            if writer is not None:
+                writer.close()
+                writer = None
+            await asyncio.sleep(0.05)
+            continue
+        stats["latencies"].append(time.perf_counter() - started)
+        stats["codes"][code] += 1
+        if code >= 500:
+            stats["errors"] += 1
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def sample_rss(pid: int, stop: asyncio.Event, peak: list):
+    while not stop.is_set():
+        peak[0] = max(peak[0], tree_rss(pid)[0])
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(pid: int, connections: int, paths, token: str, duration: float, timeout: float) -> dict:
+    stats = {"latencies": [], "codes": Counter(), "errors": 0, "peak_rss": 0}
+    stop = asyncio.Event()
+    peak = [0]
+    sampler = asyncio.create_task(sample_rss(pid, stop, peak))
+    deadline = time.monotonic() + duration
+    started = time.monotonic()
+    await asyncio.gather(*(client(paths, token, deadline, timeout, stats) for _ in range(connections)))
+    stats["elapsed"] = time.monotonic() - started
+    stop.set()
+    await sampler
+    stats["peak_rss"] = peak[0]
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP concurrency and memory: sync gunicorn vs ASGI profile")
+    parser.add_argument("--profile", action="append", choices=sorted(PROFILES), help="پیش‌فرض هر دو")
+    parser.add_argument("--connections", type=int, action="append", help="تعداد کانکشن هم‌زمان (پیش‌فرض 10، 100، 500)")
+    parser.add_argument("--duration", type=float, default=5.0, help="ثانیه برای هر اجرا")
+    parser.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS),
+                        help="endpoint هایی که هر کلاینت می‌چرخاند (پیش‌فرض st، get، post)")
+    parser.add_argument("--workers", type=int, help="تعداد worker (پیش‌فرض همان فایل پیکربندی)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="timeout هر درخواست در کلاینت")
+    parser.add_argument("--write-stall", type=float, default=0.0, help="ثانیه‌های نگه داشتن قفل نوشتن SQLite")
+    args = parser.parse_args()
+
+    raise_nofile()
+    for key, value in SERVER_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    template = make_bench_db()
+
+    from rest_framework.authtoken.models import Token
+    from accounts.models import User
+
+    token = Token.objects.create(user=User.objects.create(username="bench")).key
+    paths = [ENDPOINTS[name] for name in args.endpoint or ("st", "get", "post")]
+
+    print(f"{'profile':<8} {'conns':>6} {'procs':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} "
+          f"{'idle MB':>8} {'peak MB':>8} {'KB/conn':>8}  codes")
+    for profile in args.profile or PROFILES:
+        for connections in args.connections or (10, 100, 500):
+            db = copy_db(template)
+            proc = start_gunicorn(profile, db, args.workers)
+            try:
+                asyncio.run(run_load(proc.pid, 4, paths, token, 1.0, args.timeout))  # گرم کردن کش‌ها
+                idle_rss, procs = tree_rss(proc.pid)
+                if args.write_stall:
+                    ready = threading.Event()
+                    threading.Thread(target=hold_write_lock, args=(db, args.write_stall, ready), daemon=True).start()
+                    ready.wait()
+                stats = asyncio.run(run_load(proc.pid, connections, paths, token, args.duration, args.timeout))
+            finally:
+                stop_gunicorn(proc)
+            latencies = sorted(stats["latencies"])
+            per_conn = max(0, stats["peak_rss"] - idle_rss) / connections / 1024
+            codes = " ".join(f"{code}:{n}" for code, n in sorted(stats["codes"].items()))
+            print(f"{profile:<8} {connections:>6} {procs:>5} {len(latencies) / stats['elapsed']:>8.0f} "
+                  f"{percentile(latencies, 0.5) * 1e3:>8.1f} {percentile(latencies, 0.99) * 1e3:>8.1f} "
+                  f"{stats['errors']:>7} {idle_rss / 2**20:>8.1f} {stats['peak_rss'] / 2**20:>8.1f} "
+                  f"{per_conn:>8.1f}  {codes}")
+
+
+if __name__ == "__main__":
+    main()
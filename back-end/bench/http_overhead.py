@@ -0,0 +1,96 @@
+# bench/http_overhead.py
+# هزینه‌ی هر درخواست HTTP دستگاه در خود پروسه: پشته‌ی کامل Django/DRF در برابر مسیر سریع WSGI
+# (home/fastpath.py)
+#
+#   python bench/http_overhead.py
+#   python bench/http_overhead.py --requests 20000 --endpoint st --endpoint get
+#
+# بدون شبکه و بدون gunicorn: environ یک درخواست WSGI ساخته و مستقیم به برنامه داده می‌شود، پس
+# عدد به‌دست‌آمده فقط هزینه‌ی middleware ها، resolve کردن URL، احراز هویت، DRF و خود منطق
+# endpoint است. DB یک‌بارمصرف است (make_bench_db)؛ سقف نرخ خاموش است (SERVER_DEFAULTS).
+# خروجی: میکروثانیه برای هر درخواست در هر مسیر و مقدار صرفه‌جویی‌شده.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import SERVER_DEFAULTS, make_bench_db, percentile  # noqa
+
+# endpoint ⇒ (مسیر، query string)؛ get و post روی شماره‌ای که سهمیه‌اش تمام می‌شود (مسیر پرتکرار)
+ENDPOINTS = {
+    "st": ("/home/st/", "d=1"),
+    "get": ("/home/get/", "ph=09120000001"),
+    "re": ("/home/re/", "d=1&re=bench"),
+    "post": ("/home/post/", "ph=09120000001&d=1&p=1"),
+}
+
+
+def make_environ(path: str, query: str, token: str) -> dict:
+    from wsgiref.util import setup_testing_defaults
+
+    environ = {}
+    setup_testing_defaults(environ)
+    environ.update(REQUEST_METHOD="GET", PATH_INFO=path, QUERY_STRING=query,
+                   HTTP_AUTHORIZATION=f"Token {token}")
+    return environ
+
+
+def measure(app, environ: dict, requests: int) -> tuple[list, set]:
+    """زمان هر درخواست (ثانیه، مرتب‌شده) و کدهای وضعیت دیده‌شده."""
+    statuses = set()
+
+    def start_response(status, headers, exc_info=None):
+        statuses.add(status[:3])
+
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        body = app(dict(environ), start_response)
+        b"".join(body)
+        if hasattr(body, "close"):
+            body.close()  # پاسخ Django سیگنال request_finished را اینجا می‌فرستد
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-request overhead: Django/DRF stack vs WSGI fast path")
+    parser.add_argument("--requests", type=int, default=5000, help="تعداد درخواست برای هر endpoint و هر مسیر")
+    parser.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS),
+                        help="فقط این endpoint ها (پیش‌فرض همه)")
+    args = parser.parse_args()
+
+    for key, value in SERVER_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    make_bench_db()
+
+    from django.core.wsgi import get_wsgi_application
+    from rest_framework.authtoken.models import Token
+    from accounts.models import User
+    from home.fastpath import DeviceAPIMiddleware
+    from home.reports import REPORTS
+
+    user = User.objects.create(username="bench")
+    token = Token.objects.create(user=user).key
+    django_app = get_wsgi_application()
+    apps = {"django": django_app, "fastpath": DeviceAPIMiddleware(django_app)}
+
+    print(f"{'endpoint':<9} {'path':<9} {'status':>7} {'mean us':>9} {'p50 us':>8} {'p99 us':>8}")
+    for name in args.endpoint or ENDPOINTS:
+        environ = make_environ(*ENDPOINTS[name], token)
+        means = {}
+        for label, app in apps.items():
+            measure(app, environ, min(200, args.requests))  # گرم کردن کش توکن و ایندکس‌ها
+            timings, statuses = measure(app, environ, args.requests)
+            REPORTS.flush_all()
+            means[label] = sum(timings) / len(timings)
+            print(f"{name:<9} {label:<9} {','.join(sorted(statuses)):>7} {means[label] * 1e6:>9.1f} "
+                  f"{percentile(timings, 0.5) * 1e6:>8.1f} {percentile(timings, 0.99) * 1e6:>8.1f}")
+        saved = means["django"] - means["fastpath"]
+        print(f"{name:<9} {'saved':<9} {'':>7} {saved * 1e6:>9.1f}  ({saved / means['django']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# bench/loadgen.py
+# شبیه‌ساز ناوگان دستگاه‌های فروش برای سرور TCP
+#
+#   python bench/loadgen.py --connections 10000 --duration 60 --procs 4
+#   python bench/loadgen.py --mix 70,20,10 --think-ms 500 --phone-dist zipf --zipf-s 1.2
+#   python bench/loadgen.py --target 10.0.0.5:9224 --connections 2000   # روی یک سرور در حال اجرا
+#
+# هر کانکشن یک دستگاه است: بعد از اتصال ping می‌فرستد، بعد تا پایان زمان با فاصله‌ی تصادفی
+# (توزیع نمایی با میانگین think-ms) یکی از ping / GET / POST را طبق وزن‌های mix می‌فرستد و منتظر
+# پاسخ می‌ماند. شماره تلفن‌ها از یک مخزن ثابت با توزیع یکنواخت یا zipf (چند شماره‌ی پرتکرار)
+# انتخاب می‌شوند. بدون --target یک DB یک‌بارمصرف با دستگاه و محصول مصنوعی ساخته و سرور
+# روی آن اجرا می‌شود. خروجی: throughput و p50/p95/p99/p999 برای هر دستور.
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import make_bench_db, percentile, raise_nofile, start_server, stop_server  # noqa
+
+COMMANDS = ("ping", "get", "post")
+PHONE_BASE = 9_120_000_000
+
+
+class PhonePicker:
+    def __init__(self, pool: int, dist: str, zipf_s: float, rng: random.Random):
+        self.pool = pool
+        self.rng = rng
+        self.cum_weights = None
+        if dist == "zipf":
+            # وزن رتبه‌ی k برابر 1/k^s؛ چند شماره‌ی اول بیشتر درخواست‌ها را می‌گیرند
+            self.cum_weights = list(itertools.accumulate(1 / (k ** zipf_s) for k in range(1, pool + 1)))
+
+    def pick(self) -> int:
+        if self.cum_weights is None:
+            rank = self.rng.randrange(self.pool)
+        else:
+            rank = self.rng.choices(range(self.pool), cum_weights=self.cum_weights)[0]
+        return PHONE_BASE + rank
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {cmd: [] for cmd in COMMANDS}
+        self.statuses = {cmd: {} for cmd in COMMANDS}
+        self.timeouts = 0
+        self.errors = 0
+        self.connect_failures = 0
+
+    def merge(self, other: "Stats"):
+        for cmd in COMMANDS:
+            self.latencies[cmd].extend(other.latencies[cmd])
+            for status, n in other.statuses[cmd].items():
+                self.statuses[cmd][status] = self.statuses[cmd].get(status, 0) + n
+        self.timeouts += other.timeouts
+        self.errors += other.errors
+        self.connect_failures += other.connect_failures
+
+
+async def _device(idx: int, args, rng: random.Random, phones: PhonePicker, stats: Stats,
+                  measure_from: float, deadline: float):
+    device_id = idx % args.devices + 1
+    # باز کردن کانکشن‌ها در طول ramp پخش می‌شود
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    try:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    except OSError:
+        stats.connect_failures += 1
+        return
+    think = args.think_ms / 1000
+    try:
+        kind = "ping"
+        while True:
+            if kind == "ping":
+                line = f"ping,{device_id}\n"
+            elif kind == "get":
+                line = f"1,{phones.pick()}\n"
+            else:
+                line = f"2,{phones.pick()},{device_id},{rng.randint(1, args.products)}\n"
+            started = time.perf_counter()
+            writer.write(line.encode())
+            try:
+                resp = await asyncio.wait_for(reader.readline(), args.timeout)
+            except asyncio.TimeoutError:
+                stats.timeouts += 1
+                return
+            if not resp:
+                stats.errors += 1
+                return
+            now = time.perf_counter()
+            if started >= measure_from:
+                stats.latencies[kind].append(now - started)
+                status = resp.strip().decode(errors="replace")
+                stats.statuses[kind][status] = stats.statuses[kind].get(status, 0) + 1
+            if think > 0:
+                await asyncio.sleep(rng.expovariate(1 / think))
+            if time.perf_counter() >= deadline:
+                return
+            kind = rng.choices(COMMANDS, weights=args.mix)[0]
+    except (ConnectionError, OSError):
+        stats.errors += 1
+    finally:
+        writer.close()
+
+
+async def _run_clients(first: int, count: int, args, seed: int, start_at: float) -> Stats:
+    rng = random.Random(seed)
+    phones = PhonePicker(args.phones, args.phone_dist, args.zipf_s, rng)
+    stats = Stats()
+    # همه‌ی پروسه‌ها از یک لحظه‌ی مشترک شروع می‌کنند (perf_counter بین پروسه‌ها یکسان نیست)
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    now = time.perf_counter()
+    measure_from = now + args.ramp + args.warmup
+    deadline = measure_from + args.duration
+    await asyncio.gather(*(
+        _device(i, args, rng, phones, stats, measure_from, deadline) for i in range(first, first + count)
+    ))
+    return stats
+
+
+def _proc_main(job) -> Stats:
+    first, count, args, seed, start_at = job
+    raise_nofile()
+    return asyncio.run(_run_clients(first, count, args, seed, start_at))
+
+
+def run_load(args) -> Stats:
+    # کانکشن‌ها بین پروسه‌ها تقسیم می‌شوند تا CPU خود loadgen گلوگاه نباشد
+    share, extra = divmod(args.connections, args.procs)
+    start_at = time.time() + 1.0
+    jobs, first = [], 0
+    for p in range(args.procs):
+        count = share + (1 if p < extra else 0)
+        jobs.append((first, count, args, args.seed + p, start_at))
+        first += count
+    if args.procs == 1:
+        results = [_proc_main(jobs[0])]
+    else:
+        with multiprocessing.get_context("fork").Pool(args.procs) as pool:
+            results = pool.map(_proc_main, jobs)
+    total = Stats()
+    for stats in results:
+        total.merge(stats)
+    return total
+
+
+def report(stats: Stats, duration: float):
+    print(f"{'cmd':<6} {'count':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'p999 ms':>8} {'max ms':>8}  statuses")
+    all_latencies = []
+    for cmd in COMMANDS:
+        lat = sorted(stats.latencies[cmd])
+        all_latencies.extend(lat)
+        if not lat:
+            continue
+        statuses = " ".join(f"{k}={v}" for k, v in sorted(stats.statuses[cmd].items()))
+        print(
+            f"{cmd:<6} {len(lat):>9} {len(lat) / duration:>9.0f} "
+            + " ".join(f"{percentile(lat, q) * 1000:>8.2f}" for q in (0.50, 0.95, 0.99, 0.999))
+            + f" {lat[-1] * 1000:>8.2f}  {statuses}"
+        )
+    all_latencies.sort()
+    if all_latencies:
+        print(
+            f"{'all':<6} {len(all_latencies):>9} {len(all_latencies) / duration:>9.0f} "
+            + " ".join(f"{percentile(all_latencies, q) * 1000:>8.2f}" for q in (0.50, 0.95, 0.99, 0.999))
+            + f" {all_latencies[-1] * 1000:>8.2f}"
+        )
+    print(f"timeouts={stats.timeouts} errors={stats.errors} connect_failures={stats.connect_failures}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="vending fleet load generator")
+    parser.add_argument("--connections", type=int, default=1000, help="تعداد دستگاه (کانکشن) شبیه‌سازی‌شده")
+    parser.add_argument("--duration", type=float, default=30, help="ثانیه‌ی اندازه‌گیری")
+    parser.add_argument("--ramp", type=float, default=5, help="ثانیه؛ باز شدن کانکشن‌ها در این بازه پخش می‌شود")
+    parser.add_argument("--warmup", type=float, default=2, help="ثانیه بعد از ramp که اندازه‌گیری نمی‌شود")
+    parser.add_argument("--mix", default="50,30,20", help="وزن ping,GET,POST")
+    parser.add_argument("--think-ms", type=float, default=1000, help="میانگین فاصله‌ی دو درخواست هر دستگاه")
+    parser.add_argument("--phones", type=int, default=100_000, help="اندازه‌ی مخزن شماره تلفن")
+    parser.add_argument("--phone-dist", choices=("uniform", "zipf"), default="uniform")
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=10, help="ثانیه؛ حداکثر صبر برای یک پاسخ")
+    parser.add_argument("--procs", type=int, default=1, help="تعداد پروسه‌های loadgen")
+    parser.add_argument("--target", help="host:port سرور در حال اجرا (بدون آن سرور محلی با DB تازه)")
+    parser.add_argument("--port", type=int, default=19224, help="پورت سرور محلی")
+    parser.add_argument("--server-arg", action="append", default=[],
+                        help="آرگومان اضافه برای سرور محلی، مثلاً --server-arg=--engine=protocol")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    args.mix = tuple(int(x) for x in args.mix.split(","))
+    raise_nofile()
+
+    proc = None
+    if args.target:
+        args.host, port = args.target.rsplit(":", 1)
+        args.port = int(port)
+    else:
+        args.host = "127.0.0.1"
+        db_path = make_bench_db(args.devices, args.products)
+        proc = start_server(args.port, *args.server_arg, env={"SQLITE_PATH": db_path})
+    try:
+        stats = run_load(args)
+    finally:
+        if proc is not None:
+            stop_server(proc)
+    report(stats, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# bench/replay.py
+# پخش دوباره‌ی ترافیک ضبط‌شده (CAPTURE_FILE در main_asyncio_3.py) روی یک سرور آزمایشی
+#
+#   CAPTURE_FILE=/var/tmp/vend.cap python main_asyncio_3.py          # ضبط روی سرور واقعی
+#   python bench/replay.py /var/tmp/vend.cap                         # 1× روی سرور محلی با DB تازه
+#   python bench/replay.py /var/tmp/vend.cap --speed 10              # 10 برابر سریع‌تر
+#   python bench/replay.py /var/tmp/vend.cap.0 /var/tmp/vend.cap.1 --speed 0 --target 127.0.0.1:9224
+#
+# هر کانکشن ضبط‌شده یک کانکشن جدا می‌شود و خط‌هایش دقیقاً به همان ترتیب فرستاده می‌شوند.
+# speed > 0: هر خط در زمان ضبط‌شده‌اش تقسیم بر speed فرستاده می‌شود (الگوی انفجاری بعد از قطعی
+# شبکه حفظ می‌شود). speed = 0: همه‌ی کانکشن‌ها هم‌زمان و هر کدام با حداکثر سرعت.
+# به‌طور پیش‌فرض مثل دستگاه واقعی قبل از خط بعدی منتظر پاسخ می‌ماند (بی‌پاسخ بعد از --timeout)؛
+# با --no-wait خط‌ها بدون صبر فرستاده و پاسخ‌ها فقط شمرده می‌شوند.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import BACKEND_DIR, make_bench_db, percentile, raise_nofile, start_server, stop_server  # noqa
+
+sys.path.insert(0, BACKEND_DIR)
+from traffic_capture import read_capture  # noqa
+
+COMMANDS = {b"ping": "ping", b"1": "get", b"2": "post", b"3": "report"}
+
+
+class Session:
+    __slots__ = ('lines', 'end')
+
+    def __init__(self):
+        self.lines = []  # (زمان، خط)
+        self.end = None  # زمان بسته‌شدن، اگر ضبط شده باشد
+
+
+def load_sessions(paths: list[str]) -> list[Session]:
+    sessions = []
+    for idx, path in enumerate(paths):
+        open_sessions = {}
+        for t, conn_id, line in read_capture(path):
+            key = (idx, conn_id)
+            if line is None:
+                sess = open_sessions.pop(key, None)
+                if sess is not None:
+                    sess.end = t
+                continue
+            sess = open_sessions.get(key)
+            if sess is None:
+                sess = open_sessions[key] = Session()
+                sessions.append(sess)
+            sess.lines.append((t, line))
+    return sessions
+
+
+def _cmd(line: bytes) -> str:
+    return COMMANDS.get(line.split(b",", 1)[0].lower(), "other")
+
+
+def _ids_seen(sessions: list[Session]) -> tuple[int, int]:
+    """بیشترین شناسه‌ی دستگاه و محصول در ضبط؛ برای ساختن DB آزمایشی."""
+    devices = products = 1
+    for sess in sessions:
+        for _, line in sess.lines:
+            parts = line.split(b",")
+            try:
+                if parts[0].lower() == b"ping" and len(parts) == 2:
+                    devices = max(devices, int(parts[1]))
+                elif parts[0] == b"2" and len(parts) == 4:
+                    devices = max(devices, int(parts[2]))
+                    products = max(products, int(parts[3]))
+                elif parts[0] == b"3" and len(parts) >= 3:
+                    devices = max(devices, int(parts[1]))
+            except ValueError:
+                pass
+    return devices, products
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.lateness = []  # فاصله‌ی زمان واقعی ارسال از زمان برنامه‌ریزی‌شده
+        self.sent = 0
+        self.errors = 0
+
+    def add(self, cmd: str, status: str, latency: float | None):
+        by_cmd = self.statuses.setdefault(cmd, {})
+        by_cmd[status] = by_cmd.get(status, 0) + 1
+        if latency is not None:
+            self.latencies.setdefault(cmd, []).append(latency)
+
+
+async def _replay(sess: Session, t0: float, start: float, args, stats: Stats):
+    loop = asyncio.get_running_loop()
+    speed = args.speed
+
+    async def wait_until(t: float) -> float:
+        if speed <= 0:
+            return 0.0
+        due = start + (t - t0) / speed
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return max(0.0, loop.time() - due)
+
+    await wait_until(sess.lines[0][0])
+    try:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    except OSError:
+        stats.errors += 1
+        return
+    counter = None
+    if args.no_wait:
+        counter = asyncio.create_task(_count_responses(reader, stats))
+    try:
+        for t, line in sess.lines:
+            stats.lateness.append(await wait_until(t))
+            started = time.perf_counter()
+            writer.write(line + b"\n")
+            stats.sent += 1
+            if args.no_wait:
+                await writer.drain()
+                continue
+            try:
+                resp = await asyncio.wait_for(reader.readline(), args.timeout)
+            except asyncio.TimeoutError:
+                stats.add(_cmd(line), "none", None)
+                continue
+            if not resp:
+                stats.errors += 1
+                return
+            stats.add(_cmd(line), resp.strip().decode(errors="replace"), time.perf_counter() - started)
+        if sess.end is not None:
+            await wait_until(sess.end)
+        if args.no_wait:
+            writer.write_eof()
+            await asyncio.wait_for(counter, args.timeout)
+    except (ConnectionError, OSError, asyncio.TimeoutError):
+        stats.errors += 1
+    finally:
+        if counter is not None:
+            counter.cancel()
+        writer.close()
+
+
+async def _count_responses(reader: asyncio.StreamReader, stats: Stats):
+    # در حالت --no-wait پاسخ‌ها به خط‌ها نسبت داده نمی‌شوند (بعضی خط‌ها پاسخ ندارند)
+    while True:
+        resp = await reader.readline()
+        if not resp:
+            return
+        stats.add("all", resp.strip().decode(errors="replace"), None)
+
+
+async def replay_all(sessions: list[Session], args) -> tuple[Stats, float]:
+    stats = Stats()
+    t0 = min(sess.lines[0][0] for sess in sessions)
+    loop = asyncio.get_running_loop()
+    start = loop.time() + 0.5
+    begun = time.perf_counter()
+    await asyncio.gather(*(_replay(sess, t0, start, args, stats) for sess in sessions))
+    return stats, time.perf_counter() - begun
+
+
+def report(stats: Stats, elapsed: float, captured: float):
+    print(f"sent={stats.sent} in {elapsed:.2f}s ({stats.sent / elapsed:.0f} lines/s), "
+          f"captured span {captured:.2f}s, errors={stats.errors}")
+    lateness = sorted(stats.lateness)
+    if lateness:
+        print(f"schedule lag ms: p50={percentile(lateness, 0.5) * 1000:.2f} "
+              f"p99={percentile(lateness, 0.99) * 1000:.2f} max={lateness[-1] * 1000:.2f}")
+    print(f"{'cmd':<6} {'count':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'p999 ms':>8} {'max ms':>8}  statuses")
+    for cmd, by_status in sorted(stats.statuses.items()):
+        lat = sorted(stats.latencies.get(cmd, []))
+        statuses = " ".join(f"{k}={v}" for k, v in sorted(by_status.items()))
+        count = sum(by_status.values())
+        if lat:
+            pcts = " ".join(f"{percentile(lat, q) * 1000:>8.2f}" for q in (0.50, 0.95, 0.99, 0.999))
+            print(f"{cmd:<6} {count:>9} {pcts} {lat[-1] * 1000:>8.2f}  {statuses}")
+        else:
+            print(f"{cmd:<6} {count:>9} {'-':>8} {'-':>8} {'-':>8} {'-':>8} {'-':>8}  {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay captured device traffic")
+    parser.add_argument("captures", nargs="+", help="فایل(های) ضبط؛ برای چند worker همه‌ی فایل‌ها")
+    parser.add_argument("--speed", type=float, default=1.0, help="ضریب سرعت؛ 0 = حداکثر سرعت")
+    parser.add_argument("--no-wait", action="store_true", help="بدون صبر برای پاسخ هر خط")
+    parser.add_argument("--timeout", type=float, default=2.0, help="ثانیه؛ خط بی‌پاسخ بعد از این زمان")
+    parser.add_argument("--target", help="host:port سرور در حال اجرا (بدون آن سرور محلی با DB تازه)")
+    parser.add_argument("--port", type=int, default=19224, help="پورت سرور محلی")
+    parser.add_argument("--server-arg", action="append", default=[],
+                        help="آرگومان اضافه برای سرور محلی، مثلاً --server-arg=--engine=protocol")
+    args = parser.parse_args()
+
+    sessions = [s for s in load_sessions(args.captures) if s.lines]
+    if not sessions:
+        sys.exit("capture is empty")
+    first = min(s.lines[0][0] for s in sessions)
+    last = max(max(s.lines[-1][0], s.end or 0) for s in sessions)
+    print(f"{len(sessions)} connections, {sum(len(s.lines) for s in sessions)} lines")
+    raise_nofile()
+
+    proc = None
+    if args.target:
+        args.host, port = args.target.rsplit(":", 1)
+        args.port = int(port)
+    else:
+        args.host = "127.0.0.1"
+        devices, products = _ids_seen(sessions)
+        db_path = make_bench_db(devices, products)
+        proc = start_server(args.port, *args.server_arg, env={"SQLITE_PATH": db_path})
+    try:
+        stats, elapsed = asyncio.run(replay_all(sessions, args))
+    finally:
+        if proc is not None:
+            stop_server(proc)
+    report(stats, elapsed, last - first)
+
+
+if __name__ == "__main__":
+    main()
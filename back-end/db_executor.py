@@ -0,0 +1,146 @@
+# db_executor.py
+# لایه‌ی اجرای ORM برای سرور TCP
+#
+# sync_to_async به‌طور پیش‌فرض (thread_sensitive=True) همه‌ی کوئری‌ها را روی یک thread مشترک
+# می‌برد؛ یعنی یک نوشتن کند، همه‌ی ping و GET ها را پشت خودش نگه می‌دارد.
+# اینجا دو استخر جدا داریم:
+#   - writer: دقیقاً یک thread؛ همه‌ی تغییرات (INSERT/UPDATE) پشت سر هم اجرا می‌شوند
+#   - reader: چند thread با کانکشن فقط‌خواندنی (PRAGMA query_only) برای lookup ها
+# هر thread کانکشن Django خودش را دارد (کانکشن‌ها thread-local هستند). با SQLite در حالت WAL
+# (اختیاری، wal=True) خواندن‌ها هم‌زمان با تنها نویسنده اجرا می‌شوند و پشت آن صف نمی‌کشند.
+# WAL پیش‌فرض خاموش است: روی فایل DB می‌ماند و اگر همان فایل از دو mount جدا (مثلاً bind-mount
+# تک‌فایل در docker-compose.yml و سرور TCP روی میزبان) باز شود، فایل‌های -wal/-shm مشترک نیستند
+# و نوشته‌ها گم یا DB خراب می‌شود.
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.db import connection
+
+
+def _setup_connection(read_only: bool, wal: bool):
+    connection.ensure_connection()
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if wal:
+            # WAL روی خود فایل DB ذخیره می‌شود و برای بقیه‌ی پروسه‌ها هم اعمال است
+            cursor.execute("PRAGMA journal_mode=WAL")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+
+
+class DBPool:
+    def __init__(self, name: str, workers: int, read_only: bool, wal: bool, wait_hist=None, run_hist=None):
+        self.name = name
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix=f"db-{name}",
+            initializer=_setup_connection,
+            initargs=(read_only, wal),
+        )
+        self._lock = threading.Lock()
+        self.queued = 0        # ثبت‌شده ولی هنوز شروع نشده (عمق صف)
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0     # پیش از شروع لغو شد (مثلاً مهلت دستور تمام شد) و هرگز اجرا نشد
+        self.wait_total = 0.0  # ثانیه
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_ewma = 0.0    # میانگین نمایی زمان اجرا (برای تخمین انتظار)
+        # هیستوگرام‌های اختیاری (tcp_metrics.Histogram)؛ فقط زیر self._lock به‌روز می‌شوند
+        self.wait_hist = wait_hist
+        self.run_hist = run_hist
+
+    def _job(self, enqueued: float, fn, args, kwargs):
+        started = time.perf_counter()
+        waited = started - enqueued
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+            if self.wait_hist is not None:
+                self.wait_hist.observe(waited)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.run_total += elapsed
+                self.run_ewma += (elapsed - self.run_ewma) * 0.1
+                if self.run_hist is not None:
+                    self.run_hist.observe(elapsed)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        ثبت کار و برگرداندن Future خود ThreadPoolExecutor. cancel() روی آن فقط وقتی موفق است
+        که کار هنوز شروع نشده (و بعد از آن هرگز اجرا نمی‌شود)؛ False یعنی کار شروع شده یا تمام شده.
+        """
+        with self._lock:
+            self.queued += 1
+        cf = self._executor.submit(self._job, time.perf_counter(), fn, args, kwargs)
+        cf.add_done_callback(self._on_done)
+        return cf
+
+    def _on_done(self, cf: Future):
+        if cf.cancelled():
+            with self._lock:
+                self.queued -= 1
+                self.cancelled += 1
+
+    async def run(self, fn, *args, **kwargs):
+        # لغو await (مثلاً با asyncio.timeout) کار شروع‌نشده را هم از صف بیرون می‌برد؛ کاری که
+        # شروع شده تا آخر روی thread اجرا می‌شود و فقط نتیجه‌اش دور ریخته می‌شود
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def estimated_wait(self) -> float:
+        """تخمین (ثانیه) انتظار یک کار تازه: کارهای جلویی (در صف و در حال اجرا) تقسیم بر تعداد thread."""
+        return (self.queued + self.running) * self.run_ewma / self.workers
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = self.completed or 1
+            stats = {
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'wait_avg_ms': self.wait_total / done * 1000,
+                'wait_max_ms': self.wait_max * 1000,
+                'run_avg_ms': self.run_total / done * 1000,
+            }
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class DBExecutor:
+    def __init__(self, readers: int = 4, wal: bool = False, wait_hist=None, run_hist=None):
+        # wait_hist / run_hist: هیستوگرام با برچسب pool (اختیاری)
+        def hists(name):
+            return {
+                'wait_hist': wait_hist.labels(pool=name) if wait_hist is not None else None,
+                'run_hist': run_hist.labels(pool=name) if run_hist is not None else None,
+            }
+        self.writer = DBPool("writer", 1, read_only=False, wal=wal, **hists("writer"))
+        self.reader = DBPool("reader", readers, read_only=True, wal=False, **hists("reader"))
+
+    async def read(self, fn, *args, **kwargs):
+        return await self.reader.run(fn, *args, **kwargs)
+
+    async def write(self, fn, *args, **kwargs):
+        return await self.writer.run(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {'writer': self.writer.stats(), 'reader': self.reader.stats()}
+
+    def shutdown(self):
+        self.writer.shutdown()
+        self.reader.shutdown()
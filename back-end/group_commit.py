@@ -0,0 +1,98 @@
+# group_commit.py
+# نویسنده‌ی دسته‌ای (group commit) برای سرور TCP
+#
+# به‌جای اینکه هر کانکشن یک objects.create جدا (یک تراکنش و یک fsync) بزند، ردیف‌ها در صف
+# جمع می‌شوند و یک تسک واحد هر max_delay ثانیه یا هر max_batch ردیف (هر کدام زودتر)
+# همه را با یک bulk_create در یک تراکنش می‌نویسد. هر فراخوان write() فقط بعد از commit
+# شدن دسته‌ی خودش برمی‌گردد.
+import asyncio
+
+from django.db import transaction
+
+
+class GroupCommitWriter:
+    def __init__(self, db, model, max_batch: int = 200, max_delay: float = 0.01):
+        self.db = db  # DBExecutor (db_executor.py)؛ نوشتن‌ها روی thread نویسنده
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._buf: list[tuple[dict, asyncio.Future]] = []
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        self.batches = 0
+        self.rows = 0
+        self.failed = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._buf)
+
+    async def write(self, **fields):
+        """یک ردیف به دسته‌ی بعدی اضافه می‌کند و تا commit شدن آن صبر می‌کند."""
+        fut = asyncio.get_running_loop().create_future()
+        self._buf.append((fields, fut))
+        self._has_items.set()
+        if len(self._buf) >= self.max_batch:
+            self._full.set()
+        await fut
+
+    # ------------------ سمت DB ------------------
+    def _commit_sync(self, rows: list[dict]) -> list:
+        """
+        کل دسته در یک تراکنش؛ اگر دسته خطا داد، ردیف‌ها تک‌تک نوشته می‌شوند تا فقط
+        ردیف خراب شکست بخورد. برمی‌گرداند: برای هر ردیف None یا exception.
+        """
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create([self.model(**f) for f in rows])
+            return [None] * len(rows)
+        except Exception:
+            results = []
+            for f in rows:
+                try:
+                    self.model.objects.create(**f)
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+            return results
+
+    async def _commit(self, batch):
+        try:
+            results = await self.db.write(self._commit_sync, [f for f, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, fut), err in zip(batch, results):
+            if fut.done():
+                continue
+            if err is None:
+                fut.set_result(None)
+            else:
+                self.failed += 1
+                fut.set_exception(err)
+        self.batches += 1
+        self.rows += len(batch)
+
+    def _take(self):
+        batch = self._buf[:self.max_batch]
+        del self._buf[:self.max_batch]
+        if len(self._buf) < self.max_batch:
+            self._full.clear()
+        if not self._buf:
+            self._has_items.clear()
+        return batch
+
+    async def run(self):
+        try:
+            while True:
+                await self._has_items.wait()
+                if len(self._buf) < self.max_batch:
+                    # صبر تا پر شدن دسته یا گذشتن max_delay
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.max_delay)
+                    except asyncio.TimeoutError:
+                        pass
+                await self._commit(self._take())
+        finally:
+            # نوشتن باقی‌مانده‌ها هنگام خاموش‌شدن
+            while self._buf:
+                await self._commit(self._take())
@@ -4,10 +4,15 @@ import sys
 import django
 import asyncio
 import time
-from asgiref.sync import sync_to_async
-from django.db import transaction, IntegrityError
-from django.db.models import F
-from datetime import datetime, timedelta, timezone
+import signal
+import socket
+import selectors
+import argparse
+import itertools
+import traceback
+import subprocess
+from collections import OrderedDict, deque
+from types import CoroutineType
 
 # --------- بارگذاری محیط Django ----------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,7 +21,25 @@ sys.path.append(os.path.join(BASE_DIR, "back"))
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "A.settings")
 django.setup()
 
-from home.models import Product, Device, RowData, TemproryData  # noqa
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from home.models import ChangeFeed, Product, Device, RowData, TemproryData  # noqa
+from home.quota import claim_gift  # noqa
+from home.ratelimit import DEVICE_LIMITER, PHONE_LIMITER  # noqa
+from home.changefeed import changes_since, latest_change_id  # noqa
+from home.indexes import INDEXES  # noqa
+from home.phone import normalize_phone  # noqa
+from home.reports import REPORTS  # noqa
+from quota_ledger import QuotaLedger  # noqa
+from group_commit import GroupCommitWriter  # noqa
+from db_executor import DBExecutor  # noqa
+from timing_wheel import TimingWheel  # noqa
+from tcp_log import StructLogger, parse_sample  # noqa
+from tcp_metrics import Registry, serve_metrics  # noqa
+from traffic_capture import CaptureWriter  # noqa
 
 HOST = "0.0.0.0"
 PORT = 9224
@@ -27,23 +50,210 @@ CACHE_TTL = 24 * 3600  # ثانیه: 24 ساعت
 ID_PING = "ping"
 ID_GET = "1"
 ID_POST = "2"
+ID_REPORT = "3"  # 3,<device_id>,<متن گزارش> (متن می‌تواند کاما داشته باشد)
+
+# لاگ ساخت‌یافته (tcp_log.py): قالب‌بندی و نوشتن روی یک thread جدا، بدون مسدودکردن event loop
+# LOG_SAMPLE نرخ نمونه‌برداری برای هر سطح یا دستور، مثلاً "ping=0.01,get=0.1,warn=1"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # json یا text
+LOG_SAMPLE = parse_sample(os.environ.get("LOG_SAMPLE", ""))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))  # بعد از این، رکوردها دور ریخته می‌شوند
+LOG = StructLogger(level=LOG_LEVEL, fmt=LOG_FORMAT, sample=LOG_SAMPLE, max_queue=LOG_QUEUE_SIZE)
+
+# متریک‌های Prometheus (tcp_metrics.py) روی http://METRICS_HOST:METRICS_PORT/metrics
+# با چند worker، worker شماره‌ی i روی METRICS_PORT + i گوش می‌دهد؛ METRICS_PORT=0 یعنی خاموش
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9325"))
+METRICS = Registry()
+M_CONN_ACTIVE = METRICS.gauge("tcp_connections_active", "Open device connections")
+M_CONN_ACCEPTED = METRICS.counter("tcp_connections_accepted_total", "Accepted device connections")
+M_CONN_CLOSED = METRICS.counter("tcp_connections_closed_total", "Closed device connections")
+M_REQUESTS = METRICS.counter("tcp_requests_total", "Answered lines by command and status", ("cmd", "status"))
+M_LATENCY = METRICS.histogram("tcp_request_latency_seconds", "Line received to response written", ("cmd",))
+M_CACHE = METRICS.counter(
+    "tcp_id_cache_lookups_total", "DEVICE_IDS/PRODUCT_IDS lookups (negative = known unknown id)",
+    ("cache", "result"),
+)
+M_DB_WAIT = METRICS.histogram("tcp_db_wait_seconds", "Time a DB job waited for a free thread", ("pool",))
+M_DB_RUN = METRICS.histogram("tcp_db_run_seconds", "Time a DB job ran on its thread", ("pool",))
 
 # Idle timeout برای جمع‌کردن کانکشن‌های غیرفعال (۵ دقیقه)
-IDLE_TIMEOUT_SECONDS = 300.0  # اگر خواستی 4 دقیقه: 240.0
+IDLE_TIMEOUT_SECONDS = float(os.environ.get("IDLE_TIMEOUT_SECONDS", "300"))  # اگر خواستی 4 دقیقه: 240
+# یک timing wheel برای همه‌ی کانکشن‌ها (timing_wheel.py)؛ دقت بستن = یک tick
+IDLE_TICK_SECONDS = 1.0
+IDLE_REAPER = TimingWheel(IDLE_TIMEOUT_SECONDS, IDLE_TICK_SECONDS)
+
+# اجرای ORM (db_executor.py): یک thread نویسنده + چند thread خواننده
+# SQLITE_WAL=1 فقط وقتی همه‌ی پروسه‌ها (Django و این سرور) فایل DB را از یک دایرکتوری مشترک باز
+# می‌کنند؛ با bind-mount تک‌فایل (docker-compose.yml) امن نیست و WAL روی فایل می‌ماند
+DB_READERS = int(os.environ.get("DB_READERS", "4"))
+SQLITE_WAL = os.environ.get("SQLITE_WAL", "0") == "1"
+DB_STATS_INTERVAL = float(os.environ.get("DB_STATS_INTERVAL", "60"))  # ثانیه؛ 0 = خاموش
+DB = DBExecutor(DB_READERS, wal=SQLITE_WAL, wait_hist=M_DB_WAIT, run_hist=M_DB_RUN)
+
+# دفتر سهمیه درون‌حافظه (quota_ledger.py). با USE_QUOTA_LEDGER=0 مثل قبل مستقیم از DB خوانده می‌شود
+USE_QUOTA_LEDGER = os.environ.get("USE_QUOTA_LEDGER", "1") == "1"
+LEDGER_FLUSH_INTERVAL = float(os.environ.get("LEDGER_FLUSH_INTERVAL", "0.5"))  # ثانیه
+LEDGER_SYNC_INTERVAL = float(os.environ.get("LEDGER_SYNC_INTERVAL", "30"))     # ثانیه
+LEDGER = QuotaLedger(DB, LOG, MAX_GIFT, LEDGER_FLUSH_INTERVAL) if USE_QUOTA_LEDGER else None
+# asyncio.Event؛ بعد از handover، از خروج نسل قبلی تا بارگذاری دفتر: مصرف‌های تازه منتظر می‌مانند
+_LEDGER_PENDING = None
+
+# group commit برای RowData (group_commit.py): هر چند میلی‌ثانیه یا هر چند ردیف، هر کدام زودتر
+ROWDATA_BATCH_SIZE = int(os.environ.get("ROWDATA_BATCH_SIZE", "200"))
+ROWDATA_BATCH_DELAY_MS = float(os.environ.get("ROWDATA_BATCH_DELAY_MS", "10"))
+ROWDATA_WRITER = GroupCommitWriter(DB, RowData, ROWDATA_BATCH_SIZE, ROWDATA_BATCH_DELAY_MS / 1000)
+
+# pipelining: حداکثر تعداد درخواست در حال اجرای هم‌زمان برای هر کانکشن (1 = خاموش، مثل قبل)
+PIPELINE_DEPTH = int(os.environ.get("PIPELINE_DEPTH", "1"))
+
+# کنترل پذیرش: سقف درخواست‌های نیازمند DB که هم‌زمان در جریان‌اند (کل سرور و هر دستگاه)، و بودجه‌ی
+# زمان انتظار تخمینی صف DB. بیش از این‌ها فوراً 503 (مشغول) می‌گیرد تا دستگاه عقب بکشد؛ ping هیچ‌وقت رد نمی‌شود
+ADMIT_MAX_INFLIGHT = int(os.environ.get("ADMIT_MAX_INFLIGHT", "1024"))
+ADMIT_MAX_PER_DEVICE = int(os.environ.get("ADMIT_MAX_PER_DEVICE", "8"))
+ADMIT_WAIT_BUDGET_MS = float(os.environ.get("ADMIT_WAIT_BUDGET_MS", "1000"))  # 0 = بدون بودجه
+
+# مهلت هر دستوری که به DB می‌رسد (میلی‌ثانیه، از پذیرش تا آماده‌شدن پاسخ)؛ بعد از آن 504 تا
+# دستگاه پشت یک SQLite قفل‌شده نماند و دوباره‌کاری‌اش بار را دو برابر نکند. کار DB که هنوز
+# شروع نشده همراه لغو از صف بیرون می‌رود. 0 = بدون مهلت
+DEADLINE_MS = {
+    "ping": float(os.environ.get("DEADLINE_PING_MS", "2000")),
+    "get": float(os.environ.get("DEADLINE_GET_MS", "2000")),
+    "post": float(os.environ.get("DEADLINE_POST_MS", "5000")),
+    "report": float(os.environ.get("DEADLINE_REPORT_MS", "2000")),
+}
+
+# موتور سرور: "stream" (handle_client با StreamReader) یا "protocol" (DeviceProtocol)
+TCP_ENGINE = os.environ.get("TCP_ENGINE", "stream")
+USE_UVLOOP = os.environ.get("USE_UVLOOP", "1") == "1"
+MAX_LINE_BYTES = 4096          # موتور protocol: حداکثر طول یک خط
+PROTOCOL_MAX_BACKLOG = 64      # موتور protocol: بعد از این تعداد خط در صف، خواندن متوقف می‌شود
+
+# حالت چندپروسه‌ای: چند worker روی همان پورت با SO_REUSEPORT (یا --workers)
+TCP_WORKERS = int(os.environ.get("TCP_WORKERS", "1"))
+WORKER_RESTART_DELAY = 1.0  # ثانیه؛ فاصله‌ی راه‌اندازی دوباره‌ی worker کرش‌کرده
+
+# خاموش‌شدن آرام با SIGTERM/SIGINT: پذیرش متوقف می‌شود، خط‌های در جریان جواب می‌گیرند، کانکشن‌ها با
+# نرخ کنترل‌شده بسته می‌شوند (نه همه با هم، تا ناوگان یک‌جا دوباره وصل نشود) و بعد نوشتن‌ها flush می‌شوند
+DRAIN_SECONDS = float(os.environ.get("DRAIN_SECONDS", "30"))         # بعد از این، باقی‌مانده‌ها بسته می‌شوند
+DRAIN_CLOSE_RATE = float(os.environ.get("DRAIN_CLOSE_RATE", "500"))  # کانکشن در ثانیه (حداقل)
+# hot reload با SIGUSR2: یک پروسه‌ی جدید از همین فایل اجرا می‌شود و سوکت listen را به ارث می‌برد
+# (LISTEN_FD)؛ در حالت چند worker هر دو نسل با SO_REUSEPORT روی پورت‌اند. وقتی پروسه‌ی جدید آماده شد
+# پروسه‌ی قدیمی drain می‌کند. HANDOVER_FD یک socketpair بین دو نسل است: «ready» از جدید به قدیم،
+# و بسته‌شدنش یعنی پروسه‌ی قدیمی خارج شد.
+HANDOVER_TIMEOUT = float(os.environ.get("HANDOVER_TIMEOUT", "60"))  # ثانیه؛ صبر برای آماده‌شدن نسل جدید
+PID_FILE = os.environ.get("PID_FILE", "")  # برای systemd (PIDFile=) و اسکریپت‌های deploy
+_LISTEN_FD = os.environ.pop("LISTEN_FD", None)
+_HANDOVER_FD = os.environ.pop("HANDOVER_FD", None)
+
+# feed تغییرات (home/changefeed.py): ذخیره/حذف Device و Product در ادمین ظرف چند ثانیه اعمال می‌شود
+CHANGE_FEED_INTERVAL = float(os.environ.get("CHANGE_FEED_INTERVAL", "1.0"))  # ثانیه
+# کش منفی برای شناسه‌های ناشناخته تا یک دستگاه خراب با ping,9999 مدام DB را نزند
+NEGATIVE_CACHE_TTL = float(os.environ.get("NEGATIVE_CACHE_TTL", "30"))  # ثانیه
+NEGATIVE_CACHE_SIZE = 10_000
+
+# ضبط همه‌ی خط‌های ورودی (traffic_capture.py) برای bench/replay.py؛ خالی = خاموش
+# با چند worker، هر worker در فایل جدای "<CAPTURE_FILE>.<worker>" می‌نویسد
+CAPTURE_FILE = os.environ.get("CAPTURE_FILE", "")
+CAPTURE = None  # در main ساخته می‌شود
+
+# متریک‌هایی که هنگام scrape از آمار خود اجزا خوانده می‌شوند
+METRICS.callback("tcp_db_queued", "DB jobs waiting for a thread", "gauge",
+                 lambda: {(n,): st['queued'] for n, st in DB.stats().items()}, ("pool",))
+METRICS.callback("tcp_db_running", "DB jobs running", "gauge",
+                 lambda: {(n,): st['running'] for n, st in DB.stats().items()}, ("pool",))
+METRICS.callback("tcp_db_cancelled_total", "DB jobs dropped from the queue before they started", "counter",
+                 lambda: {(n,): st['cancelled'] for n, st in DB.stats().items()}, ("pool",))
+METRICS.callback("tcp_reaper_tracked", "Connections tracked by the idle reaper", "gauge",
+                 lambda: IDLE_REAPER.tracked)
+METRICS.callback("tcp_reaper_reaped_total", "Connections closed for idleness", "counter",
+                 lambda: IDLE_REAPER.reaped)
+METRICS.callback("tcp_rowdata_pending", "RowData rows waiting for the next group commit", "gauge",
+                 lambda: ROWDATA_WRITER.pending)
+METRICS.callback("tcp_rowdata_batches_total", "RowData group commits", "counter",
+                 lambda: ROWDATA_WRITER.batches)
+METRICS.callback("tcp_rowdata_failed_total", "RowData rows that failed to commit", "counter",
+                 lambda: ROWDATA_WRITER.failed)
+METRICS.callback("tcp_ledger_flushes_total", "Quota ledger flushes", "counter",
+                 lambda: LEDGER.flushes if LEDGER is not None else 0)
+METRICS.callback("tcp_log_dropped_total", "Log records dropped because the log queue was full", "counter",
+                 lambda: LOG.dropped)
+METRICS.callback("tcp_log_queued", "Log records waiting to be written", "gauge",
+                 lambda: LOG.stats()['queued'])
+M_SHED = METRICS.counter("tcp_shed_total", "Lines answered 503 by admission control", ("reason",))
+METRICS.callback("tcp_admission_inflight", "DB-bound requests in flight", "gauge", lambda: _inflight)
+METRICS.callback("tcp_rate_limited_total", "Lines answered 429 by the token buckets (home/ratelimit.py)",
+                 "counter", lambda: {("device",): DEVICE_LIMITER.rejected, ("phone",): PHONE_LIMITER.rejected},
+                 ("key",))
+METRICS.callback("tcp_rate_limit_buckets", "Live token buckets", "gauge",
+                 lambda: {("device",): len(DEVICE_LIMITER), ("phone",): len(PHONE_LIMITER)}, ("key",))
+M_DEADLINE = METRICS.counter("tcp_deadline_exceeded_total", "Lines answered 504 after DEADLINE_*_MS", ("cmd",))
+M_BLOCKED = METRICS.counter("tcp_blocked_total", "Lines refused by the in-memory indexes (home/indexes.py)",
+                           ("reason",))
+METRICS.callback("tcp_index_size", "Entries in the in-memory indexes", "gauge",
+                 lambda: {("devices",): len(INDEXES.device_activity), ("protected",): len(INDEXES.protected)},
+                 ("index",))
+METRICS.callback("tcp_reports_total", "Device reports by outcome (home/reports.py)", "counter",
+                 lambda: {("accepted",): REPORTS.accepted, ("rejected",): REPORTS.rejected,
+                          ("written",): REPORTS.written, ("orphaned",): REPORTS.orphaned}, ("result",))
+METRICS.callback("tcp_reports_pending", "Device reports waiting to be written", "gauge",
+                 lambda: REPORTS.pending)
+METRICS.callback("tcp_capture_dropped_total", "Inbound lines not captured because the buffer was full",
+                 "counter", lambda: CAPTURE.dropped if CAPTURE is not None else 0)
 
 # ------------------ کش درون‌پروسه ------------------
+class NegativeCache:
+    """شناسه‌هایی که در DB نبودند؛ با TTL کوتاه و سقف اندازه (قدیمی‌ترها اول بیرون می‌روند)."""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # id -> زمان انقضا
+        self.hits = 0
+
+    def __contains__(self, key) -> bool:
+        expires = self._entries.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._entries[key]
+            return False
+        self.hits += 1
+        return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key):
+        self._entries[key] = time.monotonic() + self.ttl
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
 DEVICE_IDS = set()
 PRODUCT_IDS = set()
+UNKNOWN_DEVICE_IDS = NegativeCache(NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_SIZE)
+UNKNOWN_PRODUCT_IDS = NegativeCache(NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_SIZE)
+M_DEVICE_HIT = M_CACHE.labels(cache="device", result="hit")
+M_DEVICE_NEGATIVE = M_CACHE.labels(cache="device", result="negative")
+M_DEVICE_MISS = M_CACHE.labels(cache="device", result="miss")
+M_PRODUCT_HIT = M_CACHE.labels(cache="product", result="hit")
+M_PRODUCT_NEGATIVE = M_CACHE.labels(cache="product", result="negative")
+M_PRODUCT_MISS = M_CACHE.labels(cache="product", result="miss")
+METRICS.callback("tcp_id_cache_size", "Ids in the in-process caches", "gauge", lambda: {
+    ("device",): len(DEVICE_IDS), ("product",): len(PRODUCT_IDS),
+    ("device_negative",): len(UNKNOWN_DEVICE_IDS), ("product_negative",): len(UNKNOWN_PRODUCT_IDS),
+}, ("cache",))
 _CACHE_LOCK = asyncio.Lock()
 _last_refresh = 0.0
+_last_change_id = 0
 
-IRAN_TZ = timezone(timedelta(hours=3, minutes=30))
-
-def ts() -> str:
-    # زمان لاگ به وقت ایران
-    return datetime.now(IRAN_TZ).strftime("%Y-%m-%d %H:%M:%S %Z")
-
-@sync_to_async
 def _fetch_all_ids():
     device_ids = list(Device.objects.values_list('device_id', flat=True))
     product_ids = list(Product.objects.values_list('product_id', flat=True))
@@ -58,232 +268,753 @@ async def refresh_cache(force: bool = False):
         if (not force) and (time.time() - _last_refresh < CACHE_TTL):
             return
         try:
-            devs, prods = await _fetch_all_ids()
+            devs, prods = await DB.read(_fetch_all_ids)
             DEVICE_IDS.clear(); DEVICE_IDS.update(devs)
             PRODUCT_IDS.clear(); PRODUCT_IDS.update(prods)
+            UNKNOWN_DEVICE_IDS.clear(); UNKNOWN_PRODUCT_IDS.clear()
             _last_refresh = time.time()
-            print(f"[{ts()}] [CACHE] Refreshed: {len(DEVICE_IDS)} devices, {len(PRODUCT_IDS)} products")
+            LOG.info("cache_refreshed", devices=len(DEVICE_IDS), products=len(PRODUCT_IDS))
         except Exception as e:
-            print(f"[{ts()}] [CACHE] Refresh failed: {e}")
+            LOG.error("cache_refresh_failed", error=str(e))
 
-@sync_to_async
 def _exists_device(device_id: int) -> bool:
     return Device.objects.filter(device_id=device_id).exists()
 
-@sync_to_async
 def _exists_product(product_id: int) -> bool:
     return Product.objects.filter(product_id=product_id).exists()
 
 async def ensure_device_in_cache(device_id: int) -> bool:
     if device_id in DEVICE_IDS:
+        M_DEVICE_HIT.inc()
         return True
+    if device_id in UNKNOWN_DEVICE_IDS:
+        M_DEVICE_NEGATIVE.inc()
+        return False
+    M_DEVICE_MISS.inc()
     await refresh_cache()
     if device_id in DEVICE_IDS:
         return True
-    if await _exists_device(device_id):
+    if await DB.read(_exists_device, device_id):
         async with _CACHE_LOCK:
             DEVICE_IDS.add(device_id)
+        broadcast(f"+d{device_id}")
         return True
+    UNKNOWN_DEVICE_IDS.add(device_id)
     return False
 
 async def ensure_product_in_cache(product_id: int) -> bool:
     if product_id in PRODUCT_IDS:
+        M_PRODUCT_HIT.inc()
         return True
+    if product_id in UNKNOWN_PRODUCT_IDS:
+        M_PRODUCT_NEGATIVE.inc()
+        return False
+    M_PRODUCT_MISS.inc()
     await refresh_cache()
     if product_id in PRODUCT_IDS:
         return True
-    if await _exists_product(product_id):
+    if await DB.read(_exists_product, product_id):
         async with _CACHE_LOCK:
             PRODUCT_IDS.add(product_id)
+        broadcast(f"+p{product_id}")
         return True
+    UNKNOWN_PRODUCT_IDS.add(product_id)
     return False
 
-# ------------------ Helper sync funcs (منطق شما + رفع ابهام) ------------------
-def _get_temp(phone: str):
-    return TemproryData.objects.get(phone_number=phone)
-
-def _get_or_create_temp(phone: str):
-    # همان منطق شما: created ⇒ gift_number = MAX_GIFT - 1
-    return TemproryData.objects.get_or_create(
-        phone_number=phone, defaults={'gift_number': MAX_GIFT - 1}
-    )
+def _apply_change(kind: str, obj_id: int, deleted: bool):
+    ids, unknown = (DEVICE_IDS, UNKNOWN_DEVICE_IDS) if kind == "d" else (PRODUCT_IDS, UNKNOWN_PRODUCT_IDS)
+    if deleted:
+        ids.discard(obj_id)
+    else:
+        ids.add(obj_id)
+        unknown.discard(obj_id)
 
-def _consume_quota_atomic(temp_pk: int) -> tuple[bool, int]:
+async def _change_feed_poller():
     """
-    اتمی و ضد ریس:
-    - اگر سهمیه <= 0 بود: مصرف نمی‌شود ⇒ (False, current)
-    - اگر سهمیه > 0 بود: یک واحد کم می‌شود ⇒ (True, new_value)
-      *ممکن است new_value == 0 باشد (مجاز!)*
-    برمی‌گرداند: (consumed, remaining_after)
+    هر CHANGE_FEED_INTERVAL ثانیه ردیف‌های جدید ChangeFeed (فقط id > آخرین id دیده‌شده)
+    خوانده و روی DEVICE_IDS / PRODUCT_IDS، کش منفی و INDEXES اعمال می‌شوند؛ شماره‌های QUOTA
+    (مصرف از مسیر HTTP) در دفتر سهمیه دوباره از DB خوانده می‌شوند.
     """
-    with transaction.atomic():
-        t = TemproryData.objects.select_for_update().get(pk=temp_pk)
-        if t.gift_number <= 0:
-            return False, t.gift_number
-        TemproryData.objects.filter(pk=t.pk).update(gift_number=F('gift_number') - 1)
-        t.refresh_from_db(fields=['gift_number'])
-        return True, t.gift_number
-
-def _has_quota_sync(phone: str) -> bool:
+    global _last_change_id
+    while True:
+        await asyncio.sleep(CHANGE_FEED_INTERVAL)
+        try:
+            changes = await DB.read(changes_since, _last_change_id)
+        except Exception as e:
+            LOG.error("change_feed_failed", error=str(e))
+            continue
+        quota_phones = set()
+        for change_id, model, obj_id, deleted in changes:
+            if model == ChangeFeed.DEVICE:
+                _apply_change("d", obj_id, deleted)
+            elif model == ChangeFeed.PRODUCT:
+                _apply_change("p", obj_id, deleted)
+            elif model == ChangeFeed.QUOTA:
+                quota_phones.add(obj_id)
+            _last_change_id = change_id
+        if quota_phones and LEDGER is not None:
+            try:
+                await LEDGER.refresh(quota_phones)
+            except Exception as e:
+                # sync دوره‌ای دفتر (LEDGER_SYNC_INTERVAL) همین ردیف‌ها را هم می‌گیرد
+                LOG.error("ledger_refresh_failed", phones=len(quota_phones), error=str(e))
+        if changes:
+            try:
+                # فقط کلیدهای تغییرکرده دوباره خوانده می‌شوند
+                await DB.read(INDEXES.apply_changes, changes)
+            except Exception as e:
+                LOG.error("index_update_failed", error=str(e))
+            LOG.info("change_feed_applied", changes=len(changes))
+
+# ------------------ کانال invalidation بین workerها ------------------
+# هر worker یک socketpair (AF_UNIX/DGRAM) با supervisor دارد؛ پیامی که یک worker می‌فرستد
+# توسط supervisor برای بقیه‌ی workerها پخش می‌شود تا همه دید یکسانی از DEVICE_IDS/PRODUCT_IDS
+# داشته باشند. قالب پیام: "+d12" / "-d12" / "+p3" / "-p3" / "**" (ریفرش کامل)
+_CHANNEL = None
+
+def broadcast(msg: str):
+    if _CHANNEL is None:
+        return
+    try:
+        _CHANNEL.send(msg.encode())
+    except OSError:
+        # بافر پر یا supervisor در حال خروج؛ ریفرش دوره‌ای جبران می‌کند
+        pass
+
+def _apply_invalidation(msg: str):
+    if msg == "**":
+        asyncio.get_running_loop().create_task(refresh_cache(force=True))
+        return
+    op, kind, value = msg[0], msg[1], msg[2:]
+    try:
+        obj_id = int(value)
+    except ValueError:
+        return
+    _apply_change(kind, obj_id, deleted=(op == "-"))
+
+def _on_channel_readable():
+    while True:
+        try:
+            data = _CHANNEL.recv(256)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            return
+        if not data:
+            return
+        _apply_invalidation(data.decode(errors='ignore'))
+
+# ------------------ Helper sync funcs (منطق شما + رفع ابهام) ------------------
+def _has_quota_sync(phone: int) -> bool:
     try:
         t = TemproryData.objects.get(phone_number=phone)
         return t.gift_number > 0
     except TemproryData.DoesNotExist:
         return True
 
+# ------------------ کنترل پذیرش ------------------
+_inflight = 0
+_INFLIGHT_BY_DEVICE = {}  # دستگاه (یا -شناسه‌ی کانکشن اگر هنوز دستگاهی دیده نشده) -> تعداد
+_SHED = {reason: M_SHED.labels(reason=reason) for reason in ("server", "device", "budget")}
+
+def _admit(key, pool) -> str | None:
+    """None یعنی پذیرفته شد و سهم گرفته شد؛ وگرنه دلیل رد."""
+    global _inflight
+    if _inflight >= ADMIT_MAX_INFLIGHT:
+        return "server"
+    n = _INFLIGHT_BY_DEVICE.get(key, 0)
+    if n >= ADMIT_MAX_PER_DEVICE:
+        return "device"
+    if ADMIT_WAIT_BUDGET_MS > 0 and pool.estimated_wait() * 1000 > ADMIT_WAIT_BUDGET_MS:
+        return "budget"
+    _inflight += 1
+    _INFLIGHT_BY_DEVICE[key] = n + 1
+    return None
+
+def _release(key):
+    global _inflight
+    _inflight -= 1
+    n = _INFLIGHT_BY_DEVICE[key] - 1
+    if n:
+        _INFLIGHT_BY_DEVICE[key] = n
+    else:
+        del _INFLIGHT_BY_DEVICE[key]
+
+async def _admitted(coro, key, cmd: str):
+    try:
+        return await _within_deadline(coro, cmd)
+    finally:
+        _release(key)
+
+def _admit_or_shed(conn, pool, cmd: str, fn, *args):
+    """
+    اگر ظرفیت هست coroutine کار DB (fn(*args)، با مهلت دستور cmd) را برمی‌گرداند، وگرنه همان
+    لحظه RESP_503؛ coroutine فقط بعد از پذیرش ساخته می‌شود.
+    """
+    key = conn.device if conn.device is not None else -conn.conn_id
+    reason = _admit(key, pool)
+    if reason is not None:
+        _SHED[reason].inc()
+        return RESP_503
+    return _admitted(fn(*args), key, cmd)
+
+# ------------------ مهلت دستورها ------------------
+_DEADLINES = {cmd: ms / 1000 if ms > 0 else None for cmd, ms in DEADLINE_MS.items()}
+_DEADLINE_EXCEEDED = {cmd: M_DEADLINE.labels(cmd=cmd) for cmd in DEADLINE_MS}
+_DETACHED = set()  # ثبت POST هایی که پاسخشان 504 شد ولی سهمیه‌شان مصرف شده بود
+
+async def _within_deadline(coro, cmd: str):
+    """
+    coro را تا _DEADLINES[cmd] ثانیه اجرا می‌کند؛ بعد از آن لغو و RESP_504. لغو به DBPool.run
+    می‌رسد و کاری که هنوز در صف thread ها است اصلاً اجرا نمی‌شود.
+    """
+    try:
+        async with asyncio.timeout(_DEADLINES[cmd]):
+            return await coro
+    except TimeoutError:
+        _DEADLINE_EXCEEDED[cmd].inc()
+        return RESP_504
+
+def _detach(coro) -> asyncio.Task:
+    # تسکی که لغو مهلت به آن نمی‌رسد؛ main قبل از flush نهایی منتظر _DETACHED می‌ماند
+    task = asyncio.ensure_future(coro)
+    _DETACHED.add(task)
+    task.add_done_callback(_DETACHED.discard)
+    return task
+
 # ------------------ Async TCP Server ------------------
-async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-    addr = writer.get_extra_info('peername')
-    print(f"[{ts()}] [NEW CONNECTION] {addr} connected.")
+# پاسخ‌های آماده؛ برای هر پیام bytes تازه ساخته نمی‌شود
+RESP_PONG = b"pong\r\n"  # CRLF برای کلاینت‌های سریالی
+RESP_200 = b"200\n"
+RESP_202 = b"202\n"  # گزارش در صف نوشتن قرار گرفت
+RESP_400 = b"400\n"
+RESP_403 = b"403\n"
+RESP_404 = b"404\n"
+RESP_410 = b"410\n"  # دستگاه غیرفعال (device_activity=False)
+RESP_423 = b"423\n"  # شماره‌ی محافظت‌شده (ProtectedPhoneNumber)
+RESP_429 = b"429\n"  # سقف نرخ دستگاه یا شماره (home/ratelimit.py)
+RESP_503 = b"503\n"  # مشغول؛ دستگاه باید با تأخیر دوباره تلاش کند
+RESP_504 = b"504\n"  # مهلت دستور (DEADLINE_*_MS) تمام شد؛ برای POST سهمیه ممکن است مصرف شده باشد
+
+B_PING = ID_PING.encode()
+B_GET = ID_GET.encode()
+B_POST = ID_POST.encode()
+B_REPORT = ID_REPORT.encode()
+
+_CMD_NAMES = {B_PING: "ping", B_GET: "get", B_POST: "post", B_REPORT: "report"}
+
+_BLOCKED_INACTIVE = M_BLOCKED.labels(reason="inactive")
+_BLOCKED_PROTECTED = M_BLOCKED.labels(reason="protected")
+
+def handle_line(line: bytes, conn):
+    """
+    پردازش یک خط بدون decode کردن.
+    اگر پاسخ بدون رفتن سراغ DB معلوم باشد همین‌جا برگردانده می‌شود (bytes، یا None یعنی
+    عمداً هیچ پاسخی نده)؛ وگرنه یک coroutine برمی‌گردد که باید await شود.
+    conn.device آخرین دستگاهی است که روی این کانکشن دیده شده (لاگ، کلید پذیرش، سطل توکن و 410
+    برای GET)؛ ping فقط با شناسه‌ی تأییدشده در DEVICE_IDS آن را عوض می‌کند.
+    """
+    parts = line.split(b",")
+    command = parts[0].lower()
+
+    # --- PING ---
+    if command == B_PING and len(parts) == 2:
+        try:
+            dev_id = int(parts[1])
+        except ValueError:
+            # فرمت اشتباه => طبق خواسته‌ات هیچ پاسخی نده
+            return None
+        if dev_id in DEVICE_IDS:
+            M_DEVICE_HIT.inc()
+            conn.device = dev_id
+            return _pong(dev_id)
+        if dev_id in UNKNOWN_DEVICE_IDS:
+            # اگر معتبر نبود، عمداً هیچ پاسخی نده
+            M_DEVICE_NEGATIVE.inc()
+            return None
+        return _within_deadline(_ping(conn, dev_id), "ping")
+
+    # --- GET-like ---
+    if command == B_GET and len(parts) == 2:
+        try:
+            phone = normalize_phone(parts[1])
+        except ValueError:
+            return RESP_400
+        # ایندکس‌های درون‌حافظه (home/indexes.py)؛ قبل از سطل توکن و DB
+        if conn.device is not None and INDEXES.is_inactive(conn.device):
+            _BLOCKED_INACTIVE.inc()
+            return RESP_410
+        if INDEXES.is_protected(phone):
+            _BLOCKED_PROTECTED.inc()
+            return RESP_423
+        if not DEVICE_LIMITER.allow(conn.device if conn.device is not None else -conn.conn_id):
+            return RESP_429
+        if LEDGER is not None:
+            return RESP_200 if LEDGER.has_quota(phone) else RESP_403
+        return _admit_or_shed(conn, DB.reader, "get", _get, phone, conn.addr)
+
+    # --- POST-like ---
+    if command == B_POST and len(parts) == 4:
+        try:
+            phone = normalize_phone(parts[1])
+            device_id = int(parts[2])
+            product_id = int(parts[3])
+        except ValueError:
+            return RESP_400
+        conn.device = device_id
+        if INDEXES.is_inactive(device_id):
+            _BLOCKED_INACTIVE.inc()
+            return RESP_410
+        if INDEXES.is_protected(phone):
+            _BLOCKED_PROTECTED.inc()
+            return RESP_423
+        # سطل‌های توکن قبل از هر دسترسی به DB یا دفتر سهمیه
+        if not DEVICE_LIMITER.allow(device_id) or not PHONE_LIMITER.allow(phone):
+            return RESP_429
+        return _admit_or_shed(conn, DB.writer, "post", _post, phone, device_id, product_id, conn.addr)
+
+    # --- REPORT ---
+    if command == B_REPORT and len(parts) >= 3:
+        try:
+            device_id = int(parts[1])
+        except ValueError:
+            return RESP_400
+        text = line.split(b",", 2)[2].strip()
+        if not text:
+            return RESP_400
+        conn.device = device_id
+        if INDEXES.is_inactive(device_id):
+            _BLOCKED_INACTIVE.inc()
+            return RESP_410
+        if not DEVICE_LIMITER.allow(device_id):
+            return RESP_429
+        if device_id in DEVICE_IDS:
+            M_DEVICE_HIT.inc()
+            return _queue_report(device_id, text)
+        if device_id in UNKNOWN_DEVICE_IDS:
+            M_DEVICE_NEGATIVE.inc()
+            return RESP_404
+        return _within_deadline(_report(device_id, text), "report")
+
+    return RESP_400
+
+def _pong(dev_id: int) -> bytes:
+    # دستگاه غیرفعال مثل بقیه‌ی دستورها 410 می‌گیرد تا از همان ping بفهمد که کار نکند
+    if INDEXES.is_inactive(dev_id):
+        _BLOCKED_INACTIVE.inc()
+        return RESP_410
+    return RESP_PONG
+
+async def _ping(conn, dev_id: int) -> bytes | None:
+    if await ensure_device_in_cache(dev_id):
+        conn.device = dev_id
+        return _pong(dev_id)
+    # اگر معتبر نبود، عمداً هیچ پاسخی نده
+    return None
+
+def _queue_report(device_id: int, text: bytes) -> bytes:
+    # فقط صف حافظه؛ _report_flusher دسته‌ها را با bulk_create می‌نویسد
+    if REPORTS.add(device_id, text.decode("utf-8", errors="replace")):
+        return RESP_202
+    return RESP_503
+
+async def _report(device_id: int, text: bytes) -> bytes:
+    if await ensure_device_in_cache(device_id):
+        return _queue_report(device_id, text)
+    return RESP_404
 
+async def _get(phone: int, addr) -> bytes:
     try:
-        while True:
-            # --- خواندن با Idle Timeout: اگر 5 دقیقه هیچ دیتایی نیامد، ببند ---
-            try:
-                data = await asyncio.wait_for(reader.readline(), timeout=IDLE_TIMEOUT_SECONDS)
-            except asyncio.TimeoutError:
-                print(f"[{ts()}] [WARN] {addr} idle timeout (no data for {int(IDLE_TIMEOUT_SECONDS)}s), closing.")
-                try:
-                    writer.close()
-                    await writer.wait_closed()
-                except Exception:
-                    pass
-                break
+        ok = await DB.read(_has_quota_sync, phone)
+    except Exception as e:
+        LOG.error("db_error", cmd="get", addr=addr, phone=phone, error=str(e))
+        return RESP_400
+    return RESP_200 if ok else RESP_403
 
-            if not data:
-                break
+async def _post(phone: int, device_id: int, product_id: int, addr) -> bytes:
+    # مصرف سهمیه (دفتر درون‌حافظه یا تراکنش DB)؛ فقط نتیجه‌ی آن معیار است
+    if LEDGER is None and _LEDGER_PENDING is not None:
+        await _LEDGER_PENDING.wait()
+    if LEDGER is not None:
+        consumed, _ = LEDGER.claim(phone)
+    else:
+        # home.quota.claim_gift: ساخت یا کم‌کردن اتمی در یک دستور SQL. اگر مهلت وقتی تمام شود که
+        # این کار هنوز در صف نویسنده است، اجرا نمی‌شود؛ اگر شروع شده بود، ثبت ردیف در پس‌زمینه
+        cf = DB.writer.submit(claim_gift, phone, MAX_GIFT)
+        try:
+            remaining = await asyncio.wrap_future(cf)
+        except asyncio.CancelledError:
+            if not cf.cancel():
+                _detach(_record_late_claim(cf, phone, device_id, product_id, addr))
+            raise
+        except Exception as e:
+            LOG.error("db_error", cmd="post", addr=addr, phone=phone, error=str(e))
+            return RESP_400
+        consumed = remaining is not None
 
-            message = data.decode(errors='ignore').strip()
-            if not message:
-                continue
+    if not consumed:
+        # سهمیه از قبل صفر بوده
+        return RESP_403
+    # از اینجا سهمیه مصرف شده: تمام شدن مهلت فقط پاسخ را 504 می‌کند و ثبت RowData ادامه دارد
+    record = _record_post(phone, device_id, product_id, addr)
+    if _DEADLINES["post"] is None:
+        return await record
+    return await asyncio.shield(_detach(record))
+
+async def _record_late_claim(cf, phone: int, device_id: int, product_id: int, addr):
+    try:
+        remaining = await asyncio.wrap_future(cf)
+    except Exception as e:
+        LOG.error("db_error", cmd="post", addr=addr, phone=phone, error=str(e))
+        return
+    if remaining is not None:
+        await _record_post(phone, device_id, product_id, addr)
 
-            parts = message.split(",")
-            command = parts[0].lower()
+async def _record_post(phone: int, device_id: int, product_id: int, addr) -> bytes:
+    # اینجا حتی اگر سهمیه‌ی باقی‌مانده 0 شده باشد، همین درخواست مجاز بوده و مصرف شده
+    dev_ok = await ensure_device_in_cache(device_id)
+    prod_ok = await ensure_product_in_cache(product_id)
+    if not (dev_ok and prod_ok):
+        # طبق منطق شما: جبران نمی‌کنیم
+        return RESP_404
 
-            # --- PING ---
-            if command == "ping" and len(parts) == 2:
-                dev_id_str = parts[1].strip()
-                print(f"[{ts()}] [INFO] [PING] from {addr}")
-                try:
-                    dev_id = int(dev_id_str)
-                except ValueError:
-                    # فرمت اشتباه => طبق خواسته‌ات هیچ پاسخی نده
-                    continue
-
-                valid = await ensure_device_in_cache(dev_id)
-                if valid:
-                    writer.write(b"pong\r\n")  # CRLF برای کلاینت‌های سریالی
-                    await writer.drain()
-                # اگر معتبر نبود، عمداً هیچ پاسخی نده
-                continue
+    try:
+        # پاسخ 200 فقط بعد از commit شدن دسته‌ی این ردیف
+        await ROWDATA_WRITER.write(
+            phone_number=phone,
+            device_id_id=device_id,
+            product_id_id=product_id,
+        )
+    except Exception as e:
+        LOG.error("db_error", cmd="post", addr=addr, phone=phone, error=str(e))
+        return RESP_400
+    return RESP_200
 
-            # --- GET-like ---
-            if command == ID_GET and len(parts) == 2:
-                phone = parts[1]
-                print(f"[{ts()}] [INFO] [GET] {phone} from {addr}")
-                try:
-                    ok = await sync_to_async(_has_quota_sync)(phone)
-                    writer.write(b"200\n" if ok else b"403\n")
-                    await writer.drain()
-                except Exception:
-                    writer.write(b"400\n")
-                    print(f"[{ts()}] [INFO] [GET] {phone} from {addr} -status 400")
-                    await writer.drain()
-
-            # --- POST-like ---
-            elif command == ID_POST and len(parts) == 4:
-                phone = parts[1]
-                print(f"[{ts()}] [INFO] [POST] {phone} from {addr}")
-                try:
-                    device_id = int(parts[2])
-                    product_id = int(parts[3])
-                except ValueError:
-                    writer.write(b"400\n")
-                    print(f"[{ts()}] [INFO] [POST] {phone} from {addr} -status 400")
-                    await writer.drain()
-                    continue
-
-                # TemproryData: عین منطق شما
-                try:
-                    temp_data, created = await sync_to_async(_get_or_create_temp)(phone)
-                except IntegrityError:
-                    temp_data = await sync_to_async(_get_temp)(phone)
-                    created = False
-
-                if created:
-                    # created ⇒ gift_number = MAX_GIFT - 1 (بدون کم‌کردن)
-                    dev_ok = await ensure_device_in_cache(device_id)
-                    prod_ok = await ensure_product_in_cache(product_id)
-                    if not (dev_ok and prod_ok):
-                        writer.write(b"404\n")
-                        print(f"[{ts()}] [INFO] [POST] {phone} from {addr} -status 404")
-                        await writer.drain()
-                        continue
+async def dispatch(line: bytes, conn) -> bytes | None:
+    """اجرای یک دستور و برگرداندن بایت‌های پاسخ (None یعنی هیچ پاسخی نده)."""
+    result = handle_line(line, conn)
+    if isinstance(result, CoroutineType):
+        result = await result
+    return result
 
-                    try:
-                        await sync_to_async(RowData.objects.create)(
-                            phone_number=phone,
-                            device_id_id=device_id,
-                            product_id_id=product_id,
-                        )
-                        writer.write(b"200\n")
-                        print(f"[{ts()}] [INFO] [POST] {phone} from {addr} -status 200")
-                        await writer.drain()
-                    except Exception:
-                        writer.write(b"400\n")
-                        print(f"[{ts()}] [INFO] [POST] {phone} from {addr} -status 400")
-                        await writer.drain()
-                    continue
-
-                # existing ⇒ مصرف اتمی (فقط نتیجه‌ی تراکنش معیار است)
-                try:
-                    consumed, remaining = await sync_to_async(_consume_quota_atomic)(temp_data.pk)
-                except Exception:
-                    writer.write(b"400\n")
-                    await writer.drain()
-                    continue
-
-                if not consumed:
-                    # سهمیه از قبل صفر بوده
-                    writer.write(b"403\n")
-                    await writer.drain()
-                    continue
-
-                # اینجا حتی اگر remaining == 0 باشد، همین درخواست مجاز بوده و مصرف شده
-                dev_ok = await ensure_device_in_cache(device_id)
-                prod_ok = await ensure_product_in_cache(product_id)
-                if not (dev_ok and prod_ok):
-                    # طبق منطق شما: جبران نمی‌کنیم
-                    writer.write(b"404\n")
-                    await writer.drain()
-                    continue
+_REQUEST_COUNTERS = {}  # (cmd, bytes پاسخ) -> شمارنده‌ی برچسب‌دار
+_LATENCY_BY_CMD = {name: M_LATENCY.labels(cmd=name) for name in (*_CMD_NAMES.values(), "unknown")}
 
-                try:
-                    await sync_to_async(RowData.objects.create)(
-                        phone_number=phone,
-                        device_id_id=device_id,
-                        product_id_id=product_id,
-                    )
-                    writer.write(b"200\n")
-                    await writer.drain()
-                except Exception:
-                    writer.write(b"400\n")
-                    await writer.drain()
+def _record_request(conn, line: bytes, response: bytes | None, started: float):
+    # متریک‌ها با دو جمع ساده؛ لاگ فقط یک tuple در صف (status و قالب‌بندی روی thread لاگ)
+    elapsed = time.perf_counter() - started
+    comma = line.find(b",")
+    cmd = _CMD_NAMES.get((line[:comma] if comma >= 0 else line).lower(), "unknown")
+    counter = _REQUEST_COUNTERS.get((cmd, response))
+    if counter is None:
+        status = "none" if response is None else response.strip().decode(errors='replace')
+        counter = _REQUEST_COUNTERS[(cmd, response)] = M_REQUESTS.labels(cmd=cmd, status=status)
+    counter.inc()
+    _LATENCY_BY_CMD[cmd].observe(elapsed)
+    LOG.request(conn.conn_id, conn.addr, cmd, conn.device, response, elapsed)
+    conn.pending -= 1
+    if conn.draining and not conn.pending:
+        # آخرین پاسخ در جریان نوشته شد؛ حالا بستن امن است
+        conn.drain_close()
 
-            else:
-                writer.write(b"400\n")
+def _is_mutation(line: bytes) -> bool:
+    # فقط POST وضعیت را تغییر می‌دهد؛ ping و GET مستقل از هم هستند
+    return line.startswith(B_POST + b",")
+
+_CONN_IDS = itertools.count(1)
+_LIVE_CONNS = set()  # همه‌ی کانکشن‌های باز هر دو موتور (برای drain)
+
+class _StreamConn:
+    """وضعیت یک کانکشن موتور stream (برای IDLE_REAPER، drain و لاگ)."""
+    __slots__ = ('writer', 'addr', 'conn_id', 'device', 'last_activity', 'wheel_slot', 'pending', 'draining')
+
+    def __init__(self, writer: asyncio.StreamWriter, addr):
+        self.writer = writer
+        self.addr = addr
+        self.conn_id = next(_CONN_IDS)
+        self.device = None
+        self.pending = 0  # خط‌های خوانده‌شده‌ای که پاسخشان هنوز نوشته نشده
+        self.draining = False
+
+    def drain_close(self):
+        # اگر کاری در جریان است، بستن بعد از نوشتن آخرین پاسخ (_record_request)
+        self.draining = True
+        if not self.pending:
+            self.writer.close()
+
+    def force_close(self):
+        self.writer.close()
+
+    def close_idle(self):
+        # بستن transport ⇒ readline در handle_client با EOF برمی‌گردد
+        LOG.warn("idle_timeout", conn=self.conn_id, addr=self.addr, device=self.device,
+                 idle_s=int(IDLE_TIMEOUT_SECONDS))
+        self.writer.close()
+
+async def _read_message(reader: asyncio.StreamReader, conn: _StreamConn) -> bytes | None:
+    """یک خط را می‌خواند؛ None یعنی EOF یا بسته‌شدن توسط IDLE_REAPER."""
+    data = await reader.readline()
+    if not data or (conn.draining and conn.writer.is_closing()):
+        # خط‌هایی که بعد از بستن drain در بافر مانده‌اند اجرا نمی‌شوند (پاسخشان به جایی نمی‌رسد)
+        return None
+    conn.last_activity = IDLE_REAPER.now
+    message = data.strip()
+    if message:
+        conn.pending += 1
+        if CAPTURE is not None:
+            CAPTURE.record(conn.conn_id, message)
+    return message
+
+async def _serve_sequential(reader, writer, conn: _StreamConn):
+    # خواندن، اجرا، نوشتن؛ بعد خط بعدی
+    while True:
+        message = await _read_message(reader, conn)
+        if message is None:
+            break
+        if not message:
+            continue
+        started = time.perf_counter()
+        response = await dispatch(message, conn)
+        if response is not None:
+            writer.write(response)
+            await writer.drain()
+        _record_request(conn, message, response, started)
+
+async def _respond_in_order(queue: asyncio.Queue, writer: asyncio.StreamWriter, conn: _StreamConn):
+    """پاسخ‌ها را دقیقاً به ترتیب درخواست‌ها می‌نویسد؛ drain فقط وقتی صف خالی شد."""
+    broken = False
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        task, message, started = item
+        if broken:
+            # کانکشن خراب شده؛ فقط صف را خالی می‌کنیم تا خواننده گیر نکند
+            task.cancel()
+            continue
+        try:
+            response = await task
+            if response is not None:
+                writer.write(response)
+            if queue.empty():
                 await writer.drain()
+            _record_request(conn, message, response, started)
+        except Exception as e:
+            LOG.error("connection_error", conn=conn.conn_id, addr=conn.addr, error=str(e))
+            broken = True
+            writer.close()
+
+async def _serve_pipelined(reader, writer, conn: _StreamConn):
+    """
+    چند خطِ پشت‌سرهم از یک دستگاه را بدون صبر برای پاسخ قبلی می‌خواند و اجرا می‌کند:
+    - ping و GET ها هم‌زمان اجرا می‌شوند
+    - POST صبر می‌کند تا همه‌ی درخواست‌های قبلی تمام شوند، و درخواست‌های بعدی صبر می‌کنند
+      تا POST تمام شود (ترتیب منطقی سهمیه حفظ می‌شود)
+    - پاسخ‌ها به ترتیب درخواست نوشته می‌شوند
+    """
+    queue = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+    responder = asyncio.create_task(_respond_in_order(queue, writer, conn))
+    inflight = []   # تسک‌های در حال اجرا
+    barrier = None  # آخرین POST
+    try:
+        while not writer.is_closing():
+            message = await _read_message(reader, conn)
+            if message is None:
+                break
+            if not message:
+                continue
+            started = time.perf_counter()
+            inflight = [t for t in inflight if not t.done()]
+            if _is_mutation(message):
+                deps = list(inflight)
+            else:
+                deps = [barrier] if barrier is not None and not barrier.done() else []
+            task = asyncio.create_task(_dispatch_after(deps, message, conn))
+            inflight.append(task)
+            if _is_mutation(message):
+                barrier = task
+            await queue.put((task, message, started))
+    finally:
+        await queue.put(None)
+        await responder
+
+async def _dispatch_after(deps, message: bytes, conn: _StreamConn):
+    if deps:
+        await asyncio.wait(deps)
+    return await dispatch(message, conn)
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    addr = writer.get_extra_info('peername')
+    conn = _StreamConn(writer, addr)
+    LOG.info("connected", conn=conn.conn_id, addr=addr)
+    M_CONN_ACCEPTED.inc()
+    M_CONN_ACTIVE.inc()
+    IDLE_REAPER.add(conn)
+    _LIVE_CONNS.add(conn)
+
+    try:
+        if PIPELINE_DEPTH > 1:
+            await _serve_pipelined(reader, writer, conn)
+        else:
+            await _serve_sequential(reader, writer, conn)
 
     except Exception as e:
-        print(f"[{ts()}] [ERROR] {addr} -> {e}")
+        LOG.error("connection_error", conn=conn.conn_id, addr=addr, error=str(e))
 
     finally:
+        IDLE_REAPER.remove(conn)
+        _LIVE_CONNS.discard(conn)
+        if CAPTURE is not None:
+            CAPTURE.record_close(conn.conn_id)
         try:
             writer.close()
             await writer.wait_closed()
         except (ConnectionResetError, OSError):
-            print(f"[{ts()}] [WARN] Connection with {addr} closed unexpectedly.")
-        print(f"[{ts()}] [CLOSED] Connection with {addr} closed.")
+            LOG.warn("connection_reset", conn=conn.conn_id, addr=addr)
+        M_CONN_ACTIVE.dec()
+        M_CONN_CLOSED.inc()
+        LOG.info("closed", conn=conn.conn_id, addr=addr, device=conn.device)
+
+# ------------------ موتور Protocol (بدون StreamReader) ------------------
+class DeviceProtocol(asyncio.Protocol):
+    """
+    همان پروتکل handle_client ولی روی asyncio.Protocol:
+    - قاب‌بندی خط‌ها در data_received روی یک bytearray قابل استفاده‌ی مجدد
+    - پاسخ‌هایی که بدون DB معلوم‌اند (ping دستگاه کش‌شده، GET از دفتر سهمیه) همان‌جا نوشته می‌شوند
+    - کارهای نیازمند DB به ترتیب اجرا می‌شوند و خط‌های بعدی تا تمام‌شدن آن‌ها در صف می‌مانند
+    - idle timeout با همان IDLE_REAPER (هیچ تایمری برای هر پیام ساخته نمی‌شود)
+    """
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info('peername')
+        self.conn_id = next(_CONN_IDS)
+        self.device = None
+        self._buf = bytearray()
+        self._backlog = None  # خط‌های منتظر، وقتی یک کار DB در جریان است
+        self._task = None
+        self._loop = asyncio.get_running_loop()
+        self.pending = 0
+        self.draining = False
+        IDLE_REAPER.add(self)
+        _LIVE_CONNS.add(self)
+        M_CONN_ACCEPTED.inc()
+        M_CONN_ACTIVE.inc()
+        LOG.info("connected", conn=self.conn_id, addr=self.addr)
+
+    def data_received(self, data):
+        self.last_activity = IDLE_REAPER.now
+        buf = self._buf
+        buf += data
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(buf[start:end]).strip()
+            start = end + 1
+            if self.draining and self.transport.is_closing():
+                break
+            if line:
+                self._feed_line(line)
+        if start:
+            del buf[:start]
+        if len(buf) > MAX_LINE_BYTES:
+            # خط بدون \n و بیش از حد بلند؛ کلاینت خراب است
+            self.transport.close()
+
+    def _feed_line(self, line: bytes):
+        started = time.perf_counter()
+        self.pending += 1
+        if CAPTURE is not None:
+            CAPTURE.record(self.conn_id, line)
+        if self._backlog is not None:
+            self._backlog.append((line, started))
+            if len(self._backlog) > PROTOCOL_MAX_BACKLOG:
+                self.transport.pause_reading()
+            return
+        result = handle_line(line, self)
+        if isinstance(result, CoroutineType):
+            self._backlog = deque()
+            self._task = self._loop.create_task(self._run(result, line, started))
+            return
+        if result is not None:
+            self.transport.write(result)
+        _record_request(self, line, result, started)
+
+    async def _run(self, coro, line: bytes, started: float):
+        # کارهای DB و خط‌هایی که پشت آن‌ها جمع شده‌اند، دقیقاً به ترتیب
+        try:
+            while coro is not None:
+                result = await coro
+                coro = None
+                if result is not None and not self.transport.is_closing():
+                    self.transport.write(result)
+                _record_request(self, line, result, started)
+                while self._backlog:
+                    line, started = self._backlog.popleft()
+                    result = handle_line(line, self)
+                    if isinstance(result, CoroutineType):
+                        coro = result
+                        break
+                    if result is not None and not self.transport.is_closing():
+                        self.transport.write(result)
+                    _record_request(self, line, result, started)
+        except Exception as e:
+            LOG.error("connection_error", conn=self.conn_id, addr=self.addr, error=str(e))
+            self.transport.close()
+        finally:
+            self._backlog = None
+            self._task = None
+            if not self.transport.is_closing():
+                self.transport.resume_reading()
+
+    def close_idle(self):
+        LOG.warn("idle_timeout", conn=self.conn_id, addr=self.addr, device=self.device,
+                 idle_s=int(IDLE_TIMEOUT_SECONDS))
+        self.transport.close()
+
+    def drain_close(self):
+        self.draining = True
+        if not self.pending:
+            self.transport.close()
+
+    def force_close(self):
+        self.transport.close()
+
+    def connection_lost(self, exc):
+        IDLE_REAPER.remove(self)
+        _LIVE_CONNS.discard(self)
+        if CAPTURE is not None:
+            CAPTURE.record_close(self.conn_id)
+        if exc is not None:
+            LOG.warn("connection_reset", conn=self.conn_id, addr=self.addr)
+        M_CONN_ACTIVE.dec()
+        M_CONN_CLOSED.inc()
+        LOG.info("closed", conn=self.conn_id, addr=self.addr, device=self.device)
+
+async def _db_stats_reporter():
+    while True:
+        await asyncio.sleep(DB_STATS_INTERVAL)
+        LOG.info("reaper_stats", **IDLE_REAPER.stats())
+        for name, st in DB.stats().items():
+            LOG.info("db_stats", pool=name, **{k: round(v, 2) for k, v in st.items()})
+        LOG.info("log_stats", **LOG.stats())
+
+async def _report_flusher():
+    """هر REPORT_FLUSH_SECONDS ثانیه صف گزارش‌ها در دسته‌های bulk_create روی thread نویسنده."""
+    try:
+        while True:
+            await asyncio.sleep(REPORTS.flush_interval)
+            while REPORTS.pending:
+                try:
+                    await DB.write(REPORTS.flush)
+                except Exception as e:
+                    LOG.error("report_flush_failed", pending=REPORTS.pending, error=str(e))
+                    break
+    finally:
+        if REPORTS.pending:
+            await DB.write(REPORTS.flush_all)
 
 # ریفرش خودکار کش هر 24 ساعت
 async def _cache_refresher():
@@ -291,14 +1022,425 @@ async def _cache_refresher():
     while True:
         await asyncio.sleep(CACHE_TTL)
         await refresh_cache(force=True)
+        try:
+            await DB.read(INDEXES.load)
+        except Exception as e:
+            LOG.error("index_load_failed", error=str(e))
+
+# ------------------ drain و hot reload ------------------
+_STOP = None           # asyncio.Event؛ SIGTERM/SIGINT یا آماده‌شدن نسل جدید (SIGUSR2)
+_HANDOVER_SOCK = None  # سر ما از socketpair با نسل جدید؛ تا خروج باز می‌ماند (EOF = ما رفتیم)
 
-async def main():
+async def _drain(server):
+    """
+    پذیرش متوقف، بعد کانکشن‌ها با نرخ DRAIN_CLOSE_RATE بسته می‌شوند؛ کانکشنی که کاری در جریان
+    دارد بعد از نوشتن آخرین پاسخش بسته می‌شود. بعد از DRAIN_SECONDS باقی‌مانده‌ها بسته می‌شوند.
+    """
+    loop = asyncio.get_running_loop()
+    server.close()
+    LOG.info("drain_started", connections=len(_LIVE_CONNS), seconds=DRAIN_SECONDS)
+    deadline = loop.time() + DRAIN_SECONDS
+    # نرخ طوری که همه تا 80٪ مهلت بسته شوند، حتی اگر DRAIN_CLOSE_RATE کم باشد
+    rate = max(DRAIN_CLOSE_RATE, len(_LIVE_CONNS) / max(DRAIN_SECONDS * 0.8, 0.001))
+    tick = 0.05
+    per_tick = max(1, int(rate * tick))
+    while _LIVE_CONNS and loop.time() < deadline:
+        for conn in list(itertools.islice((c for c in _LIVE_CONNS if not c.draining), per_tick)):
+            conn.drain_close()
+        await asyncio.sleep(tick)
+    if _LIVE_CONNS:
+        LOG.warn("drain_timeout", remaining=len(_LIVE_CONNS))
+        for conn in list(_LIVE_CONNS):
+            conn.force_close()
+        await asyncio.sleep(tick)
+    LOG.info("drain_finished")
+
+def _spawn_successor(listen_fd: int | None = None) -> tuple[subprocess.Popen, socket.socket]:
+    """همین فایل با همان آرگومان‌ها؛ listen_fd (حالت تک‌پروسه) و سر دیگر socketpair به ارث می‌رسند."""
+    ours, theirs = socket.socketpair()
+    env = {**os.environ, "HANDOVER_FD": str(theirs.fileno())}
+    fds = [theirs.fileno()]
+    if listen_fd is not None:
+        env["LISTEN_FD"] = str(listen_fd)
+        fds.append(listen_fd)
+    argv = [sys.executable, os.path.abspath(sys.argv[0]), *sys.argv[1:]]
+    proc = subprocess.Popen(argv, env=env, pass_fds=fds)
+    theirs.close()
+    return proc, ours
+
+async def _hand_over(server):
+    """SIGUSR2 در حالت تک‌پروسه: سوکت listen به نسل جدید داده می‌شود و بعد از «ready» ما drain می‌کنیم."""
+    global _HANDOVER_SOCK
+    if _HANDOVER_SOCK is not None or _STOP.is_set():
+        return
+    loop = asyncio.get_running_loop()
+    proc, ours = _spawn_successor(server.sockets[0].fileno())
+    ours.setblocking(False)
+    _HANDOVER_SOCK = ours
+    LOG.info("handover_started", pid=proc.pid)
+    try:
+        msg = await asyncio.wait_for(loop.sock_recv(ours, 16), HANDOVER_TIMEOUT)
+    except asyncio.TimeoutError:
+        msg = b""
+    if msg != b"ready":
+        # نسل جدید بالا نیامد؛ ما همچنان سرویس می‌دهیم
+        LOG.error("handover_failed", pid=proc.pid)
+        _HANDOVER_SOCK = None
+        ours.close()
+        proc.kill()
+        return
+    LOG.info("handover_ready", pid=proc.pid)
+    _STOP.set()
+
+async def _take_over(server, predecessor: socket.socket):
+    """
+    سمت نسل جدید: «ready» و صبر برای «go» (نسل قبلی پذیرش را بسته و دفتر سهمیه‌اش را flush کرده)
+    تا هیچ‌وقت دو پروسه هم‌زمان با دو دفتر سهمیه‌ی جدا کانکشن نپذیرند.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.sock_sendall(predecessor, b"ready")
+    try:
+        await asyncio.wait_for(loop.sock_recv(predecessor, 16), HANDOVER_TIMEOUT)
+    except asyncio.TimeoutError:
+        LOG.warn("handover_go_timeout")
+    await server.start_serving()
+
+async def _ledger_after_predecessor(ledger, predecessor: socket.socket):
+    """
+    تا خروج نسل قبلی مصرف‌ها مستقیم از DB است (claim_gift)؛ EOF روی socketpair یعنی همه‌ی
+    نوشته‌های آن پروسه در DB است و حالا می‌شود دفتر را از DB بارگذاری کرد. از همین لحظه
+    مصرف‌های تازه منتظر دفتر می‌مانند (_LEDGER_PENDING) و قبل از بارگذاری یک کار خالی روی
+    نویسنده‌ی DB (یک thread، به ترتیب) اجرا می‌شود: claim_gift هایی که قبلاً در صف بودند همه
+    commit شده‌اند و در تصویر دفتر هستند، پس هیچ هدیه‌ای دو بار داده نمی‌شود.
+    """
+    global LEDGER, _LEDGER_PENDING
+    loop = asyncio.get_running_loop()
+    while await loop.sock_recv(predecessor, 16):
+        pass
+    predecessor.close()
+    ready = _LEDGER_PENDING = asyncio.Event()
+    try:
+        await DB.write(_noop)
+        await ledger.load()
+        LEDGER = ledger
+    finally:
+        # اگر بارگذاری شکست خورد مصرف‌ها مثل قبل مستقیم از DB ادامه می‌دهند
+        _LEDGER_PENDING = None
+        ready.set()
+    LOG.info("ledger_loaded", phones=len(ledger), after="handover")
+    await ledger.run(LEDGER_SYNC_INTERVAL)
+
+def _noop():
+    pass
+
+def _write_pid_file():
+    if PID_FILE:
+        with open(PID_FILE, "w") as f:
+            f.write(f"{os.getpid()}\n")
+
+async def main(reuse_port: bool = False, engine: str = "stream", host: str = HOST, port: int = PORT,
+               worker: int | None = None):
+    global _last_change_id, CAPTURE, LEDGER, _STOP
+    loop = asyncio.get_running_loop()
+    _STOP = asyncio.Event()
+    # SIGTERM/SIGINT ⇒ drain آرام و بعد flush نهایی در finally پایین
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, _STOP.set)
+    if _CHANNEL is not None:
+        loop.add_reader(_CHANNEL.fileno(), _on_channel_readable)
+    predecessor = None
+    if _HANDOVER_FD is not None and worker is None:
+        predecessor = socket.socket(fileno=int(_HANDOVER_FD))
+        predecessor.setblocking(False)
+    # اول آخرین id feed، بعد بارگذاری کامل کش؛ تا هیچ تغییری بین این دو گم نشود
+    _last_change_id = await DB.read(latest_change_id)
+    # ایندکس‌ها قبل از پذیرفتن اولین کانکشن؛ وگرنه دستگاه غیرفعال چند لحظه رد نمی‌شد
+    await DB.read(INDEXES.load)
     asyncio.create_task(_cache_refresher())
-    server = await asyncio.start_server(handle_client, HOST, PORT, backlog=512)
+    asyncio.create_task(_change_feed_poller())
+    asyncio.create_task(IDLE_REAPER.run())
+    writer_task = asyncio.create_task(ROWDATA_WRITER.run())
+    report_task = asyncio.create_task(_report_flusher())
+    if DB_STATS_INTERVAL > 0:
+        asyncio.create_task(_db_stats_reporter())
+    capture_task = None
+    if CAPTURE_FILE:
+        CAPTURE = CaptureWriter(CAPTURE_FILE if worker is None else f"{CAPTURE_FILE}.{worker}")
+        capture_task = asyncio.create_task(CAPTURE.run())
+        LOG.info("capture_enabled", path=CAPTURE.path)
+    ledger_task = None
+    deferred_ledger = None
+    if LEDGER is not None:
+        if predecessor is not None:
+            # نسل قبلی هنوز دفتر خودش را دارد؛ تا خروجش مستقیم از DB
+            deferred_ledger, LEDGER = LEDGER, None
+        else:
+            await LEDGER.load()
+            LOG.info("ledger_loaded", phones=len(LEDGER))
+            ledger_task = asyncio.create_task(LEDGER.run(LEDGER_SYNC_INTERVAL))
+    if _LISTEN_FD is not None and worker is None:
+        listen = dict(sock=socket.socket(fileno=int(_LISTEN_FD)))
+    else:
+        listen = dict(host=host, port=port, reuse_port=reuse_port or None)
+    if engine == "protocol":
+        server = await loop.create_server(DeviceProtocol, **listen, backlog=512, start_serving=False)
+    else:
+        server = await asyncio.start_server(handle_client, **listen, backlog=512, start_serving=False)
+    if predecessor is not None:
+        await _take_over(server, predecessor)
+        if deferred_ledger is not None:
+            ledger_task = asyncio.create_task(_ledger_after_predecessor(deferred_ledger, predecessor))
+    else:
+        await server.start_serving()
     addr = server.sockets[0].getsockname()
-    print(f"[{ts()}] [LISTENING] Server is listening on {addr}")
-    async with server:
-        await server.serve_forever()
+    LOG.info("listening", addr=addr, pid=os.getpid(), engine=engine, loop=type(loop).__module__,
+             handover=predecessor is not None)
+    if worker is None:
+        loop.add_signal_handler(signal.SIGUSR2, lambda: loop.create_task(_hand_over(server)))
+        _write_pid_file()
+    elif _CHANNEL is not None:
+        # supervisor برای hot reload منتظر آماده‌شدن همه‌ی worker هاست
+        _CHANNEL.send(b"!ready")
+    metrics_server = None
+    metrics_task = None
+    if METRICS_PORT > 0:
+        if worker is not None:
+            METRICS.const_labels = {"worker": str(worker)}
+        metrics_port = METRICS_PORT + (worker or 0)
+
+        async def start_metrics():
+            # در hot reload پورت تا شروع drain دست نسل قبلی است؛ تا آزاد شدن دوباره تلاش می‌شود
+            nonlocal metrics_server
+            logged = False
+            while True:
+                try:
+                    metrics_server = await serve_metrics(METRICS, METRICS_HOST, metrics_port)
+                    LOG.info("metrics_listening", addr=(METRICS_HOST, metrics_port))
+                    return
+                except OSError as e:
+                    if not logged:
+                        LOG.error("metrics_listen_failed", port=metrics_port, error=str(e), retrying=True)
+                        logged = True
+                    await asyncio.sleep(1.0)
+
+        metrics_task = asyncio.create_task(start_metrics())
+    try:
+        await _STOP.wait()
+        server.close()  # پذیرش متوقف (در hot reload سوکت listen در نسل جدید باز می‌ماند)
+        if _HANDOVER_SOCK is not None:
+            # دفتر سهمیه flush و خاموش؛ از اینجا هر دو نسل مستقیم از DB مصرف می‌کنند
+            if ledger_task is not None:
+                ledger_task.cancel()
+                try:
+                    await ledger_task
+                except asyncio.CancelledError:
+                    pass
+                ledger_task = None
+                LEDGER = None
+            await loop.sock_sendall(_HANDOVER_SOCK, b"go")
+        if metrics_task is not None:
+            metrics_task.cancel()
+        if metrics_server is not None:
+            metrics_server.close()  # پورت برای نسل جدید
+            metrics_server = None
+        await _drain(server)
+        if _DETACHED:
+            # POST هایی که 504 گرفتند ولی ردیفشان هنوز به صف نویسنده نرسیده
+            await asyncio.wait(_DETACHED, timeout=DRAIN_SECONDS)
+    finally:
+        if metrics_task is not None:
+            metrics_task.cancel()
+        if metrics_server is not None:
+            metrics_server.close()
+        # flush نهایی RowData، گزارش‌ها، سهمیه‌ها و فایل ضبط قبل از خروج
+        for task in (writer_task, report_task, ledger_task, capture_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        DB.shutdown()
+        LOG.info("stopped", pid=os.getpid())
+
+# ------------------ supervisor: چند worker با SO_REUSEPORT ------------------
+def run(coro):
+    # اگر uvloop نصب باشد از آن استفاده می‌شود (USE_UVLOOP=0 برای خاموش‌کردن)
+    if uvloop is not None and USE_UVLOOP:
+        return uvloop.run(coro)
+    return asyncio.run(coro)
+
+def _run_worker(chan: socket.socket, worker: int, **options) -> int:
+    global _CHANNEL
+    # هندلرهای سیگنال supervisor در فرزند به ارث می‌رسند؛ برگرداندن به پیش‌فرض
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    chan.setblocking(False)
+    _CHANNEL = chan
+    try:
+        run(main(reuse_port=True, worker=worker, **options))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    except BaseException:
+        LOG.error("worker_crashed", pid=os.getpid(), error=traceback.format_exc())
+        return 1
+    finally:
+        # os._exit هندلرهای atexit را اجرا نمی‌کند
+        LOG.close()
+    return 0
+
+def supervise(workers: int, **options):
+    global LEDGER
+    from django.db import connections
+
+    if LEDGER is not None:
+        # دفتر سهمیه فقط داخل یک پروسه معتبر است؛ با چند worker مستقیم از claim_gift استفاده می‌شود
+        LOG.warn("ledger_disabled", workers=workers)
+        LEDGER = None
+    # هیچ کانکشن DB نباید بین پروسه‌ها مشترک شود
+    connections.close_all()
+
+    sel = selectors.DefaultSelector()
+    procs = {}      # slot -> (pid, parent_sock)
+    restart_at = {}  # slot -> زمان راه‌اندازی دوباره
+    stopping = False
+    ready = set()   # slot هایی که listen کرده‌اند
+    # hot reload: predecessor = supervisor قبلی که منتظر «ready» ماست؛ successor = supervisor جدید ما
+    predecessor = socket.socket(fileno=int(_HANDOVER_FD)) if _HANDOVER_FD is not None else None
+    successor = None  # (Popen, sock, مهلت)
+
+    def spawn(slot: int):
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        pid = os.fork()
+        if pid == 0:
+            sel.close()
+            parent_sock.close()
+            for _, other in procs.values():
+                other.close()
+            for sock in (predecessor, successor and successor[1]):
+                if sock is not None:
+                    sock.close()
+            os._exit(_run_worker(child_sock, slot, **options))
+        child_sock.close()
+        parent_sock.setblocking(False)
+        sel.register(parent_sock, selectors.EVENT_READ, slot)
+        procs[slot] = (pid, parent_sock)
+        LOG.info("worker_started", worker=slot, pid=pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid, _ in procs.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reload(signum, frame):
+        # SIGUSR2: supervisor جدید با worker های خودش (SO_REUSEPORT) کنار ما بالا می‌آید
+        nonlocal successor
+        if successor is not None or stopping:
+            return
+        proc, sock = _spawn_successor()
+        sel.register(sock, selectors.EVENT_READ, "successor")
+        successor = (proc, sock, time.monotonic() + HANDOVER_TIMEOUT)
+        LOG.info("handover_started", pid=proc.pid)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR2, reload)
+
+    for slot in range(workers):
+        spawn(slot)
+
+    while procs or (restart_at and not stopping):
+        # پخش پیام‌های invalidation هر worker برای بقیه
+        for key, _ in sel.select(timeout=0.5):
+            try:
+                msg = key.fileobj.recv(256)
+            except OSError:
+                continue
+            if key.data == "successor":
+                sel.unregister(key.fileobj)
+                if msg == b"ready":
+                    # همه‌ی worker های جدید listen می‌کنند؛ ما drain می‌کنیم
+                    LOG.info("handover_ready", pid=successor[0].pid)
+                    stop(signal.SIGTERM, None)
+                else:
+                    LOG.error("handover_failed", pid=successor[0].pid)
+                    successor[0].kill()
+                    successor[1].close()
+                    successor = None
+                continue
+            if msg.startswith(b"!"):
+                # پیام کنترلی worker برای خود supervisor، پخش نمی‌شود
+                if msg == b"!ready":
+                    ready.add(key.data)
+                    if len(ready) == workers:
+                        LOG.info("workers_ready", workers=workers)
+                        _write_pid_file()
+                        if predecessor is not None:
+                            predecessor.sendall(b"ready")
+                            predecessor.close()
+                            predecessor = None
+                continue
+            for slot, (_, sock) in procs.items():
+                if slot != key.data:
+                    try:
+                        sock.send(msg)
+                    except OSError:
+                        pass
+
+        # جمع‌کردن workerهای خارج‌شده و زمان‌بندی راه‌اندازی دوباره
+        while procs:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            for slot, (wpid, sock) in list(procs.items()):
+                if wpid == pid:
+                    sel.unregister(sock)
+                    sock.close()
+                    del procs[slot]
+                    ready.discard(slot)
+                    if not stopping:
+                        LOG.error("worker_exited", worker=slot, pid=pid,
+                                  status=os.waitstatus_to_exitcode(status), restarting=True)
+                        restart_at[slot] = time.monotonic() + WORKER_RESTART_DELAY
+
+        if successor is not None and not stopping and time.monotonic() > successor[2]:
+            LOG.error("handover_failed", pid=successor[0].pid, reason="timeout")
+            sel.unregister(successor[1])
+            successor[0].kill()
+            successor[1].close()
+            successor = None
+
+        if not stopping:
+            now = time.monotonic()
+            for slot, when in list(restart_at.items()):
+                if when <= now:
+                    del restart_at[slot]
+                    spawn(slot)
+
+    LOG.info("supervisor_stopped")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Vending TCP server")
+    parser.add_argument("--workers", type=int, default=TCP_WORKERS,
+                        help="تعداد پروسه‌های worker روی یک پورت (SO_REUSEPORT)")
+    parser.add_argument("--engine", choices=("stream", "protocol"), default=TCP_ENGINE,
+                        help="stream: StreamReader/handle_client، protocol: asyncio.Protocol")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    options = dict(engine=args.engine, host=args.host, port=args.port)
+    if args.workers > 1:
+        supervise(args.workers, **options)
+    else:
+        try:
+            run(main(**options))
+        except asyncio.CancelledError:
+            pass
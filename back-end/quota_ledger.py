@@ -0,0 +1,166 @@
+# quota_ledger.py
+# دفتر سهمیه درون‌پروسه برای سرور TCP (main_asyncio_3.py)
+#
+# - هنگام شروع، کل TemproryData یک‌بار خوانده می‌شود (phone -> gift_number)
+# - GET و مصرف سهمیه (POST) کاملاً در حافظه و O(1) جواب داده می‌شوند
+# - تغییرات به‌صورت دسته‌ای و در پس‌زمینه (write-behind) در TemproryData نوشته می‌شوند
+#
+# نکته: دفتر فقط داخل یک پروسه معتبر است؛ مسیر HTTP هم TemproryData را تغییر می‌دهد،
+# پس نوشتن به شکل «کم‌کردن دلتا» انجام می‌شود (نه بازنویسی مقدار مطلق، home.quota.consume_gifts).
+# هر مصرف HTTP یک ردیف ChangeFeed.QUOTA می‌سازد و همان شماره در poll بعدی feed دوباره خوانده
+# می‌شود (refresh)؛ بقیه‌ی تغییرات بیرونی (ادمین) هر چند ثانیه یک‌بار بر اساس datetime_updated.
+import asyncio
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from home.models import TemproryData
+from home.quota import consume_gifts
+
+# حداکثر تعداد پارامتر در یک IN (...) برای SQLite
+_CHUNK = 500
+
+
+def _chunks(items, size=_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class QuotaLedger:
+    def __init__(self, db, log, max_gift: int, flush_interval: float = 0.5):
+        self.db = db    # DBExecutor (db_executor.py)
+        self.log = log  # StructLogger (tcp_log.py)؛ چاپ مستقیم روی event loop نه
+        self.max_gift = max_gift
+        self.flush_interval = flush_interval
+        self._gifts: dict[int, int] = {}    # phone -> gift_number (مقدار معتبر)
+        self._pending: dict[int, int] = {}  # phone -> تعداد مصرف‌های flush نشده
+        self._flushing: dict[int, int] = {}  # دسته‌ای که الان روی نویسنده‌ی DB است (هنوز commit نشده)
+        self._watermark = None              # آخرین datetime_updated دیده‌شده از DB
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    def __len__(self):
+        return len(self._gifts)
+
+    @property
+    def dirty(self) -> int:
+        return len(self._pending)
+
+    # ------------------ خواندن ------------------
+    def _load_sync(self):
+        now = timezone.now()
+        rows = TemproryData.objects.values_list('phone_number', 'gift_number').iterator(chunk_size=5000)
+        gifts = dict(rows)
+        return gifts, now
+
+    async def load(self):
+        gifts, now = await self.db.read(self._load_sync)
+        self._gifts = gifts
+        self._watermark = now
+
+    def _unflushed(self, phone: int) -> int:
+        # مصرف‌هایی که شاید هنوز در مقدار خوانده‌شده از DB نیستند. خواندن‌های refresh و sync روی
+        # همان thread نویسنده‌اند، پس نسبت به flush ها ترتیب دارند: دسته‌ای که قبل از خواندن commit
+        # شده در DB است و اگر هنوز در _flushing باشد فقط کمتر از واقعی می‌شود (هیچ‌وقت بیشتر)
+        return self._pending.get(phone, 0) + self._flushing.get(phone, 0)
+
+    def _gifts_sync(self, phones):
+        gifts = {}
+        for chunk in _chunks(phones):
+            gifts.update(
+                TemproryData.objects.filter(phone_number__in=chunk).values_list('phone_number', 'gift_number')
+            )
+        return gifts
+
+    async def refresh(self, phones):
+        """همین شماره‌ها بیرون از دفتر مصرف شده‌اند (ChangeFeed.QUOTA)؛ مقدار DB منهای مصرف‌های flush نشده."""
+        gifts = await self.db.write(self._gifts_sync, phones)
+        for phone, gift in gifts.items():
+            self._gifts[phone] = max(gift - self._unflushed(phone), 0)
+
+    def has_quota(self, phone: int) -> bool:
+        # شماره‌ای که هنوز ثبت نشده سهمیه‌ی کامل دارد
+        return self._gifts.get(phone, 1) > 0
+
+    def claim(self, phone: int) -> tuple[bool, int]:
+        """
+        همان منطق _consume_quota_atomic ولی در حافظه:
+        - شماره‌ی جدید ⇒ gift_number = MAX_GIFT - 1
+        - سهمیه > 0 ⇒ یک واحد کم می‌شود (new_value == 0 مجاز است)
+        - سهمیه <= 0 ⇒ مصرف نمی‌شود
+        برمی‌گرداند: (consumed, remaining_after)
+        """
+        current = self._gifts.get(phone)
+        if current is None:
+            current = self.max_gift
+        if current <= 0:
+            return False, current
+        current -= 1
+        self._gifts[phone] = current
+        self._pending[phone] = self._pending.get(phone, 0) + 1
+        return True, current
+
+    # ------------------ نوشتن (write-behind) ------------------
+    def _write_sync(self, batch: dict[int, int]):
+        """
+        batch: phone -> تعداد مصرف؛ در یک تراکنش، برای هر شماره یک upsert (home.quota.consume_gifts):
+        شماره‌ی جدید با MAX_GIFT - n ساخته می‌شود، موجود n واحد کم (نه زیر صفر). ردیفی که بین
+        خواندن و نوشتن از مسیر HTTP ساخته شده هم کم می‌شود.
+        """
+        with transaction.atomic():
+            consume_gifts(batch, self.max_gift)
+
+    async def flush(self):
+        batch = self._pending
+        if not batch:
+            return
+        self._pending = {}
+        self._flushing = batch
+        try:
+            await self.db.write(self._write_sync, batch)
+        except Exception:
+            # برگرداندن دسته تا در flush بعدی دوباره تلاش شود
+            for phone, n in batch.items():
+                self._pending[phone] = self._pending.get(phone, 0) + n
+            raise
+        finally:
+            self._flushing = {}
+        self.flushes += 1
+        self.flushed_rows += len(batch)
+
+    # ------------------ هم‌سان‌سازی با تغییرات بیرونی (HTTP / ادمین) ------------------
+    def _changed_since_sync(self, since):
+        now = timezone.now()
+        # کمی عقب‌تر از since تا اختلاف ساعت پروسه‌های دیگر هم پوشش داده شود
+        changed = list(
+            TemproryData.objects.filter(datetime_updated__gte=since - timedelta(seconds=2))
+            .values_list('phone_number', 'gift_number')
+        )
+        return changed, now
+
+    async def sync(self):
+        changed, now = await self.db.write(self._changed_since_sync, self._watermark)
+        # مقدار DB منهای مصرف‌هایی که هنوز flush نشده‌اند
+        for phone, gift in changed:
+            self._gifts[phone] = max(gift - self._unflushed(phone), 0)
+        self._watermark = now
+
+    async def run(self, sync_interval: float = 30.0):
+        loop = asyncio.get_running_loop()
+        next_sync = loop.time() + sync_interval
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                try:
+                    await self.flush()
+                    if loop.time() >= next_sync:
+                        next_sync = loop.time() + sync_interval
+                        await self.sync()
+                except Exception as e:
+                    self.log.error("ledger_flush_failed", pending=len(self._pending), error=str(e))
+        finally:
+            # flush آخر هنگام خاموش‌شدن
+            if self._pending:
+                await self.flush()
@@ -0,0 +1,190 @@
+# tcp_log.py
+# لاگ ساخت‌یافته‌ی غیرمسدودکننده برای سرور TCP
+#
+# print روی event loop هم زمان را با datetime قالب‌بندی می‌کند و هم مستقیم روی stdout می‌نویسد؛
+# اگر جمع‌کننده‌ی لاگ کند باشد، write مسدود می‌شود و کل سرور پشت آن می‌ایستد.
+# اینجا روی مسیر داغ فقط یک tuple ارزان (زمان، سطح، رویداد، فیلدها) در یک صف محدود گذاشته
+# می‌شود؛ قالب‌بندی (JSON یا متن) و نوشتن روی یک thread جدا انجام می‌شود. اگر صف پر باشد رکورد
+# دور ریخته و شمرده می‌شود (سرور هیچ‌وقت برای لاگ صبر نمی‌کند).
+#
+# نمونه‌برداری: برای هر سطح (info=0.1) یا هر دستور (ping=0.01) یک نرخ بین 0 و 1.
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+IRAN_TZ = timezone(timedelta(hours=3, minutes=30))
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARN': 30, 'ERROR': 40}
+
+_STOP = object()
+
+
+def parse_sample(spec: str) -> dict:
+    """"ping=0.01,get=0.1,info=1" -> {'ping': 0.01, 'get': 0.1, 'INFO': 1.0}"""
+    rates = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        key = key.strip()
+        if key.upper() in LEVELS:
+            key = key.upper()
+        rates[key] = min(1.0, max(0.0, float(value)))
+    return rates
+
+
+def _status(response) -> int | str | None:
+    if response is None:
+        return None
+    text = response.strip().decode(errors='replace')
+    return int(text) if text.isdigit() else text
+
+
+class StructLogger:
+    def __init__(self, stream=None, level: str = 'INFO', fmt: str = 'json', sample: dict | None = None,
+                 max_queue: int = 10_000, tz=IRAN_TZ):
+        self.stream = stream or sys.stdout
+        self.level = LEVELS[level.upper()]
+        self.fmt = fmt
+        self.tz = tz
+        sample = sample or {}
+        self._level_rates = {lvl: sample.get(lvl, 1.0) for lvl in LEVELS}
+        self._cmd_rates = {k: v for k, v in sample.items() if k not in LEVELS}
+        self.max_queue = max_queue
+        self.emitted = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self._start()
+        # thread بعد از fork در فرزند وجود ندارد؛ هر worker صف و thread خودش را می‌سازد.
+        # fork وسط یک write انجام نمی‌شود (قفل stream در فرزند قفل‌شده نمی‌ماند)
+        os.register_at_fork(
+            before=lambda: self._write_lock.acquire(),
+            after_in_parent=lambda: self._write_lock.release(),
+            after_in_child=self._start,
+        )
+        atexit.register(self.close)
+
+    def _start(self):
+        self._write_lock = threading.Lock()
+        self._queue = queue.Queue(self.max_queue)
+        self._reported_drops = self.dropped
+        self._thread = threading.Thread(target=self._drain, name="tcp-log", daemon=True)
+        self._thread.start()
+
+    # ------------------ مسیر داغ (event loop) ------------------
+    def _put(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def log(self, level: str, event: str, **fields):
+        lvl = LEVELS[level]
+        if lvl < self.level:
+            return
+        rate = self._level_rates[level]
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return
+        self._put((time.time(), level, event, fields))
+
+    def info(self, event: str, **fields):
+        self.log('INFO', event, **fields)
+
+    def warn(self, event: str, **fields):
+        self.log('WARN', event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log('ERROR', event, **fields)
+
+    def request(self, conn_id: int, addr, cmd: str, device, response, latency: float):
+        """
+        یک رکورد برای هر درخواست پاسخ‌داده‌شده. response همان bytes پاسخ است (None یعنی بی‌پاسخ)؛
+        تبدیل آن به status روی thread لاگ انجام می‌شود.
+        """
+        # 403/404 نتیجه‌ی عادی کسب‌وکار است؛ فقط خط خراب (400) و خطای سرور (5xx) هشدار است
+        level = 'WARN' if response is not None and (response[:3] == b"400" or response[:1] == b"5") else 'INFO'
+        if LEVELS[level] < self.level:
+            return
+        rate = self._cmd_rates.get(cmd, self._level_rates[level]) if level == 'INFO' else self._level_rates[level]
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return
+        self._put((time.time(), level, 'request', {
+            'conn': conn_id, 'addr': addr, 'device': device, 'cmd': cmd,
+            'status': response, 'latency_ms': latency * 1000,
+        }))
+
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'emitted': self.emitted,
+            'dropped': self.dropped,
+            'sampled_out': self.sampled_out,
+        }
+
+    # ------------------ thread لاگ ------------------
+    def _format(self, record) -> str:
+        t, level, event, fields = record
+        when = datetime.fromtimestamp(t, self.tz).isoformat(timespec='milliseconds')
+        if event == 'request':
+            fields['status'] = _status(fields['status'])
+            fields['latency_ms'] = round(fields['latency_ms'], 3)
+        addr = fields.get('addr')
+        if isinstance(addr, tuple):
+            fields['addr'] = f"{addr[0]}:{addr[1]}"
+        if self.fmt == 'json':
+            return json.dumps({'ts': when, 'level': level, 'event': event, **fields},
+                              ensure_ascii=False, default=str)
+        pairs = " ".join(f"{k}={v}" for k, v in fields.items() if v is not None)
+        return f"[{when}] [{level}] {event} {pairs}"
+
+    def _drain(self):
+        q = self._queue
+        while True:
+            records = [q.get()]
+            # هر چه در صف هست با یک write نوشته می‌شود
+            while len(records) < 512:
+                try:
+                    records.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            lines = []
+            for record in records:
+                if record is _STOP:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self._format(record))
+                except Exception as e:
+                    lines.append(json.dumps({'level': 'ERROR', 'event': 'log_format_failed', 'error': str(e)}))
+            if self.dropped != self._reported_drops:
+                lost, self._reported_drops = self.dropped - self._reported_drops, self.dropped
+                lines.append(self._format((time.time(), 'WARN', 'log_dropped', {'count': lost})))
+            if lines:
+                with self._write_lock:
+                    try:
+                        self.stream.write("\n".join(lines) + "\n")
+                        self.stream.flush()
+                    except (OSError, ValueError):
+                        pass
+                self.emitted += len(lines)
+            if stop:
+                return
+
+    def close(self, timeout: float = 2.0):
+        """رکوردهای باقی‌مانده را می‌نویسد (حداکثر timeout ثانیه صبر)."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
@@ -0,0 +1,217 @@
+# tcp_metrics.py
+# متریک‌های سرور TCP با قالب متنی Prometheus
+#
+# یک نسخه‌ی کوچک از counter / gauge / histogram (بدون وابستگی به prometheus_client). روی مسیر داغ
+# فقط یک جمع روی attribute انجام می‌شود؛ متن خروجی فقط هنگام scrape ساخته می‌شود.
+# متریک‌هایی که مقدارشان از جای دیگری خوانده می‌شود (آمار DBExecutor، IDLE_REAPER، لاگر)
+# با CallbackMetric هنگام scrape جمع می‌شوند.
+#
+#   curl http://127.0.0.1:9325/metrics
+import asyncio
+from bisect import bisect_left
+
+# مرز bucket ها (ثانیه)؛ از ping درون‌حافظه تا POST پشت صف DB
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _fmt_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def _fmt_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # آخری: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._children = {}
+        if not labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    # بدون برچسب: مستقیم روی خود متریک
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            yield self.name, dict(zip(self.labelnames, key)), child.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _Histogram(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += n
+                yield f"{self.name}_bucket", {**labels, "le": _fmt_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, child.sum
+            yield f"{self.name}_count", labels, child.count
+
+
+class CallbackMetric:
+    """
+    مقدار هنگام scrape از fn خوانده می‌شود. fn یک عدد، یا dict از tuple برچسب‌ها به عدد
+    برمی‌گرداند (ترتیب برچسب‌ها مثل labelnames).
+    """
+
+    def __init__(self, name: str, help: str, kind: str, fn, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+        self.labelnames = labelnames
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            yield self.name, {}, value
+            return
+        for key, v in value.items():
+            yield self.name, dict(zip(self.labelnames, key)), v
+
+
+class Registry:
+    def __init__(self, const_labels: dict | None = None):
+        self._metrics = []
+        self.const_labels = const_labels or {}
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, kind, fn, labelnames=()) -> CallbackMetric:
+        return self._add(CallbackMetric(name, help, kind, fn, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{_fmt_labels({**self.const_labels, **labels})} {_fmt_value(value)}")
+            except Exception as e:
+                lines.append(f"# {metric.name} collection failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+async def _handle_scrape(registry: Registry, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # بقیه‌ی هدرها تا خط خالی
+        while True:
+            line = await asyncio.wait_for(reader.readline(), 5)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] in (b"/metrics", b"/"):
+            body = registry.render().encode()
+            status = b"200 OK"
+        else:
+            body = b"not found\n"
+            status = b"404 Not Found"
+        writer.write(
+            b"HTTP/1.1 " + status + b"\r\n"
+            b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+            b"Connection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(registry: Registry, host: str, port: int):
+    """یک HTTP listener خیلی ساده که فقط GET /metrics را جواب می‌دهد."""
+    return await asyncio.start_server(lambda r, w: _handle_scrape(registry, r, w), host, port)
@@ -0,0 +1,3 @@
+# تست‌های ماژول‌های سرور TCP (quota_ledger.py، timing_wheel.py، ...) با test runner خود Django تا
+# DB تست جدا ساخته شود. از همین پوشه (back-end):
+#     python back/manage.py test tests -t .
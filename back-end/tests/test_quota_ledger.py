@@ -0,0 +1,121 @@
+import asyncio
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import OperationalError
+from django.test import TestCase
+from home.models import TemproryData
+from home.quota import claim_gift
+
+from quota_ledger import QuotaLedger
+
+MAX_GIFT = 2
+
+
+class InlineDB:
+    """به جای DBExecutor: همان thread تست (و تراکنش TestCase)؛ با fail=True نوشتن خطا می‌دهد."""
+
+    fail = False
+
+    async def read(self, fn, *args, **kwargs):
+        return await sync_to_async(fn)(*args, **kwargs)
+
+    async def write(self, fn, *args, **kwargs):
+        if self.fail:
+            raise OperationalError('database is locked')
+        return await sync_to_async(fn)(*args, **kwargs)
+
+
+class Log:
+    def __init__(self):
+        self.events = []
+
+    def error(self, event, **fields):
+        self.events.append(event)
+
+
+def _gifts():
+    return dict(TemproryData.objects.values_list('phone_number', 'gift_number'))
+
+
+agifts = sync_to_async(_gifts)
+aclaim_gift = sync_to_async(claim_gift)
+
+
+class QuotaLedgerTests(TestCase):
+    def setUp(self):
+        TemproryData.objects.create(phone_number=9120000061, gift_number=1)
+        TemproryData.objects.create(phone_number=9120000062, gift_number=0)
+        self.db = InlineDB()
+        self.ledger = QuotaLedger(self.db, Log(), MAX_GIFT)
+        async_to_sync(self.ledger.load)()
+
+    async def test_load_and_claim(self):
+        self.assertEqual(len(self.ledger), 2)
+        self.assertEqual(self.ledger.claim(9120000061), (True, 0))
+        self.assertEqual(self.ledger.claim(9120000061), (False, 0))
+        self.assertEqual(self.ledger.claim(9120000062), (False, 0))
+        self.assertTrue(self.ledger.has_quota(9120000063))  # شماره‌ی ثبت‌نشده
+        self.assertEqual(self.ledger.claim(9120000063), (True, MAX_GIFT - 1))
+        self.assertEqual(self.ledger.claim(9120000063), (True, 0))
+        self.assertEqual(self.ledger.claim(9120000063), (False, 0))
+        self.assertFalse(self.ledger.has_quota(9120000063))
+        self.assertEqual(self.ledger.dirty, 2)
+        self.assertEqual(await agifts(), {9120000061: 1, 9120000062: 0})  # هنوز flush نشده
+
+    async def test_flush_writes_deltas(self):
+        self.ledger.claim(9120000061)
+        self.ledger.claim(9120000063)
+        await self.ledger.flush()
+        self.assertEqual(await agifts(), {9120000061: 0, 9120000062: 0, 9120000063: MAX_GIFT - 1})
+        self.assertEqual((self.ledger.dirty, self.ledger.flushes, self.ledger.flushed_rows), (0, 1, 2))
+        await self.ledger.flush()  # چیزی برای نوشتن نیست
+        self.assertEqual(self.ledger.flushes, 1)
+
+    async def test_flush_decrements_a_row_created_over_http_meanwhile(self):
+        self.assertEqual(self.ledger.claim(9120000064), (True, MAX_GIFT - 1))
+        await aclaim_gift(9120000064)  # post/ همان شماره، قبل از flush دفتر
+        await self.ledger.flush()
+        self.assertEqual((await agifts())[9120000064], MAX_GIFT - 2)
+
+    async def test_refresh_applies_http_claims_minus_unflushed(self):
+        self.ledger.claim(9120000065)
+        await aclaim_gift(9120000065)
+        await self.ledger.refresh([9120000065])
+        # DB: MAX_GIFT - 1 از HTTP؛ منهای مصرف flush نشده‌ی دفتر
+        self.assertEqual(self.ledger.claim(9120000065), (False, 0))
+        await self.ledger.flush()
+        self.assertEqual((await agifts())[9120000065], 0)
+
+    async def test_sync_picks_up_admin_changes(self):
+        await TemproryData.objects.filter(phone_number=9120000062).aupdate(gift_number=MAX_GIFT)
+        self.ledger.claim(9120000061)
+        self.assertFalse(self.ledger.has_quota(9120000062))
+        await self.ledger.sync()
+        self.assertTrue(self.ledger.has_quota(9120000062))
+        self.assertEqual(self.ledger.claim(9120000061), (False, 0))  # مصرف flush نشده گم نمی‌شود
+
+    async def test_failed_flush_keeps_claims_for_the_next_one(self):
+        self.ledger.claim(9120000061)
+        self.ledger.claim(9120000066)
+        self.db.fail = True
+        with self.assertRaises(OperationalError):
+            await self.ledger.flush()
+        self.assertEqual(self.ledger.dirty, 2)
+        self.ledger.claim(9120000066)
+        self.db.fail = False
+        await self.ledger.flush()
+        self.assertEqual(self.ledger.dirty, 0)
+        self.assertEqual(await agifts(), {9120000061: 0, 9120000062: 0, 9120000066: 0})
+
+    async def test_run_logs_failures_and_flushes_on_shutdown(self):
+        self.ledger.flush_interval = 0.01
+        self.ledger.claim(9120000067)
+        self.db.fail = True
+        task = asyncio.ensure_future(self.ledger.run())
+        await asyncio.sleep(0.05)
+        self.assertIn('ledger_flush_failed', self.ledger.log.events)
+        self.db.fail = False
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual((await agifts())[9120000067], MAX_GIFT - 1)
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+from django.test import SimpleTestCase
+
+from timing_wheel import TimingWheel
+
+
+class Conn:
+    def __init__(self, fail=False):
+        self.closed = 0
+        self.fail = fail
+
+    def close_idle(self):
+        self.closed += 1
+        if self.fail:
+            raise ConnectionResetError
+
+
+def _tick(wheel, n=1):
+    # همان کار run برای هر tick، بدون sleep
+    for _ in range(n):
+        wheel.now += wheel.tick
+        wheel._advance()
+
+
+class TimingWheelTests(SimpleTestCase):
+    def setUp(self):
+        self.wheel = TimingWheel(timeout=5, tick=1)
+
+    def test_idle_connection_is_reaped_after_timeout(self):
+        conn = Conn()
+        self.wheel.add(conn)
+        _tick(self.wheel, 4)
+        self.assertEqual(conn.closed, 0)
+        _tick(self.wheel)
+        self.assertEqual(conn.closed, 1)
+        self.assertIsNone(conn.wheel_slot)
+        self.assertEqual(self.wheel.stats(), {'tracked': 0, 'reaped': 1, 'rescheduled': 0, 'ticks': 5})
+        _tick(self.wheel, 20)
+        self.assertEqual(conn.closed, 1)
+
+    def test_active_connection_is_rescheduled_not_reaped(self):
+        conn = Conn()
+        self.wheel.add(conn)
+        _tick(self.wheel, 3)
+        conn.last_activity = self.wheel.now  # پیام تازه: فقط last_activity عوض می‌شود
+        _tick(self.wheel, 2)
+        self.assertEqual((conn.closed, self.wheel.rescheduled), (0, 1))
+        _tick(self.wheel, 2)
+        self.assertEqual(conn.closed, 0)
+        _tick(self.wheel)
+        self.assertEqual(conn.closed, 1)  # 5 ثانیه بعد از آخرین فعالیت
+
+    def test_removed_connection_is_not_reaped(self):
+        conn = Conn()
+        self.wheel.add(conn)
+        self.wheel.remove(conn)
+        self.wheel.remove(conn)  # دوباره: بی‌اثر
+        _tick(self.wheel, 10)
+        self.assertEqual((conn.closed, self.wheel.tracked), (0, 0))
+
+    def test_close_error_does_not_stop_the_wheel(self):
+        bad, good = Conn(fail=True), Conn()
+        self.wheel.add(bad)
+        self.wheel.add(good)
+        _tick(self.wheel, 5)
+        self.assertEqual((bad.closed, good.closed, self.wheel.reaped), (1, 1, 2))
+
+    def test_timeout_not_a_multiple_of_tick(self):
+        wheel = TimingWheel(timeout=2.5, tick=1)
+        conn = Conn()
+        wheel.add(conn)
+        _tick(wheel, 2)
+        self.assertEqual(conn.closed, 0)
+        _tick(wheel)
+        self.assertEqual(conn.closed, 1)
+
+    async def test_run_catches_up_on_missed_ticks(self):
+        wheel = TimingWheel(timeout=0.05, tick=0.01)
+        task = asyncio.ensure_future(wheel.run())
+        try:
+            await asyncio.sleep(0)
+            conn = Conn()
+            wheel.add(conn)
+            time.sleep(0.1)  # loop گیر کرده؛ tick های جامانده یک‌جا پردازش می‌شوند
+            await asyncio.sleep(0.03)
+            self.assertEqual(conn.closed, 1)
+            self.assertGreaterEqual(wheel.ticks, 10)
+        finally:
+            task.cancel()
@@ -0,0 +1,85 @@
+# timing_wheel.py
+# جمع‌کننده‌ی کانکشن‌های بیکار با یک hashed timing wheel
+#
+# به‌جای asyncio.wait_for روی هر readline (ساختن و لغو یک تایمر برای هر پیام)، هر کانکشن فقط
+# last_activity خودش را با wheel.now به‌روز می‌کند (بدون هیچ عملیاتی روی wheel). یک تسک واحد هر
+# tick ثانیه یک خانه جلو می‌رود؛ کانکشن‌های آن خانه اگر واقعاً بیکار بوده‌اند بسته می‌شوند و
+# وگرنه در خانه‌ی مهلت جدیدشان گذاشته می‌شوند (جابه‌جایی تنبل). هزینه‌ی نگه‌داشتن ده‌ها هزار
+# کانکشن بیکار تقریباً صفر است.
+#
+# هر کانکشن باید این‌ها را داشته باشد: last_activity، wheel_slot و متد close_idle().
+import asyncio
+import math
+
+
+class TimingWheel:
+    def __init__(self, timeout: float, tick: float = 1.0):
+        self.timeout = timeout
+        self.tick = tick
+        self._slots = [set() for _ in range(int(math.ceil(timeout / tick)) + 1)]
+        self._cursor = 0
+        self.now = 0.0      # زمان loop در آخرین tick (برای last_activity کافی است)
+        self.tracked = 0
+        self.reaped = 0
+        self.rescheduled = 0
+        self.ticks = 0
+
+    def _slot_for(self, deadline: float) -> int:
+        ahead = max(1, int(math.ceil((deadline - self.now) / self.tick)))
+        return (self._cursor + min(ahead, len(self._slots) - 1)) % len(self._slots)
+
+    def add(self, conn):
+        conn.last_activity = self.now
+        conn.wheel_slot = self._slot_for(self.now + self.timeout)
+        self._slots[conn.wheel_slot].add(conn)
+        self.tracked += 1
+
+    def remove(self, conn):
+        slot = getattr(conn, 'wheel_slot', None)
+        if slot is not None:
+            self._slots[slot].discard(conn)
+            conn.wheel_slot = None
+            self.tracked -= 1
+
+    def _advance(self):
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        self.ticks += 1
+        bucket = self._slots[self._cursor]
+        if not bucket:
+            return
+        self._slots[self._cursor] = set()
+        for conn in bucket:
+            deadline = conn.last_activity + self.timeout
+            if deadline <= self.now:
+                conn.wheel_slot = None
+                self.tracked -= 1
+                self.reaped += 1
+                try:
+                    conn.close_idle()
+                except Exception:
+                    pass
+            else:
+                conn.wheel_slot = self._slot_for(deadline)
+                self._slots[conn.wheel_slot].add(conn)
+                self.rescheduled += 1
+
+    def stats(self) -> dict:
+        return {
+            'tracked': self.tracked,
+            'reaped': self.reaped,
+            'rescheduled': self.rescheduled,
+            'ticks': self.ticks,
+        }
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.now = loop.time()
+        while True:
+            await asyncio.sleep(self.tick)
+            now = loop.time()
+            # اگر loop عقب افتاده باشد، همه‌ی tick های جامانده پردازش می‌شوند
+            steps = max(1, int((now - self.now) / self.tick))
+            for _ in range(steps):
+                self.now += self.tick
+                self._advance()
+            self.now = now
@@ -0,0 +1,83 @@
+# traffic_capture.py
+# ضبط ترافیک ورودی سرور TCP در یک فایل باینری فشرده (برای bench/replay.py)
+#
+# قالب فایل: MAGIC و بعد پشت سر هم رکوردهای
+#     struct "<dIH"  = (زمان time.monotonic، شناسه‌ی کانکشن، طول خط)  +  بایت‌های خط
+# طول 0 یعنی کانکشن بسته شد (خط خالی هیچ‌وقت ضبط نمی‌شود). باز شدن کانکشن همان اولین خط آن است.
+# CLOCK_MONOTONIC بین پروسه‌ها مشترک است، پس فایل‌های worker های مختلف قابل ادغام‌اند.
+#
+# روی مسیر داغ فقط به یک bytearray اضافه می‌شود؛ نوشتن روی دیسک هر flush_interval ثانیه در یک
+# thread انجام می‌شود. اگر دیسک عقب بماند و بافر از max_buffer بگذرد، رکوردها دور ریخته و شمرده
+# می‌شوند (سرور برای ضبط صبر نمی‌کند).
+import asyncio
+import struct
+import time
+
+MAGIC = b"VCAP1\n"
+RECORD = struct.Struct("<dIH")
+MAX_LINE = 0xFFFF
+
+
+class CaptureWriter:
+    def __init__(self, path: str, flush_interval: float = 0.2, max_buffer: int = 8 * 1024 * 1024):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._buf = bytearray()
+        self.records = 0
+        self.dropped = 0
+
+    def record(self, conn_id: int, line: bytes):
+        if len(self._buf) > self.max_buffer:
+            self.dropped += 1
+            return
+        line = line[:MAX_LINE]
+        self._buf += RECORD.pack(time.monotonic(), conn_id & 0xFFFFFFFF, len(line))
+        self._buf += line
+        self.records += 1
+
+    def record_close(self, conn_id: int):
+        self.record(conn_id, b"")
+
+    def _swap(self) -> bytes:
+        chunk, self._buf = bytes(self._buf), bytearray()
+        return chunk
+
+    def _write(self, chunk: bytes):
+        self._file.write(chunk)
+        self._file.flush()
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                if self._buf:
+                    await asyncio.to_thread(self._write, self._swap())
+        finally:
+            self.close()
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._buf:
+            self._write(self._swap())
+        self._file.close()
+
+
+def read_capture(path: str):
+    """رکوردها را به ترتیب فایل برمی‌گرداند: (زمان، شناسه‌ی کانکشن، خط) و برای بسته‌شدن خط = None."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a capture file")
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            t, conn_id, length = RECORD.unpack(head)
+            line = f.read(length) if length else None
+            if length and len(line) < length:
+                return  # رکورد نیمه‌کاره در انتهای فایل (سرور وسط نوشتن متوقف شده)
+            yield t, conn_id, line